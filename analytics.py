@@ -0,0 +1,481 @@
+"""KPI and insight rules for the FBA dashboard — plain pandas, no Streamlit.
+
+Every function takes prepared DataFrames (analytics_data / the dashboard loaders) and returns
+numbers or insight dicts {'emoji', 'title', 'text', 'color'}; dashboard.py only renders them.
+The same rules run in bulk from the command line:
+
+    python analytics.py --url postgresql://... [--days 7,30,90] [--store "My Store"] [--json out.json]
+"""
+import argparse
+import datetime as dt
+import json
+import os
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+GOOD, WARN, BAD, INFO = "#0d2b1e", "#2b2400", "#2b0d0d", "#1a1a2e"
+
+
+def insight(emoji, title, text, color=INFO):
+    return {"emoji": emoji, "title": title, "text": text, "color": color}
+
+
+def recent(df, col, days):
+    """Rows within `days` of the newest `col` value; the whole frame if that window is empty."""
+    if df.empty or days is None:
+        return df
+    out = df[df[col] >= df[col].max() - dt.timedelta(days=days)]
+    return out if not out.empty else df
+
+
+# ---- Sales & Traffic ----
+
+def asin_stats(df):
+    """Per-ASIN sessions / units / revenue / Buy Box with conversion %."""
+    asin_col = 'child_asin' if 'child_asin' in df.columns else df.columns[0]
+    agg = {'sessions': 'sum', 'page_views': 'sum', 'units_ordered': 'sum',
+           'ordered_product_sales': 'sum', 'buy_box_percentage': 'mean'}
+    agg = {c: f for c, f in agg.items() if c in df.columns}
+    names = {'sessions': 'Sessions', 'page_views': 'Page Views', 'units_ordered': 'Units',
+             'ordered_product_sales': 'Revenue', 'buy_box_percentage': 'Buy Box %'}
+    out = df.groupby(asin_col).agg(agg).reset_index()
+    out.columns = ['ASIN'] + [names[c] for c in agg]
+    out['Conv %'] = (out['Units'] / out['Sessions'] * 100).fillna(0)
+    return out
+
+
+def sales_traffic_kpis(df):
+    sessions = int(df['sessions'].sum())
+    units    = int(df['units_ordered'].sum())
+    revenue  = float(df['ordered_product_sales'].sum())
+    mob      = df['mobile_sessions'].sum() if 'mobile_sessions' in df.columns else 0
+    bro      = df['browser_sessions'].sum() if 'browser_sessions' in df.columns else 0
+    return {
+        "sessions":            sessions,
+        "units":               units,
+        "revenue":             revenue,
+        "conversion_pct":      units / sessions * 100 if sessions > 0 else 0,
+        "buy_box_pct":         float(df['buy_box_percentage'].mean()),
+        "mobile_pct":          float(mob / (mob + bro) * 100) if (mob + bro) > 0 else 0,
+        "revenue_per_session": revenue / sessions if sessions > 0 else 0,
+    }
+
+
+def sales_traffic_insights(df, stats=None):
+    stats = asin_stats(df) if stats is None else stats
+    k = sales_traffic_kpis(df)
+    avg_conv, avg_buy_box, mobile_pct = k["conversion_pct"], k["buy_box_pct"], k["mobile_pct"]
+    rev_per_sess, total_revenue = k["revenue_per_session"], k["revenue"]
+    low_conv = stats[(stats['Sessions'] > stats['Sessions'].median()) & (stats['Conv %'] < stats['Conv %'].median())]
+    low_bb   = stats[stats['Buy Box %'] < 80]
+    out = []
+    if avg_conv >= 12:   out.append(insight("🟢", "Конверсия", f"Конверсия <b>{avg_conv:.1f}%</b> — выше нормы. Масштабируй рекламу!", GOOD))
+    elif avg_conv >= 8:  out.append(insight("🟡", "Конверсия", f"Конверсия <b>{avg_conv:.1f}%</b> — в норме. Потенциал через A+.", WARN))
+    else:                out.append(insight("🔴", "Конверсия", f"Конверсия <b>{avg_conv:.1f}%</b> — ниже нормы. Проверь фото и цену.", BAD))
+    if avg_buy_box >= 95:   out.append(insight("🟢", "Buy Box", f"Buy Box <b>{avg_buy_box:.1f}%</b> — отлично!", GOOD))
+    elif avg_buy_box >= 80: out.append(insight("🟡", "Buy Box", f"Buy Box <b>{avg_buy_box:.1f}%</b> — норма. {len(low_bb)} ASINов теряют.", WARN))
+    else:                   out.append(insight("🔴", "Buy Box", f"Buy Box <b>{avg_buy_box:.1f}%</b> — критично! Проверь репрайсер.", BAD))
+    out.append(insight("📱", "Мобайл", f"<b>{mobile_pct:.0f}%</b> мобильного трафика {'— норма.' if mobile_pct >= 60 else '— ниже среднего ~65%.'}"))
+    if len(low_conv) > 0:
+        top = low_conv.nlargest(1, 'Sessions').iloc[0]
+        out.append(insight("🔴", "Упущенная выручка", f"<b>{len(low_conv)} ASINов</b> с высоким трафиком и низкой конверсией. Критичный: <b>{top['ASIN']}</b>.", BAD))
+    else:
+        out.append(insight("🟢", "Упущенная выручка", "Все ASINы с высоким трафиком конвертят хорошо!", GOOD))
+    out.append(insight("💡", "Цена сессии", f"Каждая сессия → <b>${rev_per_sess:.2f}</b>. +1000 сессий = +${rev_per_sess*1000:,.0f}."))
+    if not stats.empty:
+        top = stats.nlargest(1, 'Revenue').iloc[0]
+        top_pct = top['Revenue'] / total_revenue * 100 if total_revenue > 0 else 0
+        out.append(insight("🏆", "Главный ASIN", f"<b>{top['ASIN']}</b> = ${top['Revenue']:,.0f} ({top_pct:.0f}%).", "#1a2b1e"))
+    return out
+
+
+# ---- Settlements ----
+
+def settlement_kpis(df):
+    amount, kind = df['Amount'], df['Transaction Type']
+    net     = float(amount.sum())
+    gross   = float(amount[(kind == 'Order') & (amount > 0)].sum())
+    fees    = float(amount[(amount < 0) & (kind != 'Refund') & (~kind.str.lower().str.contains('other', na=False))].sum())
+    refunds = float(amount[kind == 'Refund'].sum())
+    return {
+        "net": net, "gross": gross, "fees": fees, "refunds": refunds,
+        "fee_pct":    abs(fees) / gross * 100 if gross > 0 else 0,
+        "refund_pct": abs(refunds) / gross * 100 if gross > 0 else 0,
+        "margin_pct": net / gross * 100 if gross > 0 else 0,
+    }
+
+
+def settlements_insights(df):
+    k = settlement_kpis(df)
+    margin_pct, fee_pct, refund_pct = k["margin_pct"], k["fee_pct"], k["refund_pct"]
+    out = []
+    if margin_pct >= 30:   out.append(insight("🟢", "Чистая маржа", f"Маржа <b>{margin_pct:.1f}%</b> — отлично!", GOOD))
+    elif margin_pct >= 15: out.append(insight("🟡", "Чистая маржа", f"Маржа <b>{margin_pct:.1f}%</b> — норма для FBA.", WARN))
+    else:                  out.append(insight("🔴", "Чистая маржа", f"Маржа <b>{margin_pct:.1f}%</b> — низко! Анализируй расходы.", BAD))
+    if fee_pct <= 30:   out.append(insight("🟢", "Нагрузка комиссий", f"Комиссии <b>{fee_pct:.1f}%</b> — в норме.", GOOD))
+    elif fee_pct <= 40: out.append(insight("🟡", "Нагрузка комиссий", f"Комиссии <b>{fee_pct:.1f}%</b> — немного высоко.", WARN))
+    else:               out.append(insight("🔴", "Нагрузка комиссий", f"Комиссии <b>{fee_pct:.1f}%</b> — слишком высоко!", BAD))
+    if refund_pct <= 3:   out.append(insight("🟢", "Возвраты", f"Возвраты <b>{refund_pct:.1f}%</b> — отлично.", GOOD))
+    elif refund_pct <= 8: out.append(insight("🟡", "Возвраты", f"Возвраты <b>{refund_pct:.1f}%</b> — умеренно.", WARN))
+    else:                 out.append(insight("🔴", "Возвраты", f"Возвраты <b>{refund_pct:.1f}%</b> — критично!", BAD))
+    out.append(insight("💰", "Итог", f"Продажи <b>${k['gross']:,.0f}</b> → на руки <b>${k['net']:,.0f}</b>. Комиссии: ${abs(k['fees']):,.0f}."))
+    return out
+
+
+# ---- Returns ----
+
+def return_values(df, sku_prices=None):
+    """Copy of df with numeric Price / Quantity and Return Value = Price × Quantity.
+
+    Rows without a Price column are priced from sku_prices (mean order price per SKU), else 0.
+    """
+    df = df.copy()
+    if 'Price' not in df.columns:
+        df['Price'] = df['SKU'].map(sku_prices).fillna(0) if sku_prices is not None and not sku_prices.empty else 0
+    df['Price']        = pd.to_numeric(df['Price'], errors='coerce').fillna(0)
+    df['Quantity']     = pd.to_numeric(df['Quantity'], errors='coerce').fillna(1) if 'Quantity' in df.columns else 1
+    df['Return Value'] = df['Price'] * df['Quantity']
+    return df
+
+
+def return_rate(df, order_count):
+    """Returned orders as % of order_count (distinct Order IDs)."""
+    returned = df['Order ID'].nunique() if 'Order ID' in df.columns else 0
+    return returned / order_count * 100 if order_count > 0 else 0
+
+
+def returns_kpis(df, order_count=0):
+    return {
+        "returns":    len(df),
+        "skus":       int(df['SKU'].nunique()),
+        "rate_pct":   return_rate(df, order_count),
+        "value":      float(df['Return Value'].sum()),
+        "avg_value":  float(df['Return Value'].mean()) if len(df) else 0,
+    }
+
+
+def returns_insights(df, rate):
+    total_val  = df['Return Value'].sum()
+    top_reason = df['Reason'].value_counts().index[0] if 'Reason' in df.columns and not df.empty else None
+    top_sku    = df['SKU'].value_counts() if not df.empty else None
+    out = []
+    if rate <= 3:   out.append(insight("🟢", "Уровень возвратов", f"Возвраты <b>{rate:.1f}%</b> — отлично.", GOOD))
+    elif rate <= 8: out.append(insight("🟡", "Уровень возвратов", f"Возвраты <b>{rate:.1f}%</b> — приемлемо.", WARN))
+    else:           out.append(insight("🔴", "Уровень возвратов", f"Возвраты <b>{rate:.1f}%</b> — опасно!", BAD))
+    out.append(insight("💸", "Ущерб", f"Возвраты стоят <b>${total_val:,.0f}</b>.", "#2b1a00"))
+    if top_reason:
+        out.append(insight("🔍", "Главная причина", f"<b>«{top_reason}»</b>"))
+    if top_sku is not None and not top_sku.empty:
+        out.append(insight("⚠️", "Проблемный SKU", f"<b>{top_sku.index[0]}</b> ({top_sku.iloc[0]} возвратов).", BAD))
+    return out
+
+
+# ---- Inventory ----
+
+def inventory_kpis(df):
+    units   = float(df['Available'].sum())
+    avg_vel = float(df['Velocity'].mean()) if 'Velocity' in df.columns else 0
+    return {
+        "stock_value":  float(df['Stock Value'].sum()),
+        "units":        units,
+        "avg_velocity": avg_vel,
+        "days_of_cover": int(units / (avg_vel * 30) * 30) if avg_vel > 0 else 999,
+        "dead_skus":    int((df['Velocity'] == 0).sum()) if 'Velocity' in df.columns else 0,
+    }
+
+
+def inventory_insights(df):
+    k = inventory_kpis(df)
+    total_val, total_units, avg_vel, days = k["stock_value"], k["units"], k["avg_velocity"], k["days_of_cover"]
+    top_frozen = df.nlargest(1, 'Stock Value').iloc[0] if not df.empty else None
+    dead_stock = df[df['Velocity'] == 0] if 'Velocity' in df.columns else pd.DataFrame()
+    months = int(total_units / avg_vel / 30) if avg_vel > 0 else 0
+    out = [insight("🧊", "Заморозка капитала", f"Заморожено <b>${total_val:,.0f}</b>. Запас на {months if avg_vel > 0 else '∞'} мес.")]
+    if top_frozen is not None:
+        pct = top_frozen['Stock Value'] / total_val * 100 if total_val > 0 else 0
+        out.append(insight("🏦", "Главный актив", f"<b>{top_frozen['SKU']}</b> держит ${top_frozen['Stock Value']:,.0f} ({pct:.0f}%).", "#1a2b1e"))
+    if len(dead_stock) > 0:
+        dead_val = dead_stock['Stock Value'].sum()
+        out.append(insight("☠️", "Мёртвый сток", f"<b>{len(dead_stock)} SKU</b> без продаж — ${dead_val:,.0f}. Рассмотри ликвидацию.", BAD))
+    if days <= 30:   out.append(insight("🔴", "Оборачиваемость", f"Запасов на <b>{days} дней</b> — риск out of stock!", BAD))
+    elif days <= 60: out.append(insight("🟡", "Оборачиваемость", f"Запасов на <b>{days} дней</b> — планируй поставку.", WARN))
+    else:            out.append(insight("🟢", "Оборачиваемость", f"Запасов на <b>{days} дней</b> — достаточно.", GOOD))
+    return out
+
+
+# ---- Orders ----
+
+def orders_kpis(df):
+    revenue = float(df['Total Price'].sum())
+    orders  = int(df['Order ID'].nunique())
+    days    = max((df['Order Date'].max() - df['Order Date'].min()).days, 1) if len(df) else 1
+    return {
+        "orders":          orders,
+        "revenue":         revenue,
+        "items":           int(df['Quantity'].sum()) if 'Quantity' in df.columns else 0,
+        "avg_order":       revenue / orders if orders > 0 else 0,
+        "revenue_per_day": revenue / days,
+    }
+
+
+def orders_insights(df):
+    k = orders_kpis(df)
+    total_rev, rev_per_day = k["revenue"], k["revenue_per_day"]
+    top_sku = df.groupby('SKU')['Total Price'].sum().nlargest(1)
+    out = [
+        insight("🛒", "Средний чек", f"<b>${k['avg_order']:.2f}</b>. +10% к AOV = +${total_rev*0.1:,.0f}."),
+        insight("📈", "Дневная выручка", f"<b>${rev_per_day:,.0f}/день</b>. Прогноз на месяц: ${rev_per_day*30:,.0f}.", "#1a2b1e"),
+    ]
+    if not top_sku.empty:
+        sku_name, sku_rev = top_sku.index[0], top_sku.iloc[0]
+        pct = sku_rev / total_rev * 100 if total_rev > 0 else 0
+        out.append(insight("⚡", "Концентрация риска", f"<b>{sku_name}</b> = {pct:.0f}% (${sku_rev:,.0f}). Диверсифицируй.", "#2b1a00"))
+    return out
+
+
+# ---- Reviews ----
+# Reviews are summarized once into a rating cube — one row per (asin, domain, month) with a star
+# histogram s0..s5 (0 = unrated) and verified counts v0..v5 — and every reviews KPI, chart and
+# insight rolls up from it, so a filter change costs O(groups) instead of O(reviews).
+STAR_RANGE = range(6)
+
+
+def rating_cube(df):
+    """(asin, domain, month) × star histogram of a prepared reviews frame, plus n/sum/neg/pos/verified."""
+    dims = [c for c in ('asin', 'domain') if c in df.columns]
+    keys = {c: df[c].astype(object) for c in dims}
+    if 'review_date' in df.columns:
+        d = df['review_date']
+        if isinstance(d.dtype, pd.DatetimeTZDtype):
+            d = d.dt.tz_localize(None)
+        keys['month'] = d.to_numpy().astype('datetime64[M]').astype('datetime64[ns]')
+    r = df['rating'].to_numpy()
+    cols = {f"s{k}": (r == k).astype('int32') for k in STAR_RANGE}
+    if 'is_verified' in df.columns:
+        v = df['is_verified'].fillna(False).to_numpy(dtype=bool)
+        cols.update({f"v{k}": ((r == k) & v).astype('int32') for k in STAR_RANGE})
+    flat = pd.DataFrame({**keys, **cols}, index=df.index)
+    if keys:
+        cube = flat.groupby(list(keys), dropna=False, sort=True).sum().reset_index()
+    else:
+        cube = flat.sum().to_frame().T
+    return _cube_totals(cube)
+
+
+def _cube_totals(cube):
+    s = cube[[f"s{k}" for k in STAR_RANGE]].to_numpy()
+    cube['n']   = s.sum(axis=1)
+    cube['sum'] = s @ np.arange(6)
+    cube['neg'] = s[:, :3].sum(axis=1)
+    cube['pos'] = s[:, 4:].sum(axis=1)
+    if 'v0' in cube.columns:
+        cube['verified'] = cube[[f"v{k}" for k in STAR_RANGE]].sum(axis=1)
+    return cube
+
+
+def cube_filter(cube, domains=None, asins=None, stars=None):
+    """Cube rows for the selected domains / ASINs; with stars, only those star buckets count."""
+    if domains and 'domain' in cube.columns:
+        cube = cube[cube['domain'].isin(domains)]
+    if asins is not None and 'asin' in cube.columns:
+        cube = cube[cube['asin'].isin(asins)]
+    if stars:
+        cube = cube.copy()
+        for k in STAR_RANGE:
+            if k not in stars:
+                cube[f"s{k}"] = 0
+                if f"v{k}" in cube.columns:
+                    cube[f"v{k}"] = 0
+        cube = _cube_totals(cube)
+        cube = cube[cube['n'] > 0]
+    return cube
+
+
+def cube_stats(cube, by):
+    """Reviews / Rating / Neg / Pos / Neg % / Pos % (and Verified %) per `by` from the cube."""
+    by  = [by] if isinstance(by, str) else list(by)
+    num = ['n', 'sum', 'neg', 'pos'] + (['verified'] if 'verified' in cube.columns else []) + [f"s{k}" for k in STAR_RANGE]
+    g = cube.groupby(by, sort=True)[num].sum().reset_index()
+    g = g[g['n'] > 0]
+    out = g[by].copy()
+    out['Reviews'] = g['n']
+    out['Rating']  = g['sum'] / g['n']
+    out['Neg']     = g['neg']
+    out['Pos']     = g['pos']
+    out['Neg %']   = (g['neg'] / g['n'] * 100).round(1)
+    out['Pos %']   = (g['pos'] / g['n'] * 100).round(1)
+    if 'verified' in g.columns:
+        out['Verified %'] = g['verified'] / g['n'] * 100
+    for k in STAR_RANGE:
+        out[f"s{k}"] = g[f"s{k}"]
+    return out.reset_index(drop=True)
+
+
+def cube_totals(cube):
+    """Whole-cube totals: reviews, avg rating, neg/pos counts, verified % (None without the column), stars."""
+    n = int(cube['n'].sum())
+    return {
+        "reviews":      n,
+        "avg_rating":   float(cube['sum'].sum() / n) if n else 0,
+        "neg":          int(cube['neg'].sum()),
+        "pos":          int(cube['pos'].sum()),
+        "verified_pct": float(cube['verified'].sum() / n * 100) if n and 'verified' in cube.columns else None,
+        "stars":        {k: int(cube[f"s{k}"].sum()) for k in STAR_RANGE},
+        "asins":        int(cube.loc[cube['n'] > 0, 'asin'].nunique()) if 'asin' in cube.columns else 0,
+    }
+
+
+def reviews_kpis(cube):
+    t = cube_totals(cube)
+    n = t["reviews"]
+    return {
+        "reviews":      n,
+        "avg_rating":   t["avg_rating"],
+        "neg_pct":      t["neg"] / n * 100 if n else 0,
+        "pos_pct":      t["pos"] / n * 100 if n else 0,
+        "verified_pct": t["verified_pct"],
+    }
+
+
+def topic_summary(topics, domains=None, asin=None, stars=None):
+    """Complaint topics (complaint_topics.py output) for the current filters → label / reviews / share %."""
+    if topics is None or topics.empty:
+        return pd.DataFrame(columns=['topic_id', 'label', 'terms', 'reviews', 'share'])
+    if domains:
+        topics = topics[topics['domain'].isin(domains)]
+    if asin:
+        topics = topics[topics['asin'] == asin]
+    if stars:
+        topics = topics[topics['rating'].isin(stars)]
+    out = topics.groupby(['topic_id', 'label', 'terms'], as_index=False)['reviews'].sum()
+    out = out[out['reviews'] > 0].sort_values('reviews', ascending=False, ignore_index=True)
+    out['share'] = out['reviews'] / out['reviews'].sum() * 100 if len(out) else 0.0
+    return out
+
+
+def reviews_insights(cube, asin=None, topics=None):
+    """Rating / negativity / loyalty cards from a rating cube; [] when there are no reviews.
+
+    topics: topic_summary() for the same filters — adds the most common complaint.
+    """
+    k = reviews_kpis(cube)
+    if not k["reviews"]:
+        return []
+    avg_rating, neg_pct, pos_pct, ver_pct = k["avg_rating"], k["neg_pct"], k["pos_pct"], k["verified_pct"]
+    out = []
+    if avg_rating >= 4.4:   out.append(insight("🟢", "Здоровье рейтинга", f"Средний балл <b>{avg_rating:.1f}★</b> — отлично! Сильное социальное доверие.", GOOD))
+    elif avg_rating >= 4.0: out.append(insight("🟡", "Здоровье рейтинга", f"Средний балл <b>{avg_rating:.1f}★</b> — норма, риск упасть ниже 4.0.", WARN))
+    else:                   out.append(insight("🔴", "Здоровье рейтинга", f"Средний балл <b>{avg_rating:.1f}★</b> — критично! Режет конверсию и удорожает PPC.", BAD))
+    if neg_pct <= 10:   out.append(insight("🟢", "Уровень негатива", f"Всего <b>{neg_pct:.1f}%</b> негативных (1-2★). Продукт оправдывает ожидания.", GOOD))
+    elif neg_pct <= 20: out.append(insight("🟡", "Уровень негатива", f"<b>{neg_pct:.1f}%</b> негативных — системная проблема. Читай тексты 1★.", WARN))
+    else:               out.append(insight("🔴", "Уровень негатива", f"<b>{neg_pct:.1f}%</b> негативных — критично! Срочно фикси продукт или листинг.", BAD))
+    out.append(insight("💚", "Лояльность", f"<b>{pos_pct:.1f}%</b> позитивных (4-5★). База лояльных покупателей.", GOOD if pos_pct >= 70 else WARN))
+    if ver_pct is not None:
+        out.append(insight("✅", "Верификация", f"<b>{ver_pct:.1f}%</b> верифицированы {'— высокое доверие у Amazon.' if ver_pct >= 80 else '— следи за политикой.'}"))
+    if asin is None and 'asin' in cube.columns:
+        worst = cube_stats(cube, 'asin')
+        worst = worst[worst['Neg'] > 0]
+        if not worst.empty:
+            top = worst.loc[worst['Neg'].idxmax()]
+            out.append(insight("⚠️", "Токсичный ASIN", f"<b>{top['asin']}</b> — {int(top['Neg'])} негативных. Начни анализ с него.", BAD))
+    if topics is not None and not topics.empty:
+        top = topics.iloc[0]
+        out.append(insight("🧩", "Главная жалоба", f"<b>«{top['label']}»</b> — {top['share']:.0f}% жалоб (1-3★), {int(top['reviews'])} отзывов.", WARN))
+    return out
+
+
+# ============================================
+# BULK CLI
+# ============================================
+
+def _store(df, store):
+    if store is None or df.empty:
+        return df
+    return df[df['Store Name'] == store] if 'Store Name' in df.columns else df.iloc[:0]
+
+
+def period_report(frames, days, store=None, order_count=None):
+    """{module: {'kpis', 'insights'}} for one store and the last `days` days of each dataset.
+
+    frames: prepared 'inventory', 'settlements', 'sales_traffic', 'orders', 'returns' (with Return
+    Value), 'reviews'. Datasets without a Store Name column are skipped for a specific store.
+    order_count: orders behind the return rate; defaults to the distinct Order IDs in the
+    same window of `orders`.
+    """
+    date_cols = {"settlements": 'Posted Date', "sales_traffic": 'report_date', "orders": 'Order Date',
+                 "returns": 'Return Date', "reviews": 'review_date'}
+    win = {name: recent(_store(frames.get(name, pd.DataFrame()), store), col, days)
+           for name, col in date_cols.items()}
+    inv = _store(frames.get("inventory", pd.DataFrame()), store)
+    out = {}
+    if not inv.empty:
+        out["inventory"] = {"kpis": inventory_kpis(inv), "insights": inventory_insights(inv)}
+    if not win["settlements"].empty:
+        out["settlements"] = {"kpis": settlement_kpis(win["settlements"]), "insights": settlements_insights(win["settlements"])}
+    if not win["sales_traffic"].empty:
+        out["sales_traffic"] = {"kpis": sales_traffic_kpis(win["sales_traffic"]), "insights": sales_traffic_insights(win["sales_traffic"])}
+    if not win["orders"].empty:
+        out["orders"] = {"kpis": orders_kpis(win["orders"]), "insights": orders_insights(win["orders"])}
+    if not win["returns"].empty:
+        if order_count is None:
+            order_count = win["orders"]['Order ID'].nunique() if 'Order ID' in win["orders"].columns else 0
+        k = returns_kpis(win["returns"], order_count)
+        out["returns"] = {"kpis": k, "insights": returns_insights(win["returns"], k["rate_pct"])}
+    if not win["reviews"].empty:
+        cube = rating_cube(win["reviews"])
+        out["reviews"] = {"kpis": reviews_kpis(cube), "insights": reviews_insights(cube)}
+    return out
+
+
+def _load_frames(url):
+    """Prepared frames straight from Postgres via analytics_data — no Streamlit involved."""
+    import analytics_data
+    frames  = analytics_data.load_frames(analytics_data.engine(url))
+    prices  = frames.pop("sku_prices")
+    returns = frames["returns"]
+    frames["returns"] = return_values(returns, prices) if not returns.empty else returns
+    return frames
+
+
+def _stores(frames):
+    names = set()
+    for df in frames.values():
+        if 'Store Name' in df.columns:
+            names.update(df['Store Name'].dropna().astype(str).unique())
+    return sorted(names)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Compute dashboard KPIs and insights for every store and period.")
+    ap.add_argument("--url", default=os.getenv("DATABASE_URL"), help="database URL (or DATABASE_URL)")
+    ap.add_argument("--days", default="7,30,90", help="comma-separated trailing windows in days")
+    ap.add_argument("--store", action="append", help="limit to this store (repeatable); default: all + each store")
+    ap.add_argument("--json", help="write {store: {days: report}} to this file")
+    args = ap.parse_args(argv)
+    if not args.url:
+        ap.error("--url or DATABASE_URL is required")
+
+    frames  = _load_frames(args.url)
+    periods = [int(x) for x in args.days.split(",") if x.strip()]
+    stores  = args.store or ["All"] + _stores(frames)
+    report  = {}
+    for store in stores:
+        for days in periods:
+            r = period_report(frames, days, None if store == "All" else store)
+            report.setdefault(store, {})[str(days)] = r
+            for module, res in r.items():
+                for card in res["insights"]:
+                    text = re.sub(r"<[^>]+>", "", card["text"])
+                    print(f"{store[:20]:<20} {days:>4}d  {module:<14} {card['emoji']} {card['title']}: {text}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"at": dt.datetime.now().strftime("%Y-%m-%dT%H:%M:%S"), "report": report},
+                      f, indent=2, ensure_ascii=False, default=lambda v: v.item() if hasattr(v, "item") else str(v))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
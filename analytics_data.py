@@ -0,0 +1,384 @@
+"""SQL reads and frame preparation for the FBA datasets — plain pandas/SQLAlchemy, no Streamlit.
+
+Readers take an open connection (a SQLAlchemy Connection, or a raw DBAPI connection for the
+streaming sales_traffic fetch) and return raw frames; prepare_* types them and compact_frame()
+applies the per-dataset dtype schema. Pooling, caching and incremental refresh live in
+dashboard.py; analytics.py and the benchmarks use load_frames() / the readers directly.
+"""
+import datetime as dt
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+_log = logging.getLogger("fba.data")
+
+# Numeric schema for sales_traffic, applied while decoding each fetched chunk
+SALES_TRAFFIC_SCHEMA = {
+    'sessions': 'int64', 'page_views': 'int64', 'units_ordered': 'int64', 'units_ordered_b2b': 'int64',
+    'total_order_items': 'int64', 'total_order_items_b2b': 'int64',
+    'ordered_product_sales': 'float64', 'ordered_product_sales_b2b': 'float64',
+    'session_percentage': 'float64', 'page_views_percentage': 'float64',
+    'buy_box_percentage': 'float64', 'unit_session_percentage': 'float64',
+    'mobile_sessions': 'int64', 'mobile_page_views': 'int64',
+    'browser_sessions': 'int64', 'browser_page_views': 'int64',
+    'mobile_session_percentage': 'float64', 'mobile_page_views_percentage': 'float64',
+    'mobile_unit_session_percentage': 'float64', 'mobile_buy_box_percentage': 'float64',
+    'browser_session_percentage': 'float64', 'browser_page_views_percentage': 'float64',
+    'browser_unit_session_percentage': 'float64', 'browser_buy_box_percentage': 'float64',
+}
+ST_FETCH_CHUNK = int(os.getenv("ST_FETCH_CHUNK", "20000"))
+
+
+# ---- Compact dtypes ----
+# Low-cardinality labels → category, remaining text → Arrow-backed strings, counts → smallest int,
+# percentages → float32. Money columns stay float64 so sums keep cent precision.
+COMPACT_DTYPES = os.getenv("COMPACT_DTYPES", "1").lower() not in ("0", "false", "no")
+
+_ST_COUNTS = [c for c, t in SALES_TRAFFIC_SCHEMA.items() if t == 'int64']
+_ST_PCTS   = [c for c in SALES_TRAFFIC_SCHEMA if c.endswith('_percentage')]
+_AGE_COLS  = ['Upto 90 Days', '91 to 180 Days', '181 to 270 Days', '271 to 365 Days', 'More than 365 Days']
+
+DATASET_DTYPES = {
+    "inventory":     {"int": ['Available', 'Velocity'] + _AGE_COLS},
+    "orders":        {"category": ['Order Status', 'Currency'], "int": ['Quantity']},
+    "settlements":   {"category": ['Transaction Type', 'Currency'], "int": ['Quantity']},
+    "returns":       {"int": ['Quantity']},
+    "reviews":       {"int": ['rating']},
+    "sales_traffic": {"int": _ST_COUNTS, "float32": _ST_PCTS},
+}
+
+
+def _arrow_string_dtype():
+    """Arrow-backed string dtype with NaN (not pd.NA) semantics, so masks stay plain bool."""
+    for make in (lambda: pd.StringDtype("pyarrow", na_value=np.nan),   # pandas ≥ 2.3
+                 lambda: pd.StringDtype("pyarrow_numpy")):            # pandas 2.1–2.2
+        try:
+            return make()
+        except (TypeError, ValueError, ImportError):
+            continue
+    return None
+
+
+STRING_DTYPE = _arrow_string_dtype()
+
+
+def compact_frame(df, name):
+    if not COMPACT_DTYPES or df.empty:
+        return df
+    spec = DATASET_DTYPES.get(name, {})
+    for c in spec.get("category", []):
+        if c in df.columns:
+            df[c] = df[c].astype('category')
+    for c in spec.get("int", []):
+        if c in df.columns and pd.api.types.is_numeric_dtype(df[c]):
+            df[c] = pd.to_numeric(df[c], downcast='integer')
+    for c in spec.get("float32", []):
+        if c in df.columns and pd.api.types.is_float_dtype(df[c]):
+            df[c] = df[c].astype(np.float32)
+    if STRING_DTYPE is not None:
+        for c in df.columns:
+            if df[c].dtype == object and pd.api.types.infer_dtype(df[c], skipna=True) == 'string':
+                df[c] = df[c].astype(STRING_DTYPE)
+    return df
+
+
+def concat_frames(new, old):
+    """pd.concat that keeps category columns categorical (union of both category sets)."""
+    for c in old.columns:
+        if isinstance(old[c].dtype, pd.CategoricalDtype) and c in new.columns:
+            cats  = old[c].cat.categories.union(pd.Index(new[c].dropna().unique()))
+            dtype = pd.CategoricalDtype(cats)
+            old, new = old.astype({c: dtype}), new.astype({c: dtype})
+    return pd.concat([new, old], ignore_index=True)
+
+
+# ---- Connections ----
+def engine(url, **kwargs):
+    """SQLAlchemy engine with the dashboard's search_path (spapi first)."""
+    if url and url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    return create_engine(url, connect_args={"options": "-csearch_path=spapi,public"}, **kwargs)
+
+
+def table_columns(conn, table):
+    return list(pd.read_sql(text(f"SELECT * FROM {table} LIMIT 0"), conn).columns)
+
+
+def read_table(conn, table, order_col, since=None, since_expr=None):
+    """SELECT * FROM table [WHERE since_expr >= :since] ORDER BY order_col DESC."""
+    sql, params = f"SELECT * FROM {table}", {}
+    if since is not None:
+        sql += f" WHERE {since_expr or order_col} >= :since"
+        params['since'] = since.to_pydatetime()
+    sql += f" ORDER BY {order_col} DESC"
+    return pd.read_sql(text(sql), conn, params=params)
+
+
+# ---- Inventory ----
+def prepare_inventory(df):
+    for col in ['Available','Price','Velocity','Stock Value']:
+        if col not in df.columns: df[col] = 0
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    df['Stock Value'] = df['Available'] * df['Price']
+    df['created_at']  = pd.to_datetime(df['created_at'])
+    df['date']        = df['created_at'].dt.date
+    return df
+
+
+def read_inventory_dates(conn, limit=None):
+    """Available snapshot dates, newest first — no snapshot rows leave Postgres."""
+    sql = "SELECT DISTINCT created_at::date AS date FROM fba_inventory ORDER BY date DESC"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    df = pd.read_sql(text(sql), conn)
+    return [d for d in pd.to_datetime(df['date']).dt.date if pd.notna(d)]
+
+
+def read_inventory_stores(conn):
+    df = pd.read_sql(text('SELECT DISTINCT "Store Name" FROM fba_inventory WHERE "Store Name" IS NOT NULL ORDER BY 1'), conn)
+    return df['Store Name'].tolist()
+
+
+def read_inventory(conn, snapshot_date=None, store=None):
+    """FBA inventory rows for one snapshot day and (optionally) one store, filtered in SQL."""
+    where, params = [], {}
+    if snapshot_date is not None:
+        where.append("created_at >= :d0 AND created_at < :d1")
+        params['d0'] = snapshot_date
+        params['d1'] = snapshot_date + dt.timedelta(days=1)
+    if store is not None:
+        where.append('"Store Name" = :store')
+        params['store'] = store
+    sql = "SELECT * FROM fba_inventory"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY created_at DESC"
+    return pd.read_sql(text(sql), conn, params=params)
+
+
+def prepare_inventory_history(df):
+    df['Available']  = pd.to_numeric(df['Available'], errors='coerce').fillna(0)
+    df['created_at'] = pd.to_datetime(df['created_at'])
+    return df
+
+
+def read_inventory_history(conn, since=None):
+    """Narrow created_at/SKU/Available rows across all snapshots (AI forecast)."""
+    sql, params = 'SELECT created_at, "SKU", "Available" FROM fba_inventory', {}
+    if since is not None:
+        sql += " WHERE created_at >= :since"
+        params['since'] = since.to_pydatetime()
+    return pd.read_sql(text(sql + " ORDER BY created_at"), conn, params=params)
+
+
+# ---- Orders / settlements / returns / reviews ----
+def prepare_orders(df):
+    df['Order Date'] = pd.to_datetime(df['Order Date'], dayfirst=False, errors='coerce')
+    column_mappings = {
+        'Quantity':       ['Quantity', 'quantity', 'qty'],
+        'Item Price':     ['Item Price', 'item-price', 'item_price', 'price'],
+        'Item Tax':       ['Item Tax', 'item-tax', 'item_tax', 'tax'],
+        'Shipping Price': ['Shipping Price', 'shipping-price', 'shipping_price', 'shipping'],
+    }
+    for target_col, possible_names in column_mappings.items():
+        found = False
+        for col_name in possible_names:
+            if col_name in df.columns:
+                df[target_col] = pd.to_numeric(df[col_name], errors='coerce').fillna(0)
+                found = True
+                break
+        if not found:
+            df[target_col] = 0
+    df['Total Price'] = df['Item Price'] * df['Quantity']
+    return df
+
+
+def prepare_settlements(df):
+    df['Amount']      = pd.to_numeric(df['Amount'], errors='coerce').fillna(0.0)
+    df['Quantity']    = pd.to_numeric(df['Quantity'], errors='coerce').fillna(0)
+    df['Posted Date'] = pd.to_datetime(df['Posted Date'], dayfirst=False, errors='coerce')
+    if 'Currency' not in df.columns:
+        df['Currency'] = 'USD'
+    df = df.dropna(subset=['Posted Date'])
+    return df
+
+
+def prepare_returns(df):
+    df['Return Date'] = pd.to_datetime(df['Return Date'], errors='coerce')
+    return df
+
+
+def prepare_reviews(df):
+    df['review_date'] = pd.to_datetime(df['review_date'], errors='coerce')
+    df['rating']      = pd.to_numeric(df['rating'], errors='coerce').fillna(0).astype(int)
+    if 'is_verified' in df.columns:
+        df['is_verified'] = df['is_verified'].astype(bool)
+    # Normalize domain to lowercase
+    if 'domain' in df.columns:
+        df['domain'] = df['domain'].str.lower().str.strip()
+    return df
+
+
+# ---- Sales & Traffic (streamed) ----
+def _decode_numeric(values, dtype):
+    """One chunk of a numeric column → typed NumPy array (NULL/garbage → 0, like to_numeric+fillna)."""
+    try:
+        arr = np.array(values, dtype=np.float64)          # None → nan
+    except (TypeError, ValueError):
+        arr = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=np.float64)
+    arr = np.nan_to_num(arr, nan=0.0, posinf=0.0, neginf=0.0)
+    return arr.astype(dtype, copy=False)
+
+
+def fetch_sales_traffic(conn, since=None, chunk_size=None, on_sql=None):
+    """Stream sales_traffic through a server-side cursor, chunk by chunk, into typed columns.
+
+    conn is a raw psycopg2 connection. NUMERIC values are cast to float by psycopg2 itself (no
+    Decimal objects), and each chunk is transposed straight into NumPy buffers, so at most one
+    chunk of Python row tuples is alive. on_sql(sql, seconds, rows) is called when it finishes.
+    """
+    import psycopg2.extensions as pgext
+    chunk_size = chunk_size or ST_FETCH_CHUNK
+    sql, params = "SELECT * FROM spapi.sales_traffic", {}
+    if since is not None:
+        sql += " WHERE COALESCE(report_date, created_at::date) >= %(since)s"
+        params['since'] = since.to_pydatetime()
+    sql += " ORDER BY report_date DESC"
+    dec2float = pgext.new_type(pgext.DECIMAL.values, 'ST_DEC2FLOAT',
+                               lambda v, cur: float(v) if v is not None else None)
+    cur = conn.cursor(name=f"st_stream_{threading.get_ident()}_{time.monotonic_ns()}")
+    cur.itersize = chunk_size
+    pgext.register_type(dec2float, cur)
+    t0 = time.perf_counter()
+    try:
+        cur.execute(sql, params)
+        columns, parts = None, {}
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if columns is None:
+                columns = [d[0] for d in cur.description]
+                parts   = {c: [] for c in columns}
+            if not rows:
+                break
+            for name, values in zip(columns, zip(*rows)):
+                dtype = SALES_TRAFFIC_SCHEMA.get(name)
+                parts[name].append(_decode_numeric(values, dtype) if dtype
+                                   else np.array(values, dtype=object))
+            del rows
+    finally:
+        if on_sql is not None:
+            on_sql(sql, time.perf_counter() - t0, cur.rownumber)
+        cur.close()
+        conn.commit()   # named cursors live in a transaction; don't hand it back open
+    if not columns or not parts[columns[0]]:
+        return pd.DataFrame()
+    return pd.DataFrame({c: np.concatenate(parts[c]) for c in columns}, columns=columns)
+
+
+def prepare_sales_traffic(df):
+    for col, dtype in SALES_TRAFFIC_SCHEMA.items():
+        if col in df.columns and df[col].dtype != dtype:
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    df['report_date'] = pd.to_datetime(df['report_date'], errors='coerce')
+    if 'created_at' in df.columns:
+        created = pd.to_datetime(df['created_at'], errors='coerce').dt.normalize()
+        if df['report_date'].isna().all():
+            df['report_date'] = created
+        elif df['report_date'].isna().any():
+            mask = df['report_date'].isna()
+            df.loc[mask, 'report_date'] = created[mask]
+    df['report_date'] = df['report_date'].dt.normalize()
+    df = df.dropna(subset=['report_date'])
+    return df
+
+
+# ---- Orders aggregates for the returns page (no raw orders over the wire) ----
+ORDER_PRICE_COLS = ['Item Price', 'item-price', 'item_price', 'price', 'Price']
+ORDER_ID_COLS    = ['Order ID', 'order-id', 'order_id', 'OrderID']
+NUMERIC_RE       = r'^\s*[-+]?[0-9]*\.?[0-9]+([eE][-+]?[0-9]+)?\s*$'
+
+
+def first_col(columns, candidates):
+    return next((c for c in candidates if c in columns), None)
+
+
+def orders_where(columns, start=None, end=None, store=None):
+    where, params = [], {}
+    if start is not None and 'Order Date' in columns:
+        where.append('"Order Date" >= :start'); params['start'] = start
+    if end is not None and 'Order Date' in columns:
+        where.append('"Order Date" < :end'); params['end'] = end + dt.timedelta(days=1)
+    if store is not None and 'Store Name' in columns:
+        where.append('"Store Name" = :store'); params['store'] = store
+    return where, params
+
+
+def read_order_sku_prices(conn, start=None, end=None, store=None, columns=None):
+    """Mean item price per SKU computed in Postgres → Series indexed by SKU."""
+    columns   = columns if columns is not None else table_columns(conn, "orders")
+    price_col = first_col(columns, ORDER_PRICE_COLS)
+    if price_col is None or 'SKU' not in columns:
+        return pd.Series(dtype=float)
+    where, params = orders_where(columns, start, end, store)
+    # non-numeric strings → NULL, same as pd.to_numeric(errors='coerce')
+    price = f"""CASE WHEN "{price_col}"::text ~ '{NUMERIC_RE}' THEN "{price_col}"::text::numeric END"""
+    sql = f'SELECT "SKU", AVG({price}) AS price FROM orders WHERE "SKU" IS NOT NULL'
+    if where:
+        sql += " AND " + " AND ".join(where)
+    sql += ' GROUP BY "SKU"'
+    df = pd.read_sql(text(sql), conn, params=params)
+    return pd.to_numeric(df.set_index('SKU')['price'], errors='coerce')
+
+
+def read_order_count(conn, start=None, end=None, store=None, columns=None):
+    """COUNT(DISTINCT order id) in Postgres, optionally per order-date range and store."""
+    columns = columns if columns is not None else table_columns(conn, "orders")
+    id_col  = first_col(columns, ORDER_ID_COLS)
+    if id_col is None:
+        return 0
+    where, params = orders_where(columns, start, end, store)
+    sql = f'SELECT COUNT(DISTINCT "{id_col}") FROM orders'
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return int(conn.execute(text(sql), params).scalar() or 0)
+
+
+# ---- Headless loading ----
+def load_frames(eng):
+    """Prepared, compacted frames for every dataset (newest inventory day only) plus 'sku_prices'
+    for return values. Each read gets its own connection; a dataset that fails comes back empty."""
+    def read(name, fn, empty=pd.DataFrame):
+        try:
+            with eng.connect() as conn:
+                return fn(conn)
+        except Exception:
+            _log.warning("%s: load failed", name, exc_info=True)
+            return empty()
+
+    def sales_traffic(_):
+        raw = eng.raw_connection()
+        try:
+            return fetch_sales_traffic(raw)
+        finally:
+            raw.close()
+
+    dates = read("inventory", lambda c: read_inventory_dates(c, limit=1), list)
+    jobs = {
+        "inventory":     (lambda c: read_inventory(c, dates[0]) if dates else pd.DataFrame(), prepare_inventory),
+        "orders":        (lambda c: read_table(c, "orders", '"Order Date"'), prepare_orders),
+        "settlements":   (lambda c: read_table(c, "settlements", '"Posted Date"'), prepare_settlements),
+        "returns":       (lambda c: read_table(c, "returns", '"Return Date"'), prepare_returns),
+        "reviews":       (lambda c: read_table(c, "amazon_reviews", "review_date"), prepare_reviews),
+        "sales_traffic": (sales_traffic, prepare_sales_traffic),
+    }
+    frames = {}
+    for name, (fetch, prepare) in jobs.items():
+        raw = read(name, fetch)
+        frames[name] = compact_frame(prepare(raw), name) if not raw.empty else raw
+    frames["sku_prices"] = read("orders", read_order_sku_prices, lambda: pd.Series(dtype=float))
+    return frames
@@ -0,0 +1,105 @@
+"""Memory and groupby timing of loader frames with and without the compact dtype schema.
+
+    python benchmarks/compact_dtypes.py [--repeat 5]
+
+For each dataset the raw table is read from DATABASE_URL once, run through its
+analytics_data.prepare_* function (object strings, int64/float64), then through compact_frame(). Both frames are
+measured with memory_usage(deep=True), and the groupbys the report pages run are timed on each.
+"""
+import argparse
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import analytics_data as ad  # noqa: E402
+
+load_dotenv()
+ENGINE = ad.engine(os.getenv("DATABASE_URL"))
+
+
+def _read(fn, *args):
+    def fetch():
+        with ENGINE.connect() as conn:
+            return fn(conn, *args)
+    return fetch
+
+
+def _fetch_sales_traffic():
+    conn = ENGINE.raw_connection()
+    try:
+        return ad.fetch_sales_traffic(conn)
+    finally:
+        conn.close()
+
+
+# dataset -> (fetch raw, prepare, {label: groupby workload})
+DATASETS = {
+    "inventory": (_read(ad.read_inventory), ad.prepare_inventory, {
+        "treemap (Store Name, SKU)": lambda df: df.groupby(['Store Name', 'SKU'], observed=True)['Stock Value'].sum(),
+        "per-SKU Available":         lambda df: df.groupby('SKU', observed=True)['Available'].sum(),
+    }),
+    "orders": (_read(ad.read_table, "orders", '"Order Date"'), ad.prepare_orders, {
+        "top SKU revenue": lambda df: df.groupby('SKU', observed=True)['Total Price'].sum().nlargest(10),
+        "order status":    lambda df: df['Order Status'].value_counts(),
+        "daily revenue":   lambda df: df.groupby(df['Order Date'].dt.date)['Total Price'].sum(),
+    }),
+    "settlements": (_read(ad.read_table, "settlements", '"Posted Date"'), ad.prepare_settlements, {
+        "fee breakdown": lambda df: df[df['Amount'] < 0].groupby('Transaction Type', observed=True)['Amount'].sum(),
+        "per currency":  lambda df: df.groupby('Currency', observed=True)['Amount'].sum(),
+    }),
+    "reviews": (_read(ad.read_table, "amazon_reviews", "review_date"), ad.prepare_reviews, {
+        "asin x domain": lambda df: df.groupby(['asin', 'domain'], observed=True)['rating'].agg(['count', 'mean']),
+        "per domain":    lambda df: df.groupby('domain', observed=True)['rating'].mean(),
+    }),
+    "sales_traffic": (_fetch_sales_traffic, ad.prepare_sales_traffic, {
+        "per ASIN": lambda df: df.groupby('child_asin', observed=True).agg(
+            {'sessions': 'sum', 'units_ordered': 'sum', 'ordered_product_sales': 'sum', 'buy_box_percentage': 'mean'}),
+    }),
+}
+
+
+def best_of(fn, df, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(df)
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--only", nargs="*", choices=list(DATASETS), help="subset of datasets")
+    args = ap.parse_args()
+
+    print(f"{'dataset':<14} {'rows':>9} {'before MB':>10} {'after MB':>9} {'saved':>6}")
+    timings = []
+    for name in args.only or DATASETS:
+        fetch, prepare, workloads = DATASETS[name]
+        try:
+            raw = fetch()
+        except Exception as e:
+            print(f"{name:<14} skipped: {e}")
+            continue
+        if raw.empty:
+            print(f"{name:<14} {'empty':>9}")
+            continue
+        before = prepare(raw.copy())
+        after  = ad.compact_frame(before.copy(), name)
+        mb_b = before.memory_usage(deep=True).sum() / 2**20
+        mb_a = after.memory_usage(deep=True).sum() / 2**20
+        print(f"{name:<14} {len(before):>9,} {mb_b:>10.1f} {mb_a:>9.1f} {1 - mb_a / mb_b:>6.0%}")
+        for label, fn in workloads.items():
+            timings.append((name, label, best_of(fn, before, args.repeat), best_of(fn, after, args.repeat)))
+
+    print(f"\n{'dataset':<14} {'groupby':<26} {'before ms':>10} {'after ms':>9} {'speedup':>8}")
+    for name, label, tb, ta in timings:
+        print(f"{name:<14} {label:<26} {tb * 1000:>10.2f} {ta * 1000:>9.2f} {tb / ta:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Time / peak memory of every loader and report page against a (synthetic) database.
+
+    python benchmarks/report_pages.py --url postgresql://localhost/fba_bench [--generate 1M [--replace]]
+                                      [--repeat 3] [--json out.json] [--compare baseline.json]
+
+Stages:
+  load:<dataset>  cold loader call (Streamlit caches and the dataset store cleared first)
+  page:<name>     the show_* function's compute phase with warm loaders, run in Streamlit
+                  bare mode — pandas/NumPy work and figure building, no browser rendering
+
+Wall time is the best of --repeat plain runs; peak memory comes from one extra run under
+tracemalloc. --json writes the results; --compare prints the ratio against an earlier run
+and flags stages more than --threshold slower.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import streamlit.config
+import streamlit.logger
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _args():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--url", default=os.getenv("BENCH_DATABASE_URL"), help="scratch database (or BENCH_DATABASE_URL)")
+    ap.add_argument("--generate", metavar="ROWS", help="(re)create the synthetic tables first, e.g. 10k, 1M, 10M")
+    ap.add_argument("--replace", action="store_true", help="with --generate: drop existing spapi tables first")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--only", help="comma-separated substrings; run matching stages only")
+    ap.add_argument("--json", help="write results to this file")
+    ap.add_argument("--compare", help="earlier --json output to diff against")
+    ap.add_argument("--threshold", type=float, default=1.2, help="slowdown ratio flagged as a regression")
+    args = ap.parse_args()
+    if not args.url:
+        ap.error("--url or BENCH_DATABASE_URL is required")
+    return args
+
+
+def measure(fn, repeat, reset=None):
+    """(best seconds, peak bytes) of fn(); reset() runs before every call (untimed).
+
+    Without reset the stage is meant to be warm, so one untimed call fills the caches first.
+    """
+    if reset is None:
+        fn()
+    times = []
+    for _ in range(repeat):
+        if reset: reset()
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    if reset: reset()
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak
+
+
+def stages(d):
+    """[(stage, fn, reset)] — loaders cold, pages warm."""
+    t = d.translations["EN"]
+
+    def cold(name):
+        def reset():
+            d.invalidate_dataset(name)
+            store = d.get_dataset_store()
+            store["frames"].pop(name, None)
+            store["probes"].pop(name, None)
+        return reset
+
+    loads = [
+        ("load:inventory",     lambda: d.load_data(d.load_inventory_dates()[0]), cold("inventory")),
+        ("load:inventory_history", d.load_inventory_history,                     cold("inventory")),
+        ("load:orders",        d.load_orders,        cold("orders")),
+        ("load:settlements",   d.load_settlements,   cold("settlements")),
+        ("load:sales_traffic", d.load_sales_traffic, cold("sales_traffic")),
+        ("load:returns",       d.load_returns,       cold("returns")),
+        ("load:reviews",       d.load_reviews,       cold("reviews")),
+    ]
+    inv  = lambda: d.load_data(d.load_inventory_dates()[0])
+    date = lambda: d.load_inventory_dates()[0]
+    pages = [
+        ("page:overview",          lambda: d.show_overview(inv(), t, date())),
+        ("page:sales_traffic",     lambda: d.show_sales_traffic(t)),
+        ("page:settlements",       lambda: d.show_settlements(t)),
+        ("page:inventory_finance", lambda: d.show_inventory_finance(inv(), t)),
+        ("page:orders",            d.show_orders),
+        ("page:returns",           d.show_returns),
+        ("page:reviews",           lambda: d.show_reviews(t)),
+        ("page:aging",             lambda: d.show_aging(inv(), t)),
+        ("page:ai_forecast",       lambda: d.show_ai_forecast(d.load_inventory_history(), t)),
+        ("page:ai_portfolio",      lambda: d.show_ai_forecast_portfolio(d.load_inventory_history(), t, 30)),
+        ("page:data_table",        lambda: d.show_data_table(inv(), t, date())),
+    ]
+    return loads + [(n, f, None) for n, f in pages]
+
+
+def main():
+    args = _args()
+    if args.generate:
+        import synthetic_data
+        synthetic_data.load_postgres(synthetic_data.generate(synthetic_data.parse_rows(args.generate)),
+                                     args.url, replace=args.replace)
+
+    os.environ["DATABASE_URL"] = args.url
+    os.environ["SNAPSHOT_DIR"] = ""          # measure Postgres, not warm Parquet snapshots
+    streamlit.config.get_option("logger.level")   # parse config now, or it resets the level later
+    streamlit.logger.set_log_level("error")        # silence bare-mode ScriptRunContext warnings
+    import dashboard as d
+
+    only    = [s for s in (args.only or "").split(",") if s]
+    results = {}
+    print(f"{'stage':<26} {'best s':>9} {'peak MB':>9}")
+    for name, fn, reset in stages(d):
+        if only and not any(o in name for o in only):
+            continue
+        try:
+            secs, peak = measure(fn, args.repeat, reset)
+        except Exception as e:
+            print(f"{name:<26} FAILED: {e}")
+            continue
+        results[name] = {"seconds": round(secs, 4), "peak_mb": round(peak / 2**20, 1)}
+        print(f"{name:<26} {secs:>9.3f} {peak / 2**20:>9.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"url": args.url.rsplit("@", 1)[-1], "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "results": results}, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            base = json.load(f)["results"]
+        print(f"\n{'stage':<26} {'base s':>9} {'now s':>9} {'ratio':>7}")
+        for name, r in results.items():
+            if name not in base or not base[name]["seconds"]:
+                continue
+            ratio = r["seconds"] / base[name]["seconds"]
+            flag  = "  ⚠ regression" if ratio > args.threshold else ""
+            print(f"{name:<26} {base[name]['seconds']:>9.3f} {r['seconds']:>9.3f} {ratio:>6.2f}x{flag}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Time / peak-memory comparison of the sales_traffic fetch paths.
+
+    python benchmarks/sales_traffic_fetch.py [--repeat 3] [--chunk 20000]
+
+legacy    — DictCursor + fetchall() + per-column pd.to_numeric (the old load_sales_traffic)
+streaming — server-side cursor, fetchmany() chunks decoded into typed NumPy columns
+
+Runs against DATABASE_URL (spapi.sales_traffic). Wall time is the best of --repeat plain runs;
+peak memory comes from one extra run under tracemalloc (which also sees NumPy buffers).
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import analytics_data as ad  # noqa: E402
+
+load_dotenv()
+ENGINE = ad.engine(os.getenv("DATABASE_URL"))
+
+
+def legacy_fetch():
+    import psycopg2.extras
+    conn = ENGINE.raw_connection()
+    try:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        cur.execute("SELECT * FROM spapi.sales_traffic ORDER BY report_date DESC")
+        rows    = cur.fetchall()
+        columns = [desc[0] for desc in cur.description]
+        cur.close()
+    finally:
+        conn.close()
+    df = pd.DataFrame(rows, columns=columns)
+    for col in ad.SALES_TRAFFIC_SCHEMA:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    return ad.prepare_sales_traffic(df)
+
+
+def streaming_fetch(chunk):
+    conn = ENGINE.raw_connection()
+    try:
+        return ad.prepare_sales_traffic(ad.fetch_sales_traffic(conn, chunk_size=chunk))
+    finally:
+        conn.close()
+
+
+def measure(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    df = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak, df
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--chunk", type=int, default=ad.ST_FETCH_CHUNK)
+    args = ap.parse_args()
+
+    results = {
+        "legacy":    measure(legacy_fetch, args.repeat),
+        "streaming": measure(lambda: streaming_fetch(args.chunk), args.repeat),
+    }
+    print(f"{'path':<10} {'rows':>10} {'best s':>9} {'peak MB':>9} {'frame MB':>9}")
+    for name, (secs, peak, df) in results.items():
+        frame_mb = df.memory_usage(deep=True).sum() / 2**20
+        print(f"{name:<10} {len(df):>10,} {secs:>9.3f} {peak / 2**20:>9.1f} {frame_mb:>9.1f}")
+    (lt, lp, _), (st_, sp, _) = results["legacy"], results["streaming"]
+    print(f"\nstreaming vs legacy: {lt / st_:.2f}x faster, {lp / sp:.2f}x lower peak memory")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""Synthetic spapi tables at a configurable scale, loaded into a scratch Postgres.
+
+    python benchmarks/synthetic_data.py --url postgresql://localhost/fba_bench --rows 1M [--replace]
+
+--rows sets the size of orders and settlements (10k, 250k, 1M, 10M ...). The other tables
+scale from it: amazon_reviews rows/2, returns rows/50, fba_inventory SKUs×90 daily snapshots,
+sales_traffic ASINs×365 days. Data is generated column-wise with NumPy (seeded) and
+streamed in with COPY, so 10M rows is a few minutes rather than hours.
+
+The dashboard reads the `spapi` schema, so point --url at a database you can throw away:
+existing tables are only dropped with --replace.
+"""
+import argparse
+import datetime as dt
+import io
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+TABLES     = ["fba_inventory", "orders", "settlements", "returns", "amazon_reviews", "sales_traffic"]
+STORES     = ["Main Store", "EU Store", "CA Store"]
+CURRENCIES = ["USD", "CAD", "EUR", "GBP"]
+DOMAINS    = ["com", "ca", "de", "co.uk", "it", "es", "fr", "co.jp"]
+START      = pd.Timestamp("2024-01-01")
+COPY_CHUNK = 200_000
+
+_WORDS = ("zipper broke quality great size small large color faded love perfect cheap strap "
+          "leak fits returned stitching comfortable sturdy flimsy recommend waste smell battery "
+          "arrived damaged gift daughter waterproof pocket heavy light price value").split()
+_ATTRS = {"Size": ["XS", "S", "M", "L", "XL"], "Color": ["Black", "Red", "Blue", "Green", "Beige"],
+          "Style": ["Classic", "Zip", "Mini"]}
+
+
+def parse_rows(s):
+    """'10k' / '1M' / '2.5m' / '500000' → int."""
+    s = str(s).strip().lower().replace("_", "")
+    mult = {"k": 1_000, "m": 1_000_000}.get(s[-1:], 1)
+    return int(float(s[:-1] if mult > 1 else s) * mult)
+
+
+def table_sizes(rows):
+    skus  = int(np.clip(rows // 1000, 50, 20_000))
+    asins = max(20, skus // 2)
+    return {
+        "skus": skus, "asins": asins, "inventory_days": 90, "traffic_days": 365,
+        "orders": rows, "settlements": rows, "amazon_reviews": max(rows // 2, 100), "returns": max(rows // 50, 20),
+    }
+
+
+def _dates(rng, n, days):
+    """n timestamps over `days`, denser towards the end (growing business)."""
+    u = rng.random(n) ** 0.7
+    return START + pd.to_timedelta((u * days * 86400).astype(np.int64), unit="s")
+
+
+def _texts(rng, pool, k):
+    return np.array([" ".join(rng.choice(_WORDS, k)) for _ in range(pool)], dtype=object)
+
+
+def gen_inventory(rng, z):
+    skus, days = z["skus"], z["inventory_days"]
+    sku   = np.tile(np.arange(skus), days)
+    day   = np.repeat(np.arange(days), skus)
+    price = np.round(rng.lognormal(3.0, 0.5, skus), 2)
+    rate  = rng.gamma(1.5, 3.0, skus)
+    start = rng.integers(50, 2000, skus)
+    cycle = rng.integers(20, 60, skus)
+    avail = np.maximum(0, start[sku] - rate[sku] * (day % cycle[sku]) + rng.normal(0, 3, len(sku))).astype(np.int64)
+    df = pd.DataFrame({
+        "created_at":   START + pd.to_timedelta(day, unit="D") + pd.Timedelta(hours=6),
+        "SKU":          np.char.add("SKU-", np.char.zfill(sku.astype(str), 5)),
+        "Product Name": np.char.add("Product ", sku.astype(str)),
+        "Store Name":   np.array(STORES)[sku % len(STORES)],
+        "Available":    avail,
+        "Price":        price[sku],
+        "Velocity":     np.round(rate[sku]).astype(np.int64),
+    })
+    df["Stock Value"] = np.round(df["Available"] * df["Price"], 2)
+    ages = rng.dirichlet([8, 4, 2, 1, 1], len(df))
+    for i, c in enumerate(["Upto 90 Days", "91 to 180 Days", "181 to 270 Days", "271 to 365 Days", "More than 365 Days"]):
+        df[c] = np.floor(ages[:, i] * avail).astype(np.int64)
+    return df
+
+
+def gen_orders(rng, z):
+    n, skus = z["orders"], z["skus"]
+    sku   = np.minimum(rng.zipf(1.3, n) - 1, skus - 1)   # a few SKUs sell most
+    price = np.round(rng.lognormal(3.0, 0.5, skus), 2)
+    oid   = np.cumsum(rng.random(n) < 0.8)                # ~1.25 items per order
+    return pd.DataFrame({
+        "Order ID":     np.char.add("114-", np.char.zfill(oid.astype(str), 9)),
+        "Order Date":   _dates(rng, n, 365).sort_values().to_numpy(),
+        "SKU":          np.char.add("SKU-", np.char.zfill(sku.astype(str), 5)),
+        "Quantity":     rng.choice([1, 1, 1, 2, 3], n),
+        "Item Price":   np.round(price[sku] * rng.uniform(0.9, 1.1, n), 2),
+        "Order Status": rng.choice(["Shipped", "Shipped", "Shipped", "Pending", "Cancelled"], n),
+        "Currency":     rng.choice(CURRENCIES, n, p=[0.7, 0.1, 0.15, 0.05]),
+        "Store Name":   rng.choice(STORES, n),
+    })
+
+
+def gen_settlements(rng, z):
+    n     = z["settlements"]
+    ttype = rng.choice(["Order", "Refund", "FBA Fee", "Commission", "Storage Fee", "Other"], n,
+                       p=[0.45, 0.05, 0.2, 0.2, 0.05, 0.05])
+    amt   = np.round(rng.lognormal(3.0, 0.7, n), 2)
+    amt   = np.where(ttype == "Order", amt, -amt * np.where(ttype == "Refund", 1.0, 0.15))
+    return pd.DataFrame({
+        "Posted Date":      _dates(rng, n, 365),
+        "Transaction Type": ttype,
+        "Order ID":         np.char.add("114-", np.char.zfill(rng.integers(0, n, n).astype(str), 9)),
+        "Amount":           np.round(amt, 2),
+        "Quantity":         rng.choice([0, 1, 1, 2], n),
+        "Currency":         rng.choice(CURRENCIES, n, p=[0.7, 0.1, 0.15, 0.05]),
+        "Description":      np.char.add("txn ", ttype.astype(str)),
+    })
+
+
+def gen_returns(rng, z, orders):
+    n   = z["returns"]
+    idx = rng.integers(0, len(orders), n)
+    src = orders.iloc[idx]
+    return pd.DataFrame({
+        "Order ID":    src["Order ID"].to_numpy(),
+        "Return Date": src["Order Date"].to_numpy() + pd.to_timedelta(rng.integers(1, 30, n), unit="D").to_numpy(),
+        "SKU":         src["SKU"].to_numpy(),
+        "Quantity":    np.ones(n, dtype=np.int64),
+        "Reason":      rng.choice(["DEFECTIVE", "NOT_AS_DESCRIBED", "WRONG_SIZE", "UNWANTED_ITEM", "DAMAGED"], n),
+        "Status":      rng.choice(["Unit returned to inventory", "Reimbursed", "Pending"], n),
+        "Store Name":  src["Store Name"].to_numpy(),
+    })
+
+
+def gen_reviews(rng, z):
+    n       = z["amazon_reviews"]
+    rating  = rng.choice([1, 2, 3, 4, 5], n, p=[0.08, 0.06, 0.1, 0.2, 0.56])
+    titles  = _texts(rng, 2000, 3)
+    bodies  = _texts(rng, 20000, 25)
+    attrs   = np.array([f"Size: {s}, Color: {c}" + (f", Style: {y}" if i % 3 == 0 else "")
+                        for i, (s, c, y) in enumerate(zip(rng.choice(_ATTRS["Size"], 300), rng.choice(_ATTRS["Color"], 300),
+                                                          rng.choice(_ATTRS["Style"], 300)))], dtype=object)
+    asin = np.minimum(rng.zipf(1.2, n) - 1, z["asins"] - 1)
+    return pd.DataFrame({
+        "review_id":          np.char.add("R", np.char.zfill(np.arange(n).astype(str), 10)),
+        "asin":               np.char.add("B0", np.char.zfill(asin.astype(str), 8)),
+        "domain":             rng.choice(DOMAINS, n, p=[0.5, 0.08, 0.14, 0.1, 0.05, 0.05, 0.05, 0.03]),
+        "rating":             rating,
+        "title":              titles[rng.integers(0, len(titles), n)],
+        "content":            bodies[rng.integers(0, len(bodies), n)],
+        "product_attributes": attrs[rng.integers(0, len(attrs), n)],
+        "author":             np.char.add("user", rng.integers(0, n, n).astype(str)),
+        "is_verified":        rng.random(n) < 0.85,
+        "review_date":        _dates(rng, n, 730),
+    })
+
+
+def gen_sales_traffic(rng, z):
+    asins, days = z["asins"], z["traffic_days"]
+    a   = np.tile(np.arange(asins), days)
+    d   = np.repeat(np.arange(days), asins)
+    n   = len(a)
+    pop = rng.lognormal(3, 1, asins)
+    sessions = rng.poisson(pop[a])
+    mobile   = rng.binomial(sessions, 0.6)
+    views    = sessions + rng.poisson(sessions * 0.4)
+    units    = rng.binomial(sessions, np.clip(rng.beta(2, 20, asins)[a], 0, 1))
+    sales    = np.round(units * rng.lognormal(3.0, 0.4, asins)[a], 2)
+    share    = lambda x, total: np.round(np.where(total > 0, x / np.maximum(total, 1) * 100, 0), 2)
+    df = pd.DataFrame({
+        "report_date":  (START + pd.to_timedelta(d, unit="D")).date,
+        "parent_asin":  np.char.add("P0", np.char.zfill((a // 3).astype(str), 8)),
+        "child_asin":   np.char.add("B0", np.char.zfill(a.astype(str), 8)),
+        "sessions": sessions, "page_views": views, "units_ordered": units,
+        "units_ordered_b2b": rng.binomial(units, 0.05), "total_order_items": units,
+        "total_order_items_b2b": rng.binomial(units, 0.05),
+        "ordered_product_sales": sales, "ordered_product_sales_b2b": np.round(sales * 0.05, 2),
+        "session_percentage": np.round(rng.random(n), 4), "page_views_percentage": np.round(rng.random(n), 4),
+        "buy_box_percentage": np.round(rng.uniform(60, 100, n), 2),
+        "unit_session_percentage": share(units, sessions),
+        "mobile_sessions": mobile, "mobile_page_views": rng.binomial(views, 0.6),
+        "browser_sessions": sessions - mobile, "browser_page_views": views - rng.binomial(views, 0.6),
+        "mobile_session_percentage": share(mobile, sessions),
+        "mobile_page_views_percentage": np.round(rng.random(n) * 100, 2),
+        "mobile_unit_session_percentage": np.round(rng.random(n) * 20, 2),
+        "mobile_buy_box_percentage": np.round(rng.uniform(60, 100, n), 2),
+        "browser_session_percentage": share(sessions - mobile, sessions),
+        "browser_page_views_percentage": np.round(rng.random(n) * 100, 2),
+        "browser_unit_session_percentage": np.round(rng.random(n) * 20, 2),
+        "browser_buy_box_percentage": np.round(rng.uniform(60, 100, n), 2),
+    })
+    df["created_at"] = pd.to_datetime(df["report_date"]) + pd.Timedelta(days=2)
+    return df
+
+
+def generate(rows, seed=42):
+    """{table: DataFrame} at the scale given by rows (see module docstring)."""
+    rng = np.random.default_rng(seed)
+    z   = table_sizes(rows)
+    out = {"fba_inventory": gen_inventory(rng, z), "orders": gen_orders(rng, z)}
+    out["settlements"]    = gen_settlements(rng, z)
+    out["returns"]        = gen_returns(rng, z, out["orders"])
+    out["amazon_reviews"] = gen_reviews(rng, z)
+    out["sales_traffic"]  = gen_sales_traffic(rng, z)
+    return out
+
+
+def _pg_type(s):
+    if pd.api.types.is_bool_dtype(s):           return "boolean"
+    if pd.api.types.is_integer_dtype(s):        return "bigint"
+    if pd.api.types.is_float_dtype(s):          return "double precision"
+    if pd.api.types.is_datetime64_any_dtype(s): return "timestamp"
+    if len(s) and isinstance(s.iloc[0], dt.date):  return "date"
+    return "text"
+
+
+INDEXES = {"fba_inventory": "created_at", "orders": '"Order Date"', "settlements": '"Posted Date"',
+           "returns": '"Return Date"', "amazon_reviews": "review_date", "sales_traffic": "report_date"}
+
+
+def load_postgres(frames, url, replace=False, schema="spapi"):
+    """CREATE + COPY every frame into url's `schema`; refuses to touch existing tables unless replace."""
+    import psycopg2
+    conn = psycopg2.connect(url)
+    conn.autocommit = True
+    cur  = conn.cursor()
+    cur.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+    cur.execute(f"SET search_path TO {schema}")
+    for name, df in frames.items():
+        cur.execute("SELECT to_regclass(%s)", (f"{schema}.{name}",))
+        if cur.fetchone()[0] is not None:
+            if not replace:
+                raise SystemExit(f"{schema}.{name} already exists — rerun with --replace to overwrite it")
+            cur.execute(f'DROP TABLE {schema}."{name}" CASCADE')
+        cols = ", ".join(f'"{c}" {_pg_type(df[c])}' for c in df.columns)
+        cur.execute(f'CREATE TABLE "{name}" ({cols})')
+        t0 = time.perf_counter()
+        collist = ", ".join(f'"{c}"' for c in df.columns)
+        for lo in range(0, len(df), COPY_CHUNK):
+            buf = io.StringIO()
+            df.iloc[lo:lo + COPY_CHUNK].to_csv(buf, index=False, header=False)
+            buf.seek(0)
+            cur.copy_expert(f'COPY "{name}" ({collist}) FROM STDIN WITH (FORMAT csv)', buf)
+        if name in INDEXES:
+            cur.execute(f'CREATE INDEX ON "{name}" ({INDEXES[name]})')
+        if name == "amazon_reviews":
+            cur.execute('ALTER TABLE amazon_reviews ADD PRIMARY KEY (review_id)')
+        cur.execute(f'ANALYZE "{name}"')
+        print(f"  {name:<15} {len(df):>12,} rows  {time.perf_counter() - t0:6.1f}s")
+    conn.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--url", default=os.getenv("BENCH_DATABASE_URL"), help="scratch database (or BENCH_DATABASE_URL)")
+    ap.add_argument("--rows", default="250k", help="orders/settlements rows, e.g. 10k, 1M, 10M")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--replace", action="store_true", help="drop existing spapi tables first")
+    args = ap.parse_args()
+    if not args.url:
+        ap.error("--url or BENCH_DATABASE_URL is required")
+
+    rows = parse_rows(args.rows)
+    t0 = time.perf_counter()
+    frames = generate(rows, args.seed)
+    print(f"generated in {time.perf_counter() - t0:.1f}s — loading into {args.url.rsplit('@', 1)[-1]}")
+    load_postgres(frames, args.url, replace=args.replace)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""Complaint topics for 1–3★ reviews — batch pipeline, run outside the dashboard.
+
+    python complaint_topics.py [--url postgresql://...] [--batch 5000] [--topics 12] [--refit]
+
+Review text (title + content) is vectorized with a HashingVectorizer — stateless, so new
+batches never require refitting a vocabulary — and clustered with mini-batch k-means: each
+batch moves the existing centroids (running mean per topic) instead of starting over. Each run
+only processes low-star reviews that have no topic yet, in batches, so it can be scheduled
+after every ETL load. Stop words are English plus the commonest de/fr/it/es function words —
+reviews come from every marketplace, and unfiltered "nicht"/"pour"/"molto" would otherwise
+top the labels of the non-English topics.
+
+Results live in Postgres, next to amazon_reviews:
+  review_topic_assignments  review_id → topic_id (+ asin, domain, rating, review_date)
+  review_topics             topic_id → label (top distinctive terms), reviews
+  review_topic_model        centroids + counts (.npy, loaded with allow_pickle=False) and
+                            term counts (JSON) for the next incremental run
+The dashboard only reads the first two (load_complaint_topics()).
+"""
+import argparse
+import io
+import json
+import math
+import os
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from sklearn.cluster import kmeans_plusplus
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS, HashingVectorizer
+from sqlalchemy import create_engine, text
+
+load_dotenv()
+
+TOPIC_COUNT      = int(os.getenv("TOPIC_COUNT", "12"))
+TOPIC_BATCH      = int(os.getenv("TOPIC_BATCH", "5000"))
+TOPIC_MAX_RATING = 3
+TOPIC_FEATURES   = 2 ** 16   # float32 centers: topics × 256 KB in the saved model
+TOPIC_KEEP_TERMS = 300     # per-topic term counts kept between runs
+LABEL_TERMS      = 3
+_NUMERIC_RE      = r'^\s*[-+]?[0-9]*\.?[0-9]+([eE][-+]?[0-9]+)?\s*$'   # same guard as dashboard.py
+_RATING          = f"trunc(CASE WHEN r.rating::text ~ '{_NUMERIC_RE}' THEN r.rating::text::numeric END)"
+# 3+ letters only — shorter tokens never pass the vectorizer's token_pattern
+STOP_WORDS = sorted(ENGLISH_STOP_WORDS | set("""
+    aber als auch auf aus bei bin bis das dass dem den der des die dies diese doch ein eine einem
+    einen einer eines für hat hatte ich ihr ist mit nach nicht noch nur oder sehr sich sie sind
+    über und uns von war wie wir wird zum zur
+    avec ces cette dans des elle est été être les leur mais mes moi mon nous pas pour que qui sans
+    ses son sont sur tout très une vous
+    alla anche che come con del della delle dei gli hanno nel nella non per più questo sono una
+    molto
+    como con del las los más muy para pero por que sin son una uno este esta está
+""".split()))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS review_topic_assignments (
+    review_id   text PRIMARY KEY,
+    asin        text,
+    domain      text,
+    rating      integer,
+    review_date timestamp,
+    topic_id    integer NOT NULL,
+    processed_at timestamp NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS review_topic_assignments_asin_idx ON review_topic_assignments (asin, domain);
+CREATE TABLE IF NOT EXISTS review_topics (
+    topic_id   integer PRIMARY KEY,
+    label      text NOT NULL,
+    terms      text NOT NULL,
+    reviews    integer NOT NULL,
+    updated_at timestamp NOT NULL DEFAULT now()
+);
+CREATE TABLE IF NOT EXISTS review_topic_model (
+    id         integer PRIMARY KEY CHECK (id = 1),
+    centers    bytea NOT NULL,
+    counts     bytea NOT NULL,
+    meta       jsonb NOT NULL,
+    updated_at timestamp NOT NULL DEFAULT now()
+);
+"""
+
+
+def vectorizer():
+    return HashingVectorizer(n_features=TOPIC_FEATURES, ngram_range=(1, 2), stop_words=STOP_WORDS,
+                             alternate_sign=False, norm='l2', token_pattern=r"(?u)\b[^\W\d_]{3,}\b",
+                             dtype=np.float32)
+
+
+def new_state(n_topics=None):
+    n_topics = n_topics or TOPIC_COUNT
+    return {"centers": None, "counts": np.zeros(n_topics), "features": TOPIC_FEATURES,
+            "terms": [Counter() for _ in range(n_topics)], "docs": [0] * n_topics,
+            "all_terms": Counter(), "reviews": 0}
+
+
+def _nearest(X, centers):
+    """Closest center per row; rows are l2-normalised, so ||x - c||² ranks as ||c||² - 2·x·c."""
+    return np.asarray((centers * centers).sum(axis=1) - 2 * (X @ centers.T)).argmin(axis=1)
+
+
+def _fit_batch(state, X):
+    """One mini-batch k-means step: each center becomes the running mean of every review it got."""
+    if state["centers"] is None:
+        state["centers"], _ = kmeans_plusplus(X, len(state["counts"]), random_state=0)
+        state["centers"] = np.asarray(state["centers"], dtype=np.float32)
+    k       = len(state["counts"])
+    labels  = _nearest(X, state["centers"])
+    onehot  = np.zeros((k, X.shape[0]), dtype=np.float32)
+    onehot[labels, np.arange(X.shape[0])] = 1
+    n       = onehot.sum(axis=1)
+    sums    = np.asarray(X.T @ onehot.T).T                  # k × features
+    total   = state["counts"] + n
+    hit     = n > 0
+    state["centers"][hit] = ((state["centers"][hit] * state["counts"][hit, None] + sums[hit])
+                             / total[hit, None]).astype(np.float32)
+    state["counts"] = total
+
+
+def review_text(df):
+    return (df['title'].fillna('').astype(str) + '. ' + df['content'].fillna('').astype(str)).tolist()
+
+
+def process_batch(state, df):
+    """Assign topics to one batch of reviews, updating centroids and term counts in place.
+
+    Returns an array of topic ids aligned with df. The first batch must hold at least as
+    many reviews as there are topics (k-means++ needs that many points to initialise).
+    """
+    docs  = review_text(df)
+    X     = vectorizer().transform(docs)
+    _fit_batch(state, X)
+    topics = _nearest(X, state["centers"])
+    analyze = vectorizer().build_analyzer()
+    for doc, topic in zip(docs, topics):
+        words = set(analyze(doc))
+        state["terms"][topic].update(words)
+        state["all_terms"].update(words)
+        state["docs"][topic] += 1
+    for i, c in enumerate(state["terms"]):
+        if len(c) > TOPIC_KEEP_TERMS * 2:
+            state["terms"][i] = Counter(dict(c.most_common(TOPIC_KEEP_TERMS)))
+    if len(state["all_terms"]) > TOPIC_KEEP_TERMS * len(state["terms"]) * 2:
+        state["all_terms"] = Counter(dict(state["all_terms"].most_common(TOPIC_KEEP_TERMS * len(state["terms"]))))
+    state["reviews"] += len(docs)
+    return topics
+
+
+def topic_labels(state, n_terms=None):
+    """[(topic_id, label, terms)] — terms ranked by share of the topic's reviews × log lift over all reviews."""
+    n_terms = n_terms or LABEL_TERMS
+    total   = max(state["reviews"], 1)
+    out = []
+    for i, counts in enumerate(state["terms"]):
+        size = max(state["docs"][i], 1)
+        scored = []
+        for term, c in counts.items():
+            words = term.split()
+            if len(words) > 1 and len(set(words)) == 1:   # "cheap cheap"
+                continue
+            base = state["all_terms"].get(term, c) / total
+            lift = (c / size) / max(base, 1e-9)
+            if lift > 1:
+                scored.append((c * math.log(lift), len(words), term))   # phrases win ties
+        terms = [t for _, _, t in sorted(scored, reverse=True)]
+        # drop unigrams already covered by a chosen bigram
+        picked = []
+        for t in terms:
+            if any(t in p.split() for p in picked) or any(p in t.split() for p in picked):
+                continue
+            picked.append(t)
+            if len(picked) >= n_terms * 3:
+                break
+        out.append((i, " · ".join(picked[:n_terms]) or f"topic {i + 1}", ", ".join(picked)))
+    return out
+
+
+def _engine(url):
+    return create_engine(url, connect_args={"options": "-csearch_path=spapi,public"})
+
+
+def _npy(a):
+    buf = io.BytesIO()
+    np.save(buf, a, allow_pickle=False)
+    return buf.getvalue()
+
+
+def _load_state(conn):
+    """Stored model, or None. Only arrays and JSON are read back — nothing executable."""
+    row = conn.execute(text("SELECT centers, counts, meta FROM review_topic_model WHERE id = 1")).first()
+    if row is None:
+        return None
+    meta = row.meta if isinstance(row.meta, dict) else json.loads(row.meta)
+    return {"centers":   np.load(io.BytesIO(row.centers), allow_pickle=False),
+            "counts":    np.load(io.BytesIO(row.counts), allow_pickle=False),
+            "features":  meta["features"],
+            "terms":     [Counter(t) for t in meta["terms"]],
+            "docs":      meta["docs"],
+            "all_terms": Counter(meta["all_terms"]),
+            "reviews":   meta["reviews"]}
+
+
+def _save_state(conn, state):
+    meta = {"features": state["features"], "terms": [dict(t) for t in state["terms"]], "docs": list(map(int, state["docs"])),
+            "all_terms": dict(state["all_terms"]), "reviews": int(state["reviews"])}
+    conn.execute(text("""INSERT INTO review_topic_model (id, centers, counts, meta, updated_at)
+                         VALUES (1, :centers, :counts, CAST(:meta AS jsonb), now())
+                         ON CONFLICT (id) DO UPDATE SET centers = EXCLUDED.centers, counts = EXCLUDED.counts,
+                                                        meta = EXCLUDED.meta, updated_at = now()"""),
+                 {"centers": _npy(state["centers"]), "counts": _npy(state["counts"]), "meta": json.dumps(meta)})
+
+
+def _pending(conn, limit):
+    sql = f"""
+        SELECT r.review_id, r.asin, lower(trim(r.domain)) AS domain, {_RATING}::int AS rating,
+               r.review_date, r.title, r.content
+        FROM amazon_reviews r
+        WHERE {_RATING} BETWEEN 1 AND {TOPIC_MAX_RATING}
+          AND NOT EXISTS (SELECT 1 FROM review_topic_assignments a WHERE a.review_id = r.review_id)
+        ORDER BY r.review_date NULLS LAST, r.review_id
+        LIMIT :limit"""
+    return pd.read_sql(text(sql), conn, params={"limit": limit})
+
+
+def run(url, batch=None, n_topics=None, refit=False, log=print):
+    """Process every pending low-star review in batches; returns the number of reviews assigned."""
+    batch = batch or TOPIC_BATCH
+    eng   = _engine(url)
+    with eng.begin() as conn:
+        conn.execute(text(SCHEMA))
+        if refit:
+            conn.execute(text("TRUNCATE review_topic_assignments, review_topics, review_topic_model"))
+            conn.execute(text("DROP TABLE IF EXISTS review_topic_state"))   # old pickled format
+        state    = _load_state(conn)
+        assigned = conn.execute(text("SELECT EXISTS (SELECT 1 FROM review_topic_assignments)")).scalar()
+    if state is None and assigned:
+        raise SystemExit("topics were assigned but no model is stored (older format?); rerun with --refit")
+    if state is None:
+        state = new_state(n_topics)
+    elif n_topics and n_topics != len(state["terms"]):
+        raise SystemExit(f"stored model has {len(state['terms'])} topics; rerun with --refit to change it")
+    elif state["features"] != TOPIC_FEATURES:
+        raise SystemExit(f"stored model was built with {state['features']} features; rerun with --refit")
+
+    done = 0
+    while True:
+        t0 = time.perf_counter()
+        with eng.connect() as conn:
+            df = _pending(conn, batch)
+        if df.empty:
+            break
+        if state["reviews"] == 0 and len(df) < len(state["terms"]):
+            log(f"only {len(df)} reviews pending — need {len(state['terms'])} to initialise, skipped")
+            break
+        df['topic_id'] = process_batch(state, df)
+        rows = df[['review_id', 'asin', 'domain', 'rating', 'review_date', 'topic_id']]
+        rows = rows.astype(object).where(rows.notna(), None).to_dict('records')
+        with eng.begin() as conn:   # assignments + model state commit together
+            conn.execute(text("""
+                INSERT INTO review_topic_assignments (review_id, asin, domain, rating, review_date, topic_id)
+                VALUES (:review_id, :asin, :domain, :rating, :review_date, :topic_id)
+                ON CONFLICT (review_id) DO NOTHING"""), rows)
+            _save_state(conn, state)
+        done += len(df)
+        log(f"batch {len(df):>6,} reviews  {time.perf_counter() - t0:6.2f}s  total {done:,}")
+        if len(df) < batch:
+            break
+
+    with eng.begin() as conn:
+        counts = dict(conn.execute(text("SELECT topic_id, COUNT(*) FROM review_topic_assignments GROUP BY 1")).all())
+        conn.execute(text("DELETE FROM review_topics"))
+        labels = [{"topic_id": i, "label": label, "terms": terms, "reviews": int(counts.get(i, 0))}
+                  for i, label, terms in topic_labels(state)]
+        if labels:
+            conn.execute(text("""INSERT INTO review_topics (topic_id, label, terms, reviews)
+                                 VALUES (:topic_id, :label, :terms, :reviews)"""), labels)
+    return done
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Assign complaint topics to new 1–3★ reviews.")
+    ap.add_argument("--url", default=os.getenv("DATABASE_URL"), help="database URL (or DATABASE_URL)")
+    ap.add_argument("--batch", type=int, default=TOPIC_BATCH)
+    ap.add_argument("--topics", type=int, help=f"number of topics for a new model (default {TOPIC_COUNT})")
+    ap.add_argument("--refit", action="store_true", help="drop the model and all assignments, start over")
+    args = ap.parse_args(argv)
+    if not args.url:
+        ap.error("--url or DATABASE_URL is required")
+    n = run(args.url, args.batch, args.topics, args.refit)
+    print(f"{n:,} reviews assigned")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,3 @@
-
 #dashboard.py
 import streamlit as st
 import pandas as pd
@@ -8,8 +7,25 @@ import plotly.graph_objects as go
 from sklearn.linear_model import LinearRegression
 import numpy as np
 import datetime as dt
+import functools
+import hashlib
+import html
+import json
+import logging
+import tempfile
+import threading
+import time
+import typing
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+import analytics
+import analytics_data
 
 load_dotenv()
 
@@ -19,11 +35,281 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
+# Connection pool — one per Streamlit server process, shared by all sessions
+DB_POOL_SIZE     = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW  = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT  = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE  = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1").lower() not in ("0", "false", "no")
+
+# Change notifications — with DB_LISTEN on, ETL commits mark datasets stale as they happen
+# (see migrations/notify_data_changed.sql) and the loader TTL is only a fallback.
+DB_LISTEN         = os.getenv("DB_LISTEN", "0").lower() in ("1", "true", "yes")
+DB_NOTIFY_CHANNEL = os.getenv("DB_NOTIFY_CHANNEL", "fba_data_changed")
+CACHE_TTL         = int(os.getenv("CACHE_TTL", "900" if DB_LISTEN else "60"))
+
+
+@st.cache_resource
+def get_pool_stats():
+    """Process-wide checkout counters, updated by db_connect()/db_raw_connect()."""
+    return {
+        "lock": threading.Lock(),
+        "checkouts": 0, "connects": 0, "timeouts": 0,
+        "wait_total": 0.0, "wait_max": 0.0,
+    }
+
+
+@st.cache_resource
 def get_engine():
-    return create_engine(
+    engine = create_engine(
         DATABASE_URL,
-        connect_args={"options": "-csearch_path=spapi,public"}
+        connect_args={"options": "-csearch_path=spapi,public"},
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
     )
+    stats = get_pool_stats()
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, conn_record):
+        with stats["lock"]:
+            stats["connects"] += 1
+
+    if PERF_ENABLED:
+        event.listen(engine, "before_cursor_execute", _perf_before_sql)
+        event.listen(engine, "after_cursor_execute", _perf_after_sql)
+    return engine
+
+
+def _record_checkout(wait, timed_out=False):
+    stats = get_pool_stats()
+    with stats["lock"]:
+        if timed_out:
+            stats["timeouts"] += 1
+            return
+        stats["checkouts"] += 1
+        stats["wait_total"] += wait
+        stats["wait_max"] = max(stats["wait_max"], wait)
+
+
+@contextmanager
+def db_connect():
+    """SQLAlchemy connection from the shared pool; checkout wait goes to pool stats."""
+    engine = get_engine()
+    t0 = time.perf_counter()
+    try:
+        conn = engine.connect()
+    except PoolTimeoutError:
+        _record_checkout(time.perf_counter() - t0, timed_out=True)
+        raise
+    _record_checkout(time.perf_counter() - t0)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def db_raw_connect():
+    """Raw psycopg2 connection from the same pool (closing returns it to the pool)."""
+    engine = get_engine()
+    t0 = time.perf_counter()
+    try:
+        conn = engine.raw_connection()
+    except PoolTimeoutError:
+        _record_checkout(time.perf_counter() - t0, timed_out=True)
+        raise
+    _record_checkout(time.perf_counter() - t0)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def pool_status():
+    """Snapshot of pool occupancy + checkout wait stats for the sidebar panel."""
+    stats = get_pool_stats()
+    with stats["lock"]:
+        snap = {k: v for k, v in stats.items() if k != "lock"}
+    pool = get_engine().pool
+    snap["size"]        = pool.size()
+    snap["checked_out"] = pool.checkedout()
+    snap["overflow"]    = pool.overflow()
+    snap["idle"]        = pool.checkedin()
+    snap["wait_avg"]    = snap["wait_total"] / snap["checkouts"] if snap["checkouts"] else 0.0
+    return snap
+
+
+# ---- Performance instrumentation (opt-in: PERF_INSTRUMENT=1) ----
+# Each rerun gets a record — sections, SQL statements, loader cache hits/misses, frame memory —
+# keyed by the Streamlit session (loader worker threads share the script context). Finished
+# runs go to a process-wide ring buffer for p50/p95, the "fba.perf" logger and, with PERF_LOG
+# set, a JSON-lines file.
+PERF_ENABLED = os.getenv("PERF_INSTRUMENT", "0").lower() in ("1", "true", "yes")
+PERF_LOG     = os.getenv("PERF_LOG", "")
+PERF_KEEP    = int(os.getenv("PERF_KEEP", "500"))
+_perf_log    = logging.getLogger("fba.perf")
+_perf_tls    = threading.local()
+
+
+@st.cache_resource
+def get_perf_store():
+    return {"lock": threading.Lock(), "active": {}, "runs": deque(maxlen=PERF_KEEP), "frames": {}}
+
+
+def _session_id():
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else None
+
+
+def _perf_run():
+    if not PERF_ENABLED:
+        return None
+    sid = _session_id()
+    return get_perf_store()["active"].get(sid) if sid else None
+
+
+def perf_run_start():
+    if not PERF_ENABLED or (sid := _session_id()) is None:
+        return
+    get_perf_store()["active"][sid] = {
+        "session": sid[:8], "page": None, "started": time.time(), "t0": time.perf_counter(),
+        "sections": [], "sql": [], "loaders": [],
+    }
+
+
+def perf_run_end():
+    """Close the session's run: total time, into the ring buffer and the structured log."""
+    if not PERF_ENABLED or (sid := _session_id()) is None:
+        return
+    store = get_perf_store()
+    run = store["active"].pop(sid, None)
+    if run is None:
+        return
+    run["total_ms"] = round((time.perf_counter() - run.pop("t0")) * 1000, 1)
+    line = json.dumps(run, default=str)
+    with store["lock"]:
+        store["runs"].append(run)
+        if PERF_LOG:
+            with open(PERF_LOG, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+    _perf_log.info(line)
+
+
+@contextmanager
+def perf_section(name):
+    run = _perf_run()
+    if run is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        run["sections"].append({"name": name, "ms": round((time.perf_counter() - t0) * 1000, 2)})
+
+
+def perf_sql(statement, seconds, rows):
+    run = _perf_run()
+    if run is not None:
+        run["sql"].append({"sql": " ".join(str(statement).split())[:160],
+                           "ms": round(seconds * 1000, 2), "rows": rows})
+
+
+def _perf_before_sql(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("perf_t0", []).append(time.perf_counter())
+
+
+def _perf_after_sql(conn, cursor, statement, parameters, context, executemany):
+    t0 = conn.info.get("perf_t0", [])
+    if t0:
+        perf_sql(statement, time.perf_counter() - t0.pop(), cursor.rowcount)
+
+
+def cached_loader(**cache_kwargs):
+    """st.cache_data that also reports hit/miss, wall time and frame memory under PERF_INSTRUMENT.
+
+    The wrapped body only runs on a cache miss, so it flags the miss in a thread-local; the
+    outer call reads the flag. `.clear()` is forwarded to the cache.
+    """
+    def deco(fn):
+        @functools.wraps(fn)
+        def body(*args, **kwargs):
+            _perf_tls.miss = True
+            return fn(*args, **kwargs)
+        cached = st.cache_data(**cache_kwargs)(body)
+
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            run = _perf_run()
+            if run is None:
+                return cached(*args, **kwargs)
+            outer, _perf_tls.miss = getattr(_perf_tls, "miss", False), False
+            t0  = time.perf_counter()
+            out = cached(*args, **kwargs)
+            ms  = round((time.perf_counter() - t0) * 1000, 2)
+            miss, _perf_tls.miss = _perf_tls.miss, outer
+            rec = {"loader": fn.__name__, "hit": not miss, "ms": ms,
+                   "rows": len(out) if isinstance(out, (pd.DataFrame, pd.Series, list)) else None}
+            if miss and isinstance(out, pd.DataFrame):
+                mb = out.memory_usage(deep=True).sum() / 2**20
+                get_perf_store()["frames"][fn.__name__] = round(mb, 2)
+            run["loaders"].append(rec)
+            return out
+
+        call.clear = cached.clear
+        return call
+    return deco
+
+
+def plotly_chart(fig, **kwargs):
+    """st.plotly_chart, timed as the 'plotly' section (figure → JSON serialization)."""
+    with perf_section("plotly"):
+        return st.plotly_chart(fig, **kwargs)
+
+
+def _pctl(values, q):
+    return round(float(np.percentile(values, q)), 1) if len(values) else None
+
+
+def show_perf_panel():
+    if not PERF_ENABLED:
+        return
+    run   = _perf_run()
+    store = get_perf_store()
+    with st.sidebar.expander("⏱️ Performance", expanded=False):
+        if run is not None:
+            elapsed = (time.perf_counter() - run["t0"]) * 1000
+            sql_ms  = sum(q["ms"] for q in run["sql"])
+            hits    = sum(r["hit"] for r in run["loaders"])
+            st.caption(f"This rerun: **{elapsed:,.0f} ms** · SQL {len(run['sql'])} × {sql_ms:,.0f} ms · "
+                       f"cache {hits}/{len(run['loaders'])} hits")
+            sec = pd.DataFrame(run["sections"] + [{"name": f"load:{r['loader']}", "ms": r["ms"]} for r in run["loaders"]])
+            if not sec.empty:
+                st.dataframe(sec.groupby("name")["ms"].agg(['count', 'sum']).round(1).sort_values('sum', ascending=False),
+                             use_container_width=True)
+            if run["sql"]:
+                st.dataframe(pd.DataFrame(run["sql"]).nlargest(5, "ms"), use_container_width=True, hide_index=True)
+        if store["frames"]:
+            st.caption("Frame memory (MB): " + " · ".join(f"{k} {v:,.1f}" for k, v in sorted(store["frames"].items())))
+        with store["lock"]:
+            runs = list(store["runs"])
+        if runs:
+            rows = {}
+            for r in runs:
+                rows.setdefault(f"total · {r['page']}", []).append(r["total_ms"])
+                for s_ in r["sections"]:
+                    rows.setdefault(s_["name"], []).append(s_["ms"])
+                rows.setdefault("sql", []).append(sum(q["ms"] for q in r["sql"]))
+            agg = pd.DataFrame([{"metric": k, "n": len(v), "p50 ms": _pctl(v, 50), "p95 ms": _pctl(v, 95)}
+                                for k, v in rows.items()])
+            st.caption(f"Last {len(runs)} reruns, all sessions:")
+            st.dataframe(agg, use_container_width=True, hide_index=True)
+            st.download_button("📥 perf.json", json.dumps(runs, default=str, indent=1), "perf.json",
+                               "application/json", key="perf_json")
 
 translations = {
     "UA": {
@@ -50,6 +336,11 @@ translations = {
         "ai_result_days": "Днів залишилось:",
         "ai_ok": "✅ Запасів вистачить",
         "ai_error": "Недостатньо даних для прогнозу",
+        "ai_mode": "Режим прогнозу:",
+        "ai_mode_single": "🔎 Один SKU",
+        "ai_mode_portfolio": "🚨 Всі SKU (ризик sold-out)",
+        "ai_risk_title": "🚨 SKU під ризиком sold-out",
+        "ai_risk_caption": "Тренд по всіх знімках складу (МНК). Сортування — клік по заголовку колонки.",
         "footer_date": "📅 Дані оновлено:",
         "download_excel": "📥 Завантажити Excel",
         "settlements_title": "🏦 Фінансові виплати (Settlements)",
@@ -98,6 +389,11 @@ translations = {
         "ai_result_days": "Days left:",
         "ai_ok": "✅ Stock sufficient",
         "ai_error": "Not enough data",
+        "ai_mode": "Forecast mode:",
+        "ai_mode_single": "🔎 Single SKU",
+        "ai_mode_portfolio": "🚨 All SKUs (stock-out risk)",
+        "ai_risk_title": "🚨 SKUs at risk of stock-out",
+        "ai_risk_caption": "Least-squares trend over all inventory snapshots. Click a column header to sort.",
         "footer_date": "📅 Last update:",
         "download_excel": "📥 Download Excel",
         "settlements_title": "🏦 Financial Settlements (Payouts)",
@@ -146,6 +442,11 @@ translations = {
         "ai_result_days": "Дней осталось:",
         "ai_ok": "✅ Запасов хватит",
         "ai_error": "Недостаточно данных",
+        "ai_mode": "Режим прогноза:",
+        "ai_mode_single": "🔎 Один SKU",
+        "ai_mode_portfolio": "🚨 Все SKU (риск sold-out)",
+        "ai_risk_title": "🚨 SKU под риском sold-out",
+        "ai_risk_caption": "Тренд по всем снимкам склада (МНК). Сортировка — клик по заголовку колонки.",
         "footer_date": "📅 Данные обновлены:",
         "download_excel": "📥 Скачать Excel",
         "settlements_title": "🏦 Финансовые выплаты (Settlements)",
@@ -176,155 +477,777 @@ translations = {
 # DATA LOADERS
 # ============================================
 
-@st.cache_data(ttl=60)
-def load_data():
+@cached_loader(ttl=CACHE_TTL)
+def load_inventory_dates(limit=None):
+    """Available snapshot dates, newest first — no snapshot rows leave Postgres."""
+    _baseline_probe("inventory")
+    try:
+        with db_connect() as conn:
+            return analytics_data.read_inventory_dates(conn, limit)
+    except Exception as e:
+        st.error(f"Помилка підключення до БД (Inventory): {e}")
+        return []
+
+
+@cached_loader(ttl=CACHE_TTL)
+def load_inventory_stores():
     try:
-        engine = get_engine()
-        with engine.connect() as conn:
-            df = pd.read_sql(text("SELECT * FROM fba_inventory ORDER BY created_at DESC"), conn)
+        with db_connect() as conn:
+            return analytics_data.read_inventory_stores(conn)
+    except Exception:
+        return []
+
+
+@cached_loader(ttl=CACHE_TTL)
+def load_data(snapshot_date=None, store=None):
+    """FBA inventory filtered in SQL: one snapshot day and (optionally) one store.
+
+    The frame carries a dataset_version (newest created_at, rows, load time) in df.attrs, so
+    a reload after refresh never shares paging/export caches with the previous load.
+    """
+    try:
+        with db_connect() as conn:
+            df = analytics_data.read_inventory(conn, snapshot_date, store)
+        df = analytics_data.compact_frame(analytics_data.prepare_inventory(df), "inventory")
+        newest = df['created_at'].max() if 'created_at' in df.columns and len(df) else None
+        df.attrs["dataset_version"] = ("inventory", str(newest), len(df), time.time())
         return df
     except Exception as e:
         st.error(f"Помилка підключення до БД (Inventory): {e}")
         return pd.DataFrame()
 
 
-@st.cache_data(ttl=60)
-def load_orders():
+def _read_inventory_history(since=None):
+    with db_connect() as conn:
+        return analytics_data.read_inventory_history(conn, since)
+
+
+@cached_loader(ttl=CACHE_TTL)
+def load_inventory_history():
+    """Narrow SKU/Available/created_at history across all snapshots (AI forecast).
+
+    Goes through _refresh_dataset like the append-only datasets: incremental refresh by
+    created_at and a Parquet snapshot for warm starts. Rows are not sorted by date.
+    """
     try:
-        engine = get_engine()
-        with engine.connect() as conn:
-            df = pd.read_sql(text('SELECT * FROM orders ORDER BY "Order Date" DESC'), conn)
-        if df.empty:
-            return pd.DataFrame()
-        df['Order Date'] = pd.to_datetime(df['Order Date'], dayfirst=False, errors='coerce')
-        column_mappings = {
-            'Quantity':       ['Quantity', 'quantity', 'qty'],
-            'Item Price':     ['Item Price', 'item-price', 'item_price', 'price'],
-            'Item Tax':       ['Item Tax', 'item-tax', 'item_tax', 'tax'],
-            'Shipping Price': ['Shipping Price', 'shipping-price', 'shipping_price', 'shipping'],
+        return _refresh_dataset("inventory", _read_inventory_history, analytics_data.prepare_inventory_history,
+                                'created_at')
+    except Exception as e:
+        st.error(f"Помилка підключення до БД (Inventory): {e}")
+        return pd.DataFrame()
+
+
+# ---- Incremental refresh ----
+# orders/settlements/returns/reviews/sales_traffic and the inventory history are append-mostly:
+# after the first full read a refresh re-fetches only rows at or after (high-watermark - overlap)
+# and swaps that window in.
+REFRESH_MODE         = os.getenv("DATA_REFRESH_MODE", "incremental").lower()   # incremental | full
+REFRESH_OVERLAP_DAYS = int(os.getenv("REFRESH_OVERLAP_DAYS", "3"))
+REFRESH_FULL_HOURS   = float(os.getenv("REFRESH_FULL_HOURS", "24"))          # periodic full reload catches deletes
+_refresh_log         = logging.getLogger("fba.refresh")
+
+
+@st.cache_resource
+def get_dataset_store():
+    """Process-wide {name: {df, watermark, full_at}} kept between cache_data TTL expiries."""
+    return {"lock": threading.Lock(), "locks": {}, "frames": {}, "probes": {}, "warned": set()}
+
+
+def _stamp_version(entry, name, when):
+    """Tag entry and its frame with a version; df.attrs carries it through cache_data copies."""
+    entry["version"] = (name, str(entry["watermark"]), len(entry["df"]), when)
+    entry["df"].attrs["dataset_version"] = entry["version"]
+    return entry
+
+
+def dataset_version(name, df=None):
+    """Version of a cached dataset (changes on every refresh) — read from df itself when given,
+    so a frame loaded before a background refresh keeps the version of the data it holds."""
+    if df is not None and "dataset_version" in df.attrs:
+        return df.attrs["dataset_version"]
+    entry = get_dataset_store()["frames"].get(name)
+    if entry is None:
+        return None
+    return entry.get("version")
+
+
+# ---- On-disk Parquet snapshots (warm start after deploy/restart) ----
+SNAPSHOT_DIR     = os.getenv("SNAPSHOT_DIR", ".snapshots")   # "" disables snapshots
+SNAPSHOT_VERSION = 2   # bump when an analytics_data.prepare_* function changes the frame layout
+_SNAPSHOT_META   = b"fba_snapshot"
+_snapshot_log    = logging.getLogger("fba.snapshot")
+
+
+def _snapshot_path(name):
+    return os.path.join(SNAPSHOT_DIR, f"{name}.parquet")
+
+
+def _save_snapshot(name, entry, table=None):
+    """Write entry['df'] + watermark/schema metadata atomically (tmp file + rename)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    tmp = None
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        tbl  = pa.Table.from_pandas(entry["df"], preserve_index=False)
+        wm   = entry["watermark"]
+        meta = {
+            "dataset":   name,
+            "version":   SNAPSHOT_VERSION,
+            "table":     table,
+            "columns":   list(map(str, entry["df"].columns)),
+            "watermark": wm.isoformat() if wm is not None else None,
+            "full_at":   entry["full_at"],
+            "saved_at":  time.time(),
         }
-        for target_col, possible_names in column_mappings.items():
-            found = False
-            for col_name in possible_names:
-                if col_name in df.columns:
-                    df[target_col] = pd.to_numeric(df[col_name], errors='coerce').fillna(0)
-                    found = True
-                    break
-            if not found:
-                df[target_col] = 0
-        df['Total Price'] = df['Item Price'] * df['Quantity']
+        tbl  = tbl.replace_schema_metadata({**(tbl.schema.metadata or {}), _SNAPSHOT_META: json.dumps(meta)})
+        path = _snapshot_path(name)
+        tmp  = f"{path}.{threading.get_ident()}.tmp"
+        pq.write_table(tbl, tmp)
+        os.replace(tmp, path)
+    except Exception:
+        _snapshot_log.warning("%s: snapshot save failed", name, exc_info=True)
+        if tmp and os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _discard_snapshot(name):
+    try:
+        os.remove(_snapshot_path(name))
+    except OSError:
+        pass
+
+
+def _load_snapshot(name, table=None):
+    """Snapshot entry for `name`, or None if missing, unreadable or stale.
+
+    Stale = written by another SNAPSHOT_VERSION, or the source table gained columns the
+    snapshot doesn't have. Stale files are deleted so the next full read replaces them.
+    """
+    import pyarrow.parquet as pq
+    path = _snapshot_path(name)
+    if not SNAPSHOT_DIR or not os.path.exists(path):
+        return None
+    try:
+        tbl  = pq.read_table(path)
+        meta = json.loads((tbl.schema.metadata or {}).get(_SNAPSHOT_META, b"{}"))
+    except Exception:
+        _discard_snapshot(name); return None
+    if meta.get("version") != SNAPSHOT_VERSION or meta.get("dataset") != name:
+        _discard_snapshot(name); return None
+    if table:
+        try:
+            if set(_table_columns(table)) - set(meta.get("columns", [])):
+                _discard_snapshot(name); return None
+        except Exception:
+            pass  # DB unreachable: the snapshot is still the best we have
+    wm = meta.get("watermark")
+    return _stamp_version({
+        "df":        tbl.to_pandas(),
+        "watermark": pd.Timestamp(wm) if wm else None,
+        "full_at":   meta.get("full_at") or 0,
+        "snapshot":  True,
+    }, name, "snapshot")
+
+
+def _refresh_dataset(name, fetch, prepare, date_col, key_cols=None, table=None):
+    """Return the prepared frame for `name`, fetching only rows newer than the stored watermark.
+
+    fetch(since) -> raw DataFrame (since=None means the whole table),
+    prepare(raw) -> typed frame with a datetime `date_col`.
+    Rows in the overlap window are replaced wholesale, so late corrections and deletes inside
+    the window are picked up; `key_cols` (default: DATASETS[name]['key_cols'], if present in the
+    frame) dedupe rows whose date moved. Datasets whose date column isn't a date/timestamp in
+    Postgres always read in full; a failed incremental fetch falls back to full reads for
+    REFRESH_FULL_HOURS, then incremental is tried again. Both are logged.
+    On a cold start the Parquet snapshot (if any) is returned at once and reconciled with
+    Postgres in a background thread; every refresh rewrites the snapshot.
+    """
+    if key_cols is None:
+        key_cols = DATASETS.get(name, {}).get("key_cols", ())
+    store = get_dataset_store()
+    with store["lock"]:
+        lock = store["locks"].setdefault(name, threading.Lock())
+    with lock:
+        entry = store["frames"].get(name)
+        if entry is None and SNAPSHOT_DIR:
+            entry = _load_snapshot(name, table)
+            if entry is not None:
+                store["frames"][name] = entry
+                threading.Thread(target=_reconcile_snapshot, name=f"reconcile-{name}", daemon=True,
+                                 args=(name, fetch, prepare, date_col, key_cols, table)).start()
+                return entry["df"]
+        now   = time.time()
+        full  = (REFRESH_MODE != "incremental" or entry is None or entry["watermark"] is None
+                 or now < entry.get("incremental_after", 0)
+                 or now - entry["full_at"] > REFRESH_FULL_HOURS * 3600)
+        retry = entry.get("incremental_after", 0) if entry is not None else 0
+        if not full and not _incremental_supported(name):
+            full = True
+        if not full:
+            since = entry["watermark"] - pd.Timedelta(days=REFRESH_OVERLAP_DAYS)
+            try:
+                new = fetch(since)
+            except Exception:
+                _refresh_log.warning("%s: incremental fetch failed, full reads for the next %sh",
+                                     name, REFRESH_FULL_HOURS, exc_info=True)
+                full, retry = True, now + REFRESH_FULL_HOURS * 3600
+        if full:
+            raw = fetch(None)
+            df  = analytics_data.compact_frame(prepare(raw), name) if not raw.empty else pd.DataFrame()
+            entry = {"full_at": now, "incremental_after": retry}
+        else:
+            old = entry["df"]
+            old = old[~(old[date_col] >= since)]
+            if new.empty:
+                df = old.reset_index(drop=True)
+            else:
+                df = analytics_data.concat_frames(analytics_data.compact_frame(prepare(new), name), old)
+                keys = [c for c in key_cols if c in df.columns]
+                if keys:
+                    df = df.drop_duplicates(subset=keys, keep='first', ignore_index=True)
+        entry["df"]        = df
+        entry["watermark"] = df[date_col].max() if not df.empty and date_col in df.columns else None
+        if pd.isna(entry["watermark"]):
+            entry["watermark"] = None
+        store["frames"][name] = _stamp_version(entry, name, now)
+        if SNAPSHOT_DIR and not df.empty:
+            threading.Thread(target=_save_snapshot, name=f"snapshot-{name}", daemon=True,
+                             args=(name, dict(entry), table)).start()
         return df
+
+
+def _reconcile_snapshot(name, fetch, prepare, date_col, key_cols, table):
+    """Bring a snapshot-served dataset up to date, then drop the cache_data copies of the
+    snapshot frame so the next rerun picks up the reconciled one instead of waiting out CACHE_TTL."""
+    try:
+        _refresh_dataset(name, fetch, prepare, date_col, key_cols, table)
+    except Exception:
+        _snapshot_log.warning("%s: reconcile after snapshot load failed", name, exc_info=True)
+        return
+    if name in DATASETS:
+        invalidate_dataset(name)
+
+
+@st.cache_data(ttl=3600)
+def _typed_date_column(table, column):
+    """True when table.column is a date/timestamp column, so `column >= :since` compares dates."""
+    with db_connect() as conn:
+        typ = conn.execute(text("""SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+                                   WHERE attrelid = to_regclass(:t) AND attname = :c AND NOT attisdropped"""),
+                           {"t": table, "c": column}).scalar()
+    return typ is not None and (typ == "date" or typ.startswith("timestamp"))
+
+
+def _incremental_supported(name):
+    """Whether `name` can refresh incrementally; logs once per process when it can't."""
+    ds = DATASETS.get(name)
+    if ds is None:
+        return True
+    try:
+        ok = _typed_date_column(ds["table"], ds["date_col"].strip('"'))
+    except Exception:
+        return True   # catalog unreachable: try the fetch, its failure path falls back
+    warned = get_dataset_store()["warned"]
+    if not ok and name not in warned:
+        warned.add(name)
+        _refresh_log.warning("%s: %s.%s is not a date/timestamp column, refreshing with full reads",
+                             name, ds["table"], ds["date_col"])
+    return ok
+
+
+def _read_table(table, order_col, since=None, since_expr=None):
+    with db_connect() as conn:
+        return analytics_data.read_table(conn, table, order_col, since, since_expr)
+
+
+@cached_loader(ttl=CACHE_TTL)
+def load_orders():
+    _baseline_probe("orders")
+    try:
+        return _refresh_dataset(
+            "orders", lambda since: _read_table("orders", '"Order Date"', since),
+            analytics_data.prepare_orders, 'Order Date', table="orders")
     except Exception as e:
         st.error(f"Помилка завантаження orders: {e}")
         return pd.DataFrame()
 
 
-@st.cache_data(ttl=60)
+@cached_loader(ttl=CACHE_TTL)
 def load_settlements():
+    _baseline_probe("settlements")
     try:
-        engine = get_engine()
-        with engine.connect() as conn:
-            df = pd.read_sql(text('SELECT * FROM settlements ORDER BY "Posted Date" DESC'), conn)
-        if df.empty:
-            return pd.DataFrame()
-        df['Amount']      = pd.to_numeric(df['Amount'], errors='coerce').fillna(0.0)
-        df['Quantity']    = pd.to_numeric(df['Quantity'], errors='coerce').fillna(0)
-        df['Posted Date'] = pd.to_datetime(df['Posted Date'], dayfirst=False, errors='coerce')
-        if 'Currency' not in df.columns:
-            df['Currency'] = 'USD'
-        df = df.dropna(subset=['Posted Date'])
-        return df
+        return _refresh_dataset(
+            "settlements", lambda since: _read_table("settlements", '"Posted Date"', since),
+            analytics_data.prepare_settlements, 'Posted Date', table="settlements")
     except Exception as e:
         st.error(f"Error loading settlements: {e}")
         return pd.DataFrame()
 
 
-@st.cache_data(ttl=60)
+def _fetch_sales_traffic(since=None, chunk_size=None):
+    with db_raw_connect() as conn:
+        return analytics_data.fetch_sales_traffic(conn, since, chunk_size, on_sql=perf_sql)
+
+
+@cached_loader(ttl=CACHE_TTL)
 def load_sales_traffic():
-    import psycopg2
-    import psycopg2.extras
-    db_url = DATABASE_URL
-    if not db_url:
+    if not DATABASE_URL:
         return pd.DataFrame()
-    if db_url.startswith("postgres://"):
-        db_url = db_url.replace("postgres://", "postgresql://", 1)
-    conn = None
+    _baseline_probe("sales_traffic")
     try:
-        conn = psycopg2.connect(db_url)
-        cur  = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cur.execute("SELECT * FROM spapi.sales_traffic ORDER BY report_date DESC")
-        rows    = cur.fetchall()
-        columns = [desc[0] for desc in cur.description]
-        cur.close()
-        if not rows:
-            return pd.DataFrame()
-        df = pd.DataFrame(rows, columns=columns)
-        numeric_cols = [
-            'sessions','page_views','units_ordered','units_ordered_b2b',
-            'total_order_items','total_order_items_b2b',
-            'ordered_product_sales','ordered_product_sales_b2b',
-            'session_percentage','page_views_percentage',
-            'buy_box_percentage','unit_session_percentage',
-            'mobile_sessions','mobile_page_views',
-            'browser_sessions','browser_page_views',
-            'mobile_session_percentage','mobile_page_views_percentage',
-            'mobile_unit_session_percentage','mobile_buy_box_percentage',
-            'browser_session_percentage','browser_page_views_percentage',
-            'browser_unit_session_percentage','browser_buy_box_percentage',
-        ]
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-        df['report_date'] = pd.to_datetime(df['report_date'], errors='coerce')
-        if 'created_at' in df.columns:
-            created = pd.to_datetime(df['created_at'], errors='coerce').dt.normalize()
-            if df['report_date'].isna().all():
-                df['report_date'] = created
-            elif df['report_date'].isna().any():
-                mask = df['report_date'].isna()
-                df.loc[mask, 'report_date'] = created[mask]
-        df['report_date'] = df['report_date'].dt.normalize()
-        df = df.dropna(subset=['report_date'])
-        return df
+        return _refresh_dataset("sales_traffic", _fetch_sales_traffic, analytics_data.prepare_sales_traffic,
+                                'report_date', table="spapi.sales_traffic")
     except Exception:
         return pd.DataFrame()
-    finally:
-        if conn:
-            conn.close()
 
 
-@st.cache_data(ttl=60)
+@cached_loader(ttl=CACHE_TTL)
 def load_returns():
+    _baseline_probe("returns")
+    try:
+        return _refresh_dataset(
+            "returns", lambda since: _read_table("returns", '"Return Date"', since),
+            analytics_data.prepare_returns, 'Return Date', table="returns")
+    except Exception:
+        return pd.DataFrame()
+
+
+# ---- Orders aggregates for the returns page (no raw orders over the wire) ----
+_NUMERIC_RE = analytics_data.NUMERIC_RE
+
+
+@st.cache_data(ttl=3600)
+def _table_columns(table):
+    with db_connect() as conn:
+        return analytics_data.table_columns(conn, table)
+
+
+@cached_loader(ttl=CACHE_TTL)
+def load_order_sku_prices(start=None, end=None, store=None):
+    """Mean item price per SKU computed in Postgres → Series indexed by SKU."""
+    try:
+        columns = _table_columns("orders")
+        with db_connect() as conn:
+            return analytics_data.read_order_sku_prices(conn, start, end, store, columns=columns)
+    except Exception:
+        return pd.Series(dtype=float)
+
+
+@cached_loader(ttl=CACHE_TTL)
+def load_order_count(start=None, end=None, store=None):
+    """COUNT(DISTINCT order id) in Postgres, optionally per order-date range and store."""
     try:
-        engine = get_engine()
-        with engine.connect() as conn:
-            df_returns = pd.read_sql(text('SELECT * FROM returns ORDER BY "Return Date" DESC'), conn)
-            df_orders  = pd.read_sql(text("SELECT * FROM orders"), conn)
-        return df_returns, df_orders
+        columns = _table_columns("orders")
+        with db_connect() as conn:
+            return analytics_data.read_order_count(conn, start, end, store, columns=columns)
     except Exception:
-        return pd.DataFrame(), pd.DataFrame()
+        return 0
 
 
-@st.cache_data(ttl=60)
+@cached_loader(ttl=CACHE_TTL)
 def load_reviews():
+    _baseline_probe("reviews")
     try:
-        engine = get_engine()
-        with engine.connect() as conn:
-            df = pd.read_sql(text('SELECT * FROM amazon_reviews ORDER BY review_date DESC'), conn)
-        if df.empty:
-            return pd.DataFrame()
-        df['review_date'] = pd.to_datetime(df['review_date'], errors='coerce')
-        df['rating']      = pd.to_numeric(df['rating'], errors='coerce').fillna(0).astype(int)
-        if 'is_verified' in df.columns:
-            df['is_verified'] = df['is_verified'].astype(bool)
-        # Normalize domain to lowercase
-        if 'domain' in df.columns:
-            df['domain'] = df['domain'].str.lower().str.strip()
-        return df
+        return _refresh_dataset(
+            "reviews", lambda since: _read_table("amazon_reviews", "review_date", since),
+            analytics_data.prepare_reviews, 'review_date', table="amazon_reviews")
     except Exception:
         return pd.DataFrame()
 
 
+# ---- Review full-text search ----
+# Runs in Postgres against a GIN expression index (migrations/review_search.sql) — only the
+# requested page of ranked matches leaves the database. The expression must match the index.
+REVIEW_SEARCH_TSV = ("setweight(to_tsvector('simple'::regconfig, coalesce(title, '')), 'A') || "
+                     "setweight(to_tsvector('simple'::regconfig, coalesce(content, '')), 'B')")
+REVIEW_SEARCH_PAGE = int(os.getenv("REVIEW_SEARCH_PAGE", "20"))
+_MARK_ON, _MARK_OFF = "\x02", "\x03"   # ts_headline markers, swapped for <mark> after HTML-escaping
+
+
+@st.cache_data(ttl=3600)
+def review_search_indexed():
+    """True when the search GIN index exists (otherwise search falls back to a full scan)."""
+    try:
+        with db_connect() as conn:
+            return conn.execute(text("SELECT to_regclass('amazon_reviews_search_idx') IS NOT NULL")).scalar()
+    except Exception:
+        return False
+
+
+@cached_loader(ttl=CACHE_TTL)
+def search_reviews(query, domains=(), asin=None, stars=(), page=1, page_size=None):
+    """Ranked full-text matches for `query` (web-search syntax: "phrase", or, -word).
+
+    Returns (total matches, frame of the requested page) — the frame carries a 'snippet' column
+    with matches wrapped in _MARK_ON/_MARK_OFF and a 'rank' column (ts_rank_cd, length-normalized).
+    """
+    page_size = page_size or REVIEW_SEARCH_PAGE
+    columns   = _table_columns("amazon_reviews")
+    keep      = [c for c in ['review_id', 'asin', 'domain', 'rating', 'title', 'review_date', 'is_verified', 'author']
+                 if c in columns]
+    where, params = [f"({REVIEW_SEARCH_TSV}) @@ q"], {
+        'q': query, 'limit': page_size, 'offset': (max(page, 1) - 1) * page_size,
+        'opts': f"StartSel={_MARK_ON}, StopSel={_MARK_OFF}, MaxFragments=2, MaxWords=30, MinWords=10"}
+    if domains and 'domain' in columns:
+        where.append("lower(trim(domain)) = ANY(:domains)"); params['domains'] = list(domains)
+    if asin and 'asin' in columns:
+        where.append("asin = :asin"); params['asin'] = asin
+    if stars and 'rating' in columns:
+        rating = f"trunc(CASE WHEN rating::text ~ '{_NUMERIC_RE}' THEN rating::text::numeric END)"
+        where.append(f"{rating} = ANY(:stars)"); params['stars'] = [int(s) for s in stars]
+    order = "rank DESC" + (", review_date DESC" if 'review_date' in columns else "")
+    sql = f"""
+        WITH q AS (SELECT websearch_to_tsquery('simple', :q) AS q),
+        hits AS (
+            SELECT {", ".join(keep)}, content, ts_rank_cd({REVIEW_SEARCH_TSV}, q, 32) AS rank,
+                   COUNT(*) OVER () AS total
+            FROM amazon_reviews, q
+            WHERE {" AND ".join(where)}
+            ORDER BY {order}
+            LIMIT :limit OFFSET :offset)
+        SELECT hits.*, ts_headline('simple', coalesce(content, ''), q, :opts) AS snippet
+        FROM hits, q
+        ORDER BY {order}"""
+    with db_connect() as conn:
+        df = pd.read_sql(text(sql), conn, params=params)
+    if df.empty:
+        with db_connect() as conn:
+            total = 0 if page <= 1 else conn.execute(text(
+                f"SELECT COUNT(*) FROM amazon_reviews, (SELECT websearch_to_tsquery('simple', :q) AS q) q "
+                f"WHERE {' AND '.join(where)}"), params).scalar()
+        return int(total or 0), df
+    total = int(df['total'].iloc[0])
+    df = analytics_data.prepare_reviews(df.drop(columns=['total', 'content']))
+    return total, df
+
+
+REVIEW_TABLE_COLS = ['review_id', 'review_date', 'asin', 'domain', 'rating', 'title', 'content',
+                     'product_attributes', 'author', 'is_verified']
+
+
+@cached_loader(ttl=CACHE_TTL)
+def load_balanced_reviews(domains=(), asin=None, stars=(), max_per_star=100):
+    """Newest max_per_star reviews per star (1–5) for the filters, sampled in Postgres.
+
+    ROW_NUMBER() OVER (PARTITION BY rating ORDER BY review_date DESC) with the country / ASIN /
+    star filters in the WHERE clause — at most 5 × max_per_star rows leave the database.
+    None if the query fails — the caller falls back to balanced_reviews() on the loaded frame.
+    """
+    try:
+        columns = _table_columns("amazon_reviews")
+        keep    = [c for c in REVIEW_TABLE_COLS if c in columns]
+        rating  = f"trunc(CASE WHEN rating::text ~ '{_NUMERIC_RE}' THEN rating::text::numeric END)"
+        where, params = [f"{rating} = ANY(:stars)"], {
+            'stars': [int(s) for s in (stars or [1, 2, 3, 4, 5]) if 1 <= int(s) <= 5], 'n': int(max_per_star)}
+        if domains and 'domain' in columns:
+            where.append("lower(trim(domain)) = ANY(:domains)"); params['domains'] = list(domains)
+        if asin and 'asin' in columns:
+            where.append("asin = :asin"); params['asin'] = asin
+        order = ", ".join((["review_date DESC NULLS LAST"] if 'review_date' in columns else [])
+                          + (["review_id"] if 'review_id' in columns else [])) or "1"
+        sql = f"""
+            SELECT {", ".join(keep)} FROM (
+                SELECT {", ".join(keep)},
+                       ROW_NUMBER() OVER (PARTITION BY {rating} ORDER BY {order}) AS rn
+                FROM amazon_reviews
+                WHERE {" AND ".join(where)}) s
+            WHERE rn <= :n
+            ORDER BY rating, rn"""
+        with db_connect() as conn:
+            df = pd.read_sql(text(sql), conn, params=params)
+        return analytics_data.prepare_reviews(df)
+    except Exception:
+        return None
+
+
+@cached_loader(ttl=CACHE_TTL)
+def load_complaint_topics():
+    """Complaint-topic counts per (asin, domain, rating) written by complaint_topics.py; empty until it has run."""
+    try:
+        sql = """SELECT a.asin, a.domain, a.rating, t.topic_id, t.label, t.terms, COUNT(*) AS reviews
+                 FROM review_topic_assignments a JOIN review_topics t USING (topic_id)
+                 GROUP BY a.asin, a.domain, a.rating, t.topic_id, t.label, t.terms"""
+        with db_connect() as conn:
+            return pd.read_sql(text(sql), conn)
+    except Exception:
+        return pd.DataFrame()
+
+
+# ---- Dataset freshness ----
+# Refresh used to st.cache_data.clear() every table for every session. Each dataset now has a
+# cheap probe (catalog write counters, no table scan); only datasets whose probe moved drop their
+# caches, and the incremental ones then re-fetch just the window past their watermark.
+# key_cols: the row's identity for incremental refresh (a row re-dated into the overlap window
+# replaces its old copy). () where rows are ledger entries with no natural key and a fixed date —
+# inventory history (SKU repeats across stores per snapshot), settlements and returns.
+DATASETS = {
+    "inventory":     {"table": "fba_inventory",       "date_col": "created_at",    "key_cols": (),
+                      "loaders": (load_inventory_dates, load_inventory_stores, load_data, load_inventory_history)},
+    "orders":        {"table": "orders",              "date_col": '"Order Date"',  "key_cols": ('Order ID', 'SKU'),
+                      "loaders": (load_orders, load_order_sku_prices, load_order_count)},
+    "settlements":   {"table": "settlements",         "date_col": '"Posted Date"', "key_cols": (),
+                      "loaders": (load_settlements,)},
+    "sales_traffic": {"table": "spapi.sales_traffic", "date_col": "report_date",   "key_cols": ('report_date', 'child_asin'),
+                      "loaders": (load_sales_traffic,)},
+    "returns":       {"table": "returns",             "date_col": '"Return Date"', "key_cols": (),
+                      "loaders": (load_returns,)},
+    "reviews":       {"table": "amazon_reviews",      "date_col": "review_date",   "key_cols": ('review_id',),
+                      "loaders": (load_reviews, search_reviews, load_balanced_reviews, load_complaint_topics)},
+}
+
+
+def probe_dataset(name):
+    """(estimated rows, change signature) of a dataset's table, read from the catalog.
+
+    The signature is relfilenode (moves on TRUNCATE/VACUUM FULL) plus the cumulative
+    insert/update/delete counters from pg_stat_user_tables, so any write changes it without
+    scanning the table. Tables without a stats row (stats off, views) fall back to MAX/COUNT.
+    """
+    ds = DATASETS[name]
+    with db_connect() as conn:
+        row = conn.execute(text("""
+            SELECT c.relfilenode, c.reltuples::bigint, s.n_live_tup, s.n_tup_ins, s.n_tup_upd, s.n_tup_del
+            FROM pg_class c LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+            WHERE c.oid = to_regclass(:t)"""), {"t": ds["table"]}).one()
+        if row.n_tup_ins is None:
+            newest, rows = conn.execute(text(f'SELECT MAX({ds["date_col"]}), COUNT(*) FROM {ds["table"]}')).one()
+            return (int(rows), ("scan", str(newest)))
+    rows = row.n_live_tup if row.n_live_tup else max(row.reltuples, 0)
+    return (int(rows), (row.relfilenode, row.n_tup_ins, row.n_tup_upd, row.n_tup_del))
+
+
+def _baseline_probe(name):
+    """Remember the probe the first time a dataset loads, so the first refresh click can compare."""
+    probes = get_dataset_store()["probes"]
+    if name in probes or not DATABASE_URL:
+        return
+    try:
+        probes[name] = probe_dataset(name)
+    except Exception:
+        pass
+
+
+def invalidate_dataset(name, full=False):
+    """Drop the cache_data entries of one dataset; full=True also forces a full re-read next load."""
+    for fn in DATASETS[name]["loaders"]:
+        fn.clear()
+    if full:
+        store = get_dataset_store()
+        with store["lock"]:
+            entry = store["frames"].get(name)
+            if entry is not None:
+                entry["full_at"] = 0
+
+
+def refresh_datasets(names=None, force=False):
+    """Probe datasets and invalidate only those that changed (or all of `names` when force).
+
+    Returns {name: 'changed' | 'unchanged' | 'probe failed'}. A failed probe invalidates too —
+    better one extra reload than stale numbers.
+    """
+    names   = list(names or DATASETS)
+    probes  = get_dataset_store()["probes"]
+    results, errors = load_parallel({n: ((lambda n=n: probe_dataset(n)), None) for n in names})
+    status = {}
+    for n in names:
+        new = results.get(n)
+        if force or n in errors or probes.get(n) != new:
+            invalidate_dataset(n, full=force)
+            status[n] = 'probe failed' if n in errors else 'changed'
+        else:
+            status[n] = 'unchanged'
+        if n not in errors:
+            probes[n] = new
+    return status
+
+
+def show_dataset_controls(t):
+    """Sidebar refresh: probe-based for everything, plus a forced full reload per dataset."""
+    if st.sidebar.button(t["update_btn"], use_container_width=True):
+        st.session_state["refresh_status"] = refresh_datasets()
+        st.rerun()
+    if not DATABASE_URL:
+        return
+    with st.sidebar.expander("🗂️ Datasets", expanded=False):
+        ls = get_change_listener()
+        if ls["enabled"]:
+            state = "connected" if ls["connected"] else f"reconnecting ({ls['error']})"
+            st.caption(f"📡 LISTEN {DB_NOTIFY_CHANNEL} · {state} · {ls['notifies']} notifications · TTL {CACHE_TTL}s")
+        status = st.session_state.get("refresh_status", {})
+        store  = get_dataset_store()
+        for name in DATASETS:
+            c1, c2 = st.columns([4, 1])
+            rows, _ = store["probes"].get(name, (None, None))
+            newest  = (store["frames"].get(name) or {}).get("watermark")
+            note = f" · {status[name]}" if name in status else ""
+            info = (f" · ~{rows:,} rows" if rows is not None else "") + (f" · {str(newest)[:16]}" if newest is not None else "")
+            c1.caption(f"**{name}**{info}{note}")
+            if c2.button("🔄", key=f"ds_refresh_{name}", help=f"Full reload: {name}"):
+                st.session_state["refresh_status"] = refresh_datasets([name], force=True)
+                st.rerun()
+
+
+# ---- Change notifications ----
+# One LISTEN connection per server process (outside the pool). The migration's statement-level
+# triggers send the changed table's name; the matching datasets are invalidated right away.
+def _table_datasets():
+    tables = {}
+    for name, ds in DATASETS.items():
+        tables.setdefault(ds["table"].split(".")[-1], []).append(name)
+    return tables
+
+
+def _handle_notify(payload):
+    """Invalidate the datasets backed by the notified table ('schema.table' or 'table')."""
+    names  = _table_datasets().get((payload or "").split(".")[-1].strip('"'), [])
+    probes = get_dataset_store()["probes"]
+    for name in names:
+        invalidate_dataset(name)
+        probes.pop(name, None)   # re-baselined on the next load
+    return names
+
+
+def _listen_loop(state):
+    import select
+    import psycopg2
+    import psycopg2.extensions as pgext
+    engine = get_engine()
+    cargs, cparams = engine.dialect.create_connect_args(engine.url)
+    backoff = 1
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(*cargs, **cparams)
+            conn.set_isolation_level(pgext.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                cur.execute(f'LISTEN "{DB_NOTIFY_CHANNEL}"')
+            with state["lock"]:
+                state.update(connected=True, error=None)
+            backoff = 1
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    with conn.cursor() as cur:   # idle: make sure the connection is still alive
+                        cur.execute("SELECT 1")
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    note  = conn.notifies.pop(0)
+                    names = _handle_notify(note.payload)
+                    with state["lock"]:
+                        state["notifies"] += 1
+                        state["last"] = (time.time(), note.payload, names)
+        except Exception as e:
+            with state["lock"]:
+                state.update(connected=False, error=str(e))
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+
+@st.cache_resource
+def get_change_listener():
+    """Start the LISTEN thread once per server process; no-op unless DB_LISTEN is set."""
+    state = {"lock": threading.Lock(), "enabled": bool(DB_LISTEN and DATABASE_URL),
+             "connected": False, "notifies": 0, "last": None, "error": None}
+    if state["enabled"]:
+        threading.Thread(target=_listen_loop, args=(state,), name="db-listen", daemon=True).start()
+    return state
+
+
+# ---- Concurrent loading ----
+LOAD_WORKERS = int(os.getenv("LOAD_WORKERS", "4"))   # keep ≤ DB_POOL_SIZE + DB_MAX_OVERFLOW
+
+
+def load_parallel(loaders, max_workers=None):
+    """Run {name: (loader, default)} concurrently on a bounded thread pool.
+
+    Returns ({name: result}, {name: error}). A loader that raises gets its default instead,
+    so one broken table can't take the rest of the page down. Worker threads inherit the
+    Streamlit script context, so cache spinners and st.error() inside loaders still render.
+    """
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+    ctx = get_script_run_ctx()
+
+    def _attach_ctx():
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+
+    results, errors = {}, {}
+    workers = max(1, min(max_workers or LOAD_WORKERS, len(loaders)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="loader", initializer=_attach_ctx) as ex:
+        futures = {name: ex.submit(fn) for name, (fn, _) in loaders.items()}
+        for name, fut in futures.items():
+            try:
+                results[name] = fut.result()
+            except Exception as e:
+                results[name], errors[name] = loaders[name][1], e
+    return results, errors
+
+
+# ---- Time-sliced datasets ----
+# Date-range filters used to compare `.dt.date` objects row by row on every rerun. A time index
+# keeps each frame sorted on its date column (once per dataset version) so a range is two
+# binary searches and a positional slice; daily group keys are computed once alongside.
+
+@st.cache_resource
+def _time_index_cache():
+    return {"lock": threading.Lock(), "indexes": {}}
+
+
+def time_index(name, df, col, version=None):
+    """{'df', 'day', 'min', 'max'} for df sorted by col, rebuilt only when the data version changes.
+
+    'day' is a Series of midnight timestamps aligned to df's index — group by it instead of
+    `df[col].dt.date`. NaT rows sort last and never fall inside a range.
+    """
+    if version is None:
+        version = dataset_version(name, df) or (len(df), str(df[col].max()) if len(df) else None)
+    cache = _time_index_cache()
+    with cache["lock"]:
+        ix = cache["indexes"].get((name, col))
+    if ix is not None and ix["version"] == version:
+        return ix
+    s = df[col]
+    if isinstance(s.dtype, pd.DatetimeTZDtype):
+        s = s.dt.tz_localize(None)   # wall-clock days, same as .dt.date
+    if s.is_monotonic_increasing:
+        sdf = df.reset_index(drop=True)
+    else:
+        order = np.argsort(s.to_numpy(), kind='stable')
+        sdf   = df.iloc[order].reset_index(drop=True)
+        s     = s.iloc[order]
+    day  = pd.Series(s.dt.normalize().to_numpy(), index=sdf.index, name=col)
+    keys = day.to_numpy().astype('datetime64[D]')
+    valid = keys[~np.isnat(keys)]
+    ix = {"version": version, "df": sdf, "day": day, "keys": keys,
+          "min": pd.Timestamp(valid[0]).date() if len(valid) else None,
+          "max": pd.Timestamp(valid[-1]).date() if len(valid) else None}
+    with cache["lock"]:
+        cache["indexes"][(name, col)] = ix
+    return ix
+
+
+def time_slice(ix, start=None, end=None):
+    """Rows with start <= day <= end (dates, inclusive; None = open) → (frame view, day keys)."""
+    keys = ix["keys"]
+    lo = 0 if start is None else int(np.searchsorted(keys, np.datetime64(start, 'D'), side='left'))
+    hi = (len(keys) - int(np.isnat(keys).sum())) if end is None else int(np.searchsorted(keys, np.datetime64(end, 'D'), side='right'))
+    return ix["df"].iloc[lo:hi], ix["day"].iloc[lo:hi]
+
+
+def time_range(ix, date_range):
+    """time_slice() for a st.date_input value; a half-picked range (one date) returns everything."""
+    if len(date_range) == 2:
+        return time_slice(ix, date_range[0], date_range[1])
+    return time_slice(ix)
+
+
 # ============================================
 # HELPERS
 # ============================================
@@ -338,11 +1261,362 @@ def insight_card(emoji, title, text, color="#1e1e2e"):
     </div>""", unsafe_allow_html=True)
 
 
+# ---- Paged tables ----
+# st.dataframe serializes every row it gets on each rerun. paged_table() sorts/filters server-side
+# over the cached frame and sends only the visible page; sort orders are memoized per data version.
+TABLE_PAGE_SIZE  = int(os.getenv("TABLE_PAGE_SIZE", "100"))
+TABLE_ORDER_KEEP = 32
+
+
+@st.cache_resource
+def _table_order_cache():
+    return {"lock": threading.Lock(), "orders": OrderedDict()}
+
+
+def _sorted_positions(df, sort_col, ascending, cache_key=None):
+    """Row positions of df ordered by sort_col (stable, NaN last); memoized when cache_key is given."""
+    key = (cache_key, sort_col, ascending) if cache_key is not None else None
+    cache = _table_order_cache()
+    if key is not None:
+        with cache["lock"]:
+            if key in cache["orders"]:
+                cache["orders"].move_to_end(key)
+                return cache["orders"][key]
+    col = df[sort_col].reset_index(drop=True)
+    try:
+        order = col.sort_values(ascending=ascending, kind='stable', na_position='last').index.to_numpy()
+    except TypeError:   # mixed object column
+        order = col.astype(str).sort_values(ascending=ascending, kind='stable', na_position='last').index.to_numpy()
+    if key is not None:
+        with cache["lock"]:
+            cache["orders"][key] = order
+            while len(cache["orders"]) > TABLE_ORDER_KEEP:
+                cache["orders"].popitem(last=False)
+    return order
+
+
+def paged_table(df, key, columns=None, sort_by=None, ascending=True, version=None,
+                page_size=None, height=None, column_config=None):
+    """Sortable, searchable table that only sends the current page to the browser.
+
+    `version` identifies the data behind df (filters + watermark); with it the sort order is
+    computed once per (key, version, column, direction) instead of every rerun.
+    Returns the positions of the filtered rows in display order.
+    """
+    columns   = [c for c in (columns or list(df.columns)) if c in df.columns]
+    page_size = page_size or TABLE_PAGE_SIZE
+    if df.empty or not columns:
+        st.info("No rows."); return np.array([], dtype=np.int64)
+
+    c1, c2, c3 = st.columns([2, 1, 3])
+    sort_opts = columns
+    sort_idx  = sort_opts.index(sort_by) if sort_by in sort_opts else 0
+    sort_col  = c1.selectbox("↕️ Sort by", sort_opts, index=sort_idx, key=f"{key}_sort")
+    asc       = c2.radio("Order", ["▲", "▼"], index=0 if ascending else 1, horizontal=True, key=f"{key}_asc") == "▲"
+    query     = c3.text_input("🔎 Search", "", key=f"{key}_q").strip()
+
+    order = _sorted_positions(df, sort_col, asc, None if version is None else (key, version))
+    if query:
+        text_cols = [c for c in columns if not pd.api.types.is_numeric_dtype(df[c])
+                     and not pd.api.types.is_datetime64_any_dtype(df[c])]
+        mask = np.zeros(len(df), dtype=bool)
+        for c in text_cols:
+            mask |= df[c].astype(str).str.contains(query, case=False, regex=False, na=False).to_numpy()
+        order = order[mask[order]]
+
+    total = len(order)
+    pages = max(1, -(-total // page_size))
+    sig = (sort_col, asc, query, version)
+    if st.session_state.get(f"{key}_sig") != sig or st.session_state.get(f"{key}_page", 1) > pages:
+        st.session_state[f"{key}_sig"], st.session_state[f"{key}_page"] = sig, 1
+    page  = st.number_input(f"Page (1–{pages})", min_value=1, max_value=pages, key=f"{key}_page") if pages > 1 else 1
+    lo    = (page - 1) * page_size
+    view  = df.iloc[order[lo:lo + page_size]][columns]
+    st.dataframe(view, use_container_width=True, hide_index=True, column_config=column_config,
+                 height=height or min(600, 38 + 35 * max(len(view), 1)))
+    st.caption(f"Rows {lo + 1 if total else 0:,}–{lo + len(view):,} of {total:,}"
+               + (f" (filtered from {len(df):,})" if query else ""))
+    return order
+
+
+# ---- Exports ----
+# Files are built only when someone asks for them, written chunk by chunk to a temp file and
+# reused for the same (export key, data version, format) until they fall out of the cache.
+EXPORT_DIR        = os.getenv("EXPORT_DIR") or os.path.join(tempfile.gettempdir(), "fba_exports")
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "50000"))
+EXPORT_KEEP       = int(os.getenv("EXPORT_KEEP", "16"))
+XLSX_MAX_ROWS     = 1_048_575   # Excel sheet limit minus the header row
+EXPORT_FORMATS = {
+    "csv":     ("CSV",     "text/csv"),
+    "xlsx":    ("Excel",   "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "parquet": ("Parquet", "application/vnd.apache.parquet"),
+}
+
+
+@st.cache_resource
+def _export_cache():
+    return {"lock": threading.Lock(), "locks": {}, "files": OrderedDict()}
+
+
+def _chunks(df, size=None):
+    size = size or EXPORT_CHUNK_ROWS
+    for lo in range(0, len(df), size):
+        yield df.iloc[lo:lo + size]
+
+
+def _write_csv(path, df):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        for i, chunk in enumerate(_chunks(df)):
+            chunk.to_csv(f, index=False, header=(i == 0))
+        if df.empty:
+            df.to_csv(f, index=False)
+
+
+def _xlsx_rows(chunk):
+    """Chunk → rows openpyxl accepts: None for NA, naive datetimes, no control characters."""
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+    chunk = chunk.copy()
+    for c in chunk.columns:
+        col = chunk[c]
+        if isinstance(col.dtype, pd.DatetimeTZDtype):
+            chunk[c] = col.dt.tz_localize(None)
+        elif not pd.api.types.is_numeric_dtype(col) and not pd.api.types.is_datetime64_any_dtype(col) \
+                and not pd.api.types.is_bool_dtype(col):
+            chunk[c] = col.astype(object).where(col.isna(), col.astype(str).str.replace(ILLEGAL_CHARACTERS_RE, '', regex=True))
+    chunk = chunk.astype(object).where(chunk.notna(), None)
+    return chunk.itertuples(index=False, name=None)
+
+
+def _write_xlsx(path, sheets):
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    for name, df in sheets.items():
+        parts = range(0, max(len(df), 1), XLSX_MAX_ROWS)
+        for p, lo in enumerate(parts):
+            ws = wb.create_sheet(title=(name if p == 0 else f"{name} ({p + 1})")[:31])
+            ws.append([str(c) for c in df.columns])
+            for chunk in _chunks(df.iloc[lo:lo + XLSX_MAX_ROWS]):
+                for row in _xlsx_rows(chunk):
+                    ws.append(row)
+    wb.save(path)
+
+
+def _write_parquet(path, df):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    writer = None
+    try:
+        for chunk in _chunks(df):
+            table = pa.Table.from_pandas(chunk, preserve_index=False,
+                                         schema=writer.schema if writer is not None else None)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # a later chunk didn't fit the first chunk's inferred types (e.g. all-null object column)
+        if writer is not None:
+            writer.close(); writer = None
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path)
+    finally:
+        if writer is not None:
+            writer.close()
+    if df.empty:
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path)
+
+
+def _frames_version(sheets):
+    """Content hash of {sheet: frame}, for callers that have no data version to pass."""
+    h = hashlib.sha1()
+    for name, df in sheets.items():
+        try:
+            rows = pd.util.hash_pandas_object(df, index=False).to_numpy()
+        except TypeError:   # unhashable cells (lists, dicts)
+            rows = pd.util.hash_pandas_object(df.astype(str), index=False).to_numpy()
+        h.update(repr((name, list(map(str, df.columns)), len(df))).encode())
+        h.update(rows.tobytes())
+    return h.hexdigest()
+
+
+def build_export(sheets, fmt, key, version=None):
+    """Write {sheet: frame} as fmt ('csv' | 'xlsx' | 'parquet') and return the file path.
+
+    CSV/Parquet hold a single table, so only the first sheet is written. The file is cached on
+    (key, version, fmt, sheet names); a repeat request returns the existing path. Without a
+    version the frames' content hash is used, so unchanged data is still not rebuilt.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"unknown export format: {fmt}")
+    if fmt != "xlsx":
+        sheets = dict([next(iter(sheets.items()))])
+    if version is None:
+        version = ("content", _frames_version(sheets))
+    ckey  = (key, version, fmt, tuple(sheets))
+    cache = _export_cache()
+    with cache["lock"]:
+        lock = cache["locks"].setdefault(ckey, threading.Lock())
+    with lock:
+        with cache["lock"]:
+            path = cache["files"].get(ckey)
+            if path and os.path.exists(path):
+                cache["files"].move_to_end(ckey)
+                return path
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        digest = hashlib.sha1(repr(ckey).encode()).hexdigest()[:16]
+        path   = os.path.join(EXPORT_DIR, f"{key}_{digest}.{fmt}")
+        tmp    = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            if fmt == "csv":
+                _write_csv(tmp, next(iter(sheets.values())))
+            elif fmt == "xlsx":
+                _write_xlsx(tmp, sheets)
+            else:
+                _write_parquet(tmp, next(iter(sheets.values())))
+            os.replace(tmp, path)
+        except Exception:
+            with cache["lock"]:
+                if ckey not in cache["files"]:
+                    cache["locks"].pop(ckey, None)
+            raise
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        with cache["lock"]:
+            cache["files"][ckey] = path
+            while len(cache["files"]) > EXPORT_KEEP:
+                old_key, old = cache["files"].popitem(last=False)
+                cache["locks"].pop(old_key, None)
+                if old != path and old not in cache["files"].values() and os.path.exists(old):
+                    os.remove(old)
+        return path
+
+
+def _export_ready(sheets, fmt, key, version):
+    if fmt != "xlsx":
+        sheets = dict([next(iter(sheets.items()))])
+    path = _export_cache()["files"].get((key, version, fmt, tuple(sheets)))
+    return path if path and os.path.exists(path) else None
+
+
+def export_buttons(sheets, key, file_stem, version, t=None, formats=("csv", "xlsx", "parquet")):
+    """Prepare/download buttons per format; nothing is serialized until a Prepare click.
+
+    sheets: {sheet name: frame} (callables are evaluated only when building). Excel gets every
+    sheet; CSV/Parquet get the first one. version identifies the data behind `sheets` (dataset
+    version + filters); a built file is offered straight away while it matches.
+    """
+    cols = st.columns(len(formats))
+    for col, fmt in zip(cols, formats):
+        label, mime = EXPORT_FORMATS[fmt]
+        if fmt == "xlsx" and t is not None:
+            label = t["download_excel"].replace("📥", "").strip()
+        with col:
+            path = _export_ready(sheets, fmt, key, version)
+            if path is None and st.session_state.get(f"{key}_{fmt}_build"):
+                with st.spinner(f"{label}…"):
+                    built = {n: (f() if callable(f) else f) for n, f in sheets.items()}
+                    path  = build_export(built, fmt, key, version)
+            if path is None:
+                st.button(f"⚙️ {label}", key=f"{key}_{fmt}_build", use_container_width=True)
+            else:
+                rebuild = functools.partial(_rebuild_export, sheets, fmt, key, version)
+                st.download_button(f"📥 {label}", _deferred_file(path, rebuild), f"{file_stem}.{fmt}", mime,
+                                   key=f"{key}_{fmt}_dl", use_container_width=True)
+
+
+def _rebuild_export(sheets, fmt, key, version):
+    return build_export({n: (f() if callable(f) else f) for n, f in sheets.items()}, fmt, key, version)
+
+
+def _read_export(path, rebuild):
+    """File bytes; rebuilds the file if EXPORT_KEEP evicted it since the button was drawn."""
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        with open(rebuild(), "rb") as f:
+            return f.read()
+
+
+def _deferred_file(path, rebuild):
+    """Let the browser fetch the bytes on click where Streamlit supports callable data."""
+    if _DOWNLOAD_DEFERRED:
+        return functools.partial(_read_export, path, rebuild)
+    return _read_export(path, rebuild)
+
+
+def _download_accepts_callable():
+    try:
+        data = typing.get_type_hints(st.download_button)["data"]
+    except Exception:
+        return False
+    return any(typing.get_origin(a) is Callable for a in typing.get_args(data))
+
+
+_DOWNLOAD_DEFERRED = _download_accepts_callable()
+
+
 def balanced_reviews(df, max_per_star=100):
     parts = [df[df['rating'] == s].head(max_per_star) for s in [1, 2, 3, 4, 5]]
     return pd.concat(parts, ignore_index=True) if parts else df
 
 
+_ATTR_RE = r'(?:^|,)\s*(?P<key>[^:,]+?)\s*:\s*(?P<value>[^,]*?)\s*(?=,|$)'
+
+
+def parse_product_attributes(s):
+    """'Size: M, Color: Red, Style: Zip' → one column per key (title-cased), aligned to s.index.
+
+    One regex pass over the whole column (str.extractall) + a pivot — no per-row Python.
+    Missing keys are NaN; the first occurrence of a repeated key wins.
+    """
+    s = s.fillna('').astype(str)
+    pairs = s.str.extractall(_ATTR_RE)
+    if pairs.empty:
+        return pd.DataFrame(index=s.index)
+    pairs = pairs.droplevel('match').reset_index(names='_row')
+    pairs['key']   = pairs['key'].str.strip().str.title()
+    pairs['value'] = pairs['value'].str.strip()
+    pairs = pairs[(pairs['key'] != '') & (pairs['value'] != '')].drop_duplicates(['_row', 'key'])
+    wide  = pairs.pivot(index='_row', columns='key', values='value')
+    wide.columns.name = None
+    return wide.reindex(s.index)
+
+
+@st.cache_resource
+def _review_attr_cache():
+    return {"lock": threading.Lock(), "versions": OrderedDict()}
+
+
+def review_attributes(df):
+    """Parsed product_attributes for df's rows, cached per reviews data version and review_id.
+
+    Only review IDs not seen before are parsed; everything else is a reindex of the cache.
+    The last two data versions are kept (a refresh starts a new one, so edited attributes are
+    re-parsed); frames without a version are parsed every time.
+    """
+    if 'product_attributes' not in df.columns:
+        return pd.DataFrame(index=df.index)
+    version = dataset_version("reviews", df)
+    if 'review_id' not in df.columns or version is None:
+        return parse_product_attributes(df['product_attributes'])
+    cache = _review_attr_cache()
+    ids   = df['review_id']
+    with cache["lock"]:
+        known = cache["versions"].pop(version, pd.DataFrame())
+        new   = ~ids.isin(known.index)
+        if new.any():
+            fresh = parse_product_attributes(df.loc[new, 'product_attributes'])
+            fresh.index = ids[new].to_numpy()
+            fresh = fresh[~fresh.index.duplicated()]
+            known = pd.concat([known, fresh]) if not known.empty else fresh
+        cache["versions"][version] = known
+        while len(cache["versions"]) > 2:
+            cache["versions"].popitem(last=False)
+    out = known.reindex(ids.to_numpy())
+    out.index = df.index
+    return out.dropna(axis=1, how='all')
+
+
 DOMAIN_LABELS = {
     'com':    '🇺🇸 USA (com)',
     'ca':     '🇨🇦 Canada (ca)',
@@ -364,162 +1638,43 @@ DOMAIN_LABELS = {
 # INSIGHT FUNCTIONS
 # ============================================
 
-def insights_sales_traffic(df_filtered, asin_stats):
+def render_insights(cards, title="### 🧠 Автоматические инсайты"):
+    """Two-column insight cards from analytics.*_insights()."""
     st.markdown("---")
-    st.markdown("### 🧠 Автоматические инсайты")
-    total_sessions = int(df_filtered['sessions'].sum())
-    total_units    = int(df_filtered['units_ordered'].sum())
-    total_revenue  = df_filtered['ordered_product_sales'].sum()
-    avg_conv       = (total_units / total_sessions * 100) if total_sessions > 0 else 0
-    avg_buy_box    = df_filtered['buy_box_percentage'].mean()
-    mob            = df_filtered['mobile_sessions'].sum() if 'mobile_sessions' in df_filtered.columns else 0
-    bro            = df_filtered['browser_sessions'].sum() if 'browser_sessions' in df_filtered.columns else 0
-    mobile_pct     = (mob / (mob + bro) * 100) if (mob + bro) > 0 else 0
-    avg_conv_all   = asin_stats['Conv %'].median()
-    low_conv       = asin_stats[(asin_stats['Sessions'] > asin_stats['Sessions'].median()) & (asin_stats['Conv %'] < avg_conv_all)]
-    low_bb         = asin_stats[asin_stats['Buy Box %'] < 80]
-    rev_per_sess   = total_revenue / total_sessions if total_sessions > 0 else 0
+    st.markdown(title)
     cols = st.columns(2)
-    i = 0
-    if avg_conv >= 12:   txt, em, col = f"Конверсия <b>{avg_conv:.1f}%</b> — выше нормы. Масштабируй рекламу!", "🟢", "#0d2b1e"
-    elif avg_conv >= 8:  txt, em, col = f"Конверсия <b>{avg_conv:.1f}%</b> — в норме. Потенциал через A+.", "🟡", "#2b2400"
-    else:                txt, em, col = f"Конверсия <b>{avg_conv:.1f}%</b> — ниже нормы. Проверь фото и цену.", "🔴", "#2b0d0d"
-    with cols[i%2]: insight_card(em, "Конверсия", txt, col); i+=1
-    if avg_buy_box >= 95:  txt, em, col = f"Buy Box <b>{avg_buy_box:.1f}%</b> — отлично!", "🟢", "#0d2b1e"
-    elif avg_buy_box >= 80: txt, em, col = f"Buy Box <b>{avg_buy_box:.1f}%</b> — норма. {len(low_bb)} ASINов теряют.", "🟡", "#2b2400"
-    else:                   txt, em, col = f"Buy Box <b>{avg_buy_box:.1f}%</b> — критично! Проверь репрайсер.", "🔴", "#2b0d0d"
-    with cols[i%2]: insight_card(em, "Buy Box", txt, col); i+=1
-    txt = f"<b>{mobile_pct:.0f}%</b> мобильного трафика {'— норма.' if mobile_pct >= 60 else '— ниже среднего ~65%.'}"
-    with cols[i%2]: insight_card("📱", "Мобайл", txt, "#1a1a2e"); i+=1
-    if len(low_conv) > 0:
-        top = low_conv.nlargest(1,'Sessions').iloc[0]
-        txt, em, col = f"<b>{len(low_conv)} ASINов</b> с высоким трафиком и низкой конверсией. Критичный: <b>{top['ASIN']}</b>.", "🔴", "#2b0d0d"
-    else: txt, em, col = "Все ASINы с высоким трафиком конвертят хорошо!", "🟢", "#0d2b1e"
-    with cols[i%2]: insight_card(em, "Упущенная выручка", txt, col); i+=1
-    with cols[i%2]: insight_card("💡", "Цена сессии", f"Каждая сессия → <b>${rev_per_sess:.2f}</b>. +1000 сессий = +${rev_per_sess*1000:,.0f}.", "#1a1a2e"); i+=1
-    if not asin_stats.empty:
-        top = asin_stats.nlargest(1,'Revenue').iloc[0]
-        top_pct = top['Revenue']/total_revenue*100 if total_revenue > 0 else 0
-        with cols[i%2]: insight_card("🏆", "Главный ASIN", f"<b>{top['ASIN']}</b> = ${top['Revenue']:,.0f} ({top_pct:.0f}%).", "#1a2b1e")
+    for i, c in enumerate(cards):
+        with cols[i%2]: insight_card(c["emoji"], c["title"], c["text"], c["color"])
+
+
+def insights_sales_traffic(df_filtered, asin_stats):
+    render_insights(analytics.sales_traffic_insights(df_filtered, asin_stats))
 
 
 def insights_settlements(df_filtered):
-    st.markdown("---")
-    st.markdown("### 🧠 Автоматические инсайты")
-    net     = df_filtered['Amount'].sum()
-    gross   = df_filtered[(df_filtered['Transaction Type']=='Order')&(df_filtered['Amount']>0)]['Amount'].sum()
-    fees    = df_filtered[(df_filtered['Amount']<0)&(df_filtered['Transaction Type']!='Refund')&(~df_filtered['Transaction Type'].str.lower().str.contains('other',na=False))]['Amount'].sum()
-    refunds = df_filtered[df_filtered['Transaction Type']=='Refund']['Amount'].sum()
-    fee_pct    = abs(fees)/gross*100 if gross>0 else 0
-    refund_pct = abs(refunds)/gross*100 if gross>0 else 0
-    margin_pct = net/gross*100 if gross>0 else 0
-    cols = st.columns(2); i = 0
-    if margin_pct >= 30:  txt, em, col = f"Маржа <b>{margin_pct:.1f}%</b> — отлично!", "🟢", "#0d2b1e"
-    elif margin_pct >= 15: txt, em, col = f"Маржа <b>{margin_pct:.1f}%</b> — норма для FBA.", "🟡", "#2b2400"
-    else:                  txt, em, col = f"Маржа <b>{margin_pct:.1f}%</b> — низко! Анализируй расходы.", "🔴", "#2b0d0d"
-    with cols[i%2]: insight_card(em, "Чистая маржа", txt, col); i+=1
-    if fee_pct <= 30:  txt, em, col = f"Комиссии <b>{fee_pct:.1f}%</b> — в норме.", "🟢", "#0d2b1e"
-    elif fee_pct <= 40: txt, em, col = f"Комиссии <b>{fee_pct:.1f}%</b> — немного высоко.", "🟡", "#2b2400"
-    else:               txt, em, col = f"Комиссии <b>{fee_pct:.1f}%</b> — слишком высоко!", "🔴", "#2b0d0d"
-    with cols[i%2]: insight_card(em, "Нагрузка комиссий", txt, col); i+=1
-    if refund_pct <= 3:  txt, em, col = f"Возвраты <b>{refund_pct:.1f}%</b> — отлично.", "🟢", "#0d2b1e"
-    elif refund_pct <= 8: txt, em, col = f"Возвраты <b>{refund_pct:.1f}%</b> — умеренно.", "🟡", "#2b2400"
-    else:                 txt, em, col = f"Возвраты <b>{refund_pct:.1f}%</b> — критично!", "🔴", "#2b0d0d"
-    with cols[i%2]: insight_card(em, "Возвраты", txt, col); i+=1
-    with cols[i%2]: insight_card("💰", "Итог", f"Продажи <b>${gross:,.0f}</b> → на руки <b>${net:,.0f}</b>. Комиссии: ${abs(fees):,.0f}.", "#1a1a2e")
+    render_insights(analytics.settlements_insights(df_filtered))
 
 
 def insights_returns(df_filtered, return_rate):
-    st.markdown("---")
-    st.markdown("### 🧠 Автоматические инсайты")
-    total_val  = df_filtered['Return Value'].sum()
-    top_reason = df_filtered['Reason'].value_counts().index[0] if 'Reason' in df_filtered.columns and not df_filtered.empty else None
-    top_sku    = df_filtered['SKU'].value_counts().index[0] if not df_filtered.empty else None
-    cols = st.columns(2); i = 0
-    if return_rate <= 3:  txt, em, col = f"Возвраты <b>{return_rate:.1f}%</b> — отлично.", "🟢", "#0d2b1e"
-    elif return_rate <= 8: txt, em, col = f"Возвраты <b>{return_rate:.1f}%</b> — приемлемо.", "🟡", "#2b2400"
-    else:                  txt, em, col = f"Возвраты <b>{return_rate:.1f}%</b> — опасно!", "🔴", "#2b0d0d"
-    with cols[i%2]: insight_card(em, "Уровень возвратов", txt, col); i+=1
-    with cols[i%2]: insight_card("💸", "Ущерб", f"Возвраты стоят <b>${total_val:,.0f}</b>.", "#2b1a00"); i+=1
-    if top_reason:
-        with cols[i%2]: insight_card("🔍", "Главная причина", f"<b>«{top_reason}»</b>", "#1a1a2e"); i+=1
-    if top_sku:
-        count = df_filtered['SKU'].value_counts().iloc[0]
-        with cols[i%2]: insight_card("⚠️", "Проблемный SKU", f"<b>{top_sku}</b> ({count} возвратов).", "#2b0d0d")
+    render_insights(analytics.returns_insights(df_filtered, return_rate))
 
 
 def insights_inventory(df_filtered):
-    st.markdown("---")
-    st.markdown("### 🧠 Автоматические инсайты")
-    total_val   = df_filtered['Stock Value'].sum()
-    total_units = df_filtered['Available'].sum()
-    avg_vel     = df_filtered['Velocity'].mean() if 'Velocity' in df_filtered.columns else 0
-    top_frozen  = df_filtered.nlargest(1,'Stock Value').iloc[0] if not df_filtered.empty else None
-    dead_stock  = df_filtered[df_filtered['Velocity']==0] if 'Velocity' in df_filtered.columns else pd.DataFrame()
-    cols = st.columns(2); i = 0
-    months = int(total_units/avg_vel/30) if avg_vel > 0 else 0
-    with cols[i%2]: insight_card("🧊","Заморозка капитала",f"Заморожено <b>${total_val:,.0f}</b>. Запас на {months if avg_vel>0 else '∞'} мес.","#1a1a2e"); i+=1
-    if top_frozen is not None:
-        pct = top_frozen['Stock Value']/total_val*100 if total_val > 0 else 0
-        with cols[i%2]: insight_card("🏦","Главный актив",f"<b>{top_frozen['SKU']}</b> держит ${top_frozen['Stock Value']:,.0f} ({pct:.0f}%).","#1a2b1e"); i+=1
-    if len(dead_stock) > 0:
-        dead_val = dead_stock['Stock Value'].sum()
-        with cols[i%2]: insight_card("☠️","Мёртвый сток",f"<b>{len(dead_stock)} SKU</b> без продаж — ${dead_val:,.0f}. Рассмотри ликвидацию.","#2b0d0d"); i+=1
-    days = int(total_units/(avg_vel*30)*30) if avg_vel > 0 else 999
-    if days <= 30:   txt, em, col = f"Запасов на <b>{days} дней</b> — риск out of stock!", "🔴", "#2b0d0d"
-    elif days <= 60: txt, em, col = f"Запасов на <b>{days} дней</b> — планируй поставку.", "🟡", "#2b2400"
-    else:            txt, em, col = f"Запасов на <b>{days} дней</b> — достаточно.", "🟢", "#0d2b1e"
-    with cols[i%2]: insight_card(em,"Оборачиваемость",txt,col)
+    render_insights(analytics.inventory_insights(df_filtered))
 
 
 def insights_orders(df_filtered):
-    st.markdown("---")
-    st.markdown("### 🧠 Автоматические инсайты")
-    total_rev    = df_filtered['Total Price'].sum()
-    total_orders = df_filtered['Order ID'].nunique()
-    avg_order    = total_rev/total_orders if total_orders > 0 else 0
-    days         = max((df_filtered['Order Date'].max()-df_filtered['Order Date'].min()).days,1)
-    rev_per_day  = total_rev/days
-    top_sku      = df_filtered.groupby('SKU')['Total Price'].sum().nlargest(1)
-    cols = st.columns(2); i = 0
-    with cols[i%2]: insight_card("🛒","Средний чек",f"<b>${avg_order:.2f}</b>. +10% к AOV = +${total_rev*0.1:,.0f}.","#1a1a2e"); i+=1
-    with cols[i%2]: insight_card("📈","Дневная выручка",f"<b>${rev_per_day:,.0f}/день</b>. Прогноз на месяц: ${rev_per_day*30:,.0f}.","#1a2b1e"); i+=1
-    if not top_sku.empty:
-        sku_name, sku_rev = top_sku.index[0], top_sku.iloc[0]
-        pct = sku_rev/total_rev*100 if total_rev > 0 else 0
-        with cols[i%2]: insight_card("⚡","Концентрация риска",f"<b>{sku_name}</b> = {pct:.0f}% (${sku_rev:,.0f}). Диверсифицируй.","#2b1a00")
-
-
-def insights_reviews(df, asin=None):
-    st.markdown("---")
+    render_insights(analytics.orders_insights(df_filtered))
+
+
+def insights_reviews(cube, asin=None, topics=None):
     label = f"ASIN {asin}" if asin else "всем ASINам"
-    st.markdown(f"### 🧠 Інсайти по {label}")
-    total = len(df)
-    if total == 0:
+    cards = analytics.reviews_insights(cube, asin, topics)
+    if not cards:
+        st.markdown("---"); st.markdown(f"### 🧠 Інсайти по {label}")
         st.info("Нет данных для инсайтов.")
         return
-    avg_rating = df['rating'].mean()
-    neg_df     = df[df['rating'] <= 2]
-    pos_df     = df[df['rating'] >= 4]
-    neg_pct    = len(neg_df)/total*100
-    pos_pct    = len(pos_df)/total*100
-    cols = st.columns(2); i = 0
-    if avg_rating >= 4.4:   txt, em, col = f"Средний балл <b>{avg_rating:.1f}★</b> — отлично! Сильное социальное доверие.", "🟢", "#0d2b1e"
-    elif avg_rating >= 4.0: txt, em, col = f"Средний балл <b>{avg_rating:.1f}★</b> — норма, риск упасть ниже 4.0.", "🟡", "#2b2400"
-    else:                   txt, em, col = f"Средний балл <b>{avg_rating:.1f}★</b> — критично! Режет конверсию и удорожает PPC.", "🔴", "#2b0d0d"
-    with cols[i%2]: insight_card(em,"Здоровье рейтинга",txt,col); i+=1
-    if neg_pct <= 10:  txt, em, col = f"Всего <b>{neg_pct:.1f}%</b> негативных (1-2★). Продукт оправдывает ожидания.", "🟢", "#0d2b1e"
-    elif neg_pct <= 20: txt, em, col = f"<b>{neg_pct:.1f}%</b> негативных — системная проблема. Читай тексты 1★.", "🟡", "#2b2400"
-    else:               txt, em, col = f"<b>{neg_pct:.1f}%</b> негативных — критично! Срочно фикси продукт или листинг.", "🔴", "#2b0d0d"
-    with cols[i%2]: insight_card(em,"Уровень негатива",txt,col); i+=1
-    with cols[i%2]: insight_card("💚","Лояльность",f"<b>{pos_pct:.1f}%</b> позитивных (4-5★). База лояльных покупателей.","#0d2b1e" if pos_pct>=70 else "#2b2400"); i+=1
-    if 'is_verified' in df.columns:
-        ver_pct = df['is_verified'].mean()*100
-        with cols[i%2]: insight_card("✅","Верификация",f"<b>{ver_pct:.1f}%</b> верифицированы {'— высокое доверие у Amazon.' if ver_pct>=80 else '— следи за политикой.'}","#1a1a2e"); i+=1
-    if asin is None and not neg_df.empty and 'asin' in neg_df.columns:
-        worst = neg_df['asin'].value_counts()
-        if not worst.empty:
-            with cols[i%2]: insight_card("⚠️","Токсичный ASIN",f"<b>{worst.index[0]}</b> — {worst.iloc[0]} негативных. Начни анализ с него.","#2b0d0d")
+    render_insights(cards, f"### 🧠 Інсайти по {label}")
 
 
 # ============================================
@@ -531,35 +1686,28 @@ def show_overview_insights(df_inventory):
     st.markdown("## 🧠 Business Intelligence: Зведені інсайти")
     st.caption("Автоматичний аналіз всіх модулів")
 
-    df_settlements = load_settlements()
-    df_st          = load_sales_traffic()
-    df_orders      = load_orders()
-    df_ret_raw, df_ord_raw = load_returns()
-    df_reviews     = load_reviews()
+    data, errors = load_parallel({
+        "settlements":   (load_settlements,      pd.DataFrame()),
+        "sales_traffic": (load_sales_traffic,    pd.DataFrame()),
+        "orders":        (load_orders,           pd.DataFrame()),
+        "returns":       (load_returns,          pd.DataFrame()),
+        "reviews":       (load_reviews,          pd.DataFrame()),
+        "sku_prices":    (load_order_sku_prices, pd.Series(dtype=float)),
+        "order_count":   (load_order_count,      0),
+    })
+    for name, err in errors.items():
+        st.warning(f"⚠️ {name}: {err}")
+    df_settlements = data["settlements"]
+    df_st          = data["sales_traffic"]
+    df_orders      = data["orders"]
+    df_ret_raw     = data["returns"]
+    df_reviews     = data["reviews"]
 
     df_returns  = pd.DataFrame()
     return_rate = 0
     if not df_ret_raw.empty:
-        df_ret = df_ret_raw.copy()
-        df_ret['Return Date'] = pd.to_datetime(df_ret['Return Date'], errors='coerce')
-        if 'Price' not in df_ret.columns and not df_ord_raw.empty:
-            for col in ['Item Price','item-price','item_price','price']:
-                if col in df_ord_raw.columns:
-                    df_ord_raw[col] = pd.to_numeric(df_ord_raw[col], errors='coerce')
-                    df_ret['Price'] = df_ret['SKU'].map(df_ord_raw.groupby('SKU')[col].mean()).fillna(0)
-                    break
-        if 'Price' not in df_ret.columns: df_ret['Price'] = 0
-        df_ret['Price']        = pd.to_numeric(df_ret['Price'], errors='coerce').fillna(0)
-        df_ret['Quantity']     = pd.to_numeric(df_ret.get('Quantity',1), errors='coerce').fillna(1)
-        df_ret['Return Value'] = df_ret['Price'] * df_ret['Quantity']
-        df_returns = df_ret
-        if not df_ord_raw.empty:
-            for col in ['Order ID','order-id','order_id','OrderID']:
-                if col in df_ord_raw.columns:
-                    total_orders = df_ord_raw[col].nunique()
-                    unique_ret   = df_returns['Order ID'].nunique() if 'Order ID' in df_returns.columns else 0
-                    return_rate  = unique_ret/total_orders*100 if total_orders > 0 else 0
-                    break
+        df_returns  = analytics.return_values(df_ret_raw, data["sku_prices"])
+        return_rate = analytics.return_rate(df_returns, data["order_count"])
 
     tabs = st.tabs(["💰 Inventory","🏦 Settlements","📈 Sales & Traffic","🛒 Orders","📦 Returns","⭐ Reviews"])
 
@@ -570,39 +1718,27 @@ def show_overview_insights(df_inventory):
 
     with tabs[1]:
         if not df_settlements.empty:
-            max_d  = df_settlements['Posted Date'].max()
-            df_s30 = df_settlements[df_settlements['Posted Date'] >= max_d - dt.timedelta(days=30)]
-            insights_settlements(df_s30 if not df_s30.empty else df_settlements)
+            insights_settlements(analytics.recent(df_settlements, 'Posted Date', 30))
         else: st.info("🏦 Дані по виплатах відсутні.")
 
     with tabs[2]:
         if not df_st.empty:
-            max_d   = df_st['report_date'].max()
-            df_use  = df_st[df_st['report_date'] >= max_d - dt.timedelta(days=14)]
-            df_use  = df_use if not df_use.empty else df_st
-            asin_col = 'child_asin' if 'child_asin' in df_use.columns else df_use.columns[0]
-            as_ = df_use.groupby(asin_col).agg({'sessions':'sum','units_ordered':'sum','ordered_product_sales':'sum','buy_box_percentage':'mean'}).reset_index()
-            as_.columns = ['ASIN','Sessions','Units','Revenue','Buy Box %']
-            as_['Conv %'] = (as_['Units']/as_['Sessions']*100).fillna(0)
-            insights_sales_traffic(df_use, as_)
+            df_use = analytics.recent(df_st, 'report_date', 14)
+            insights_sales_traffic(df_use, analytics.asin_stats(df_use))
         else: st.info("📈 Дані Sales & Traffic відсутні.")
 
     with tabs[3]:
         if not df_orders.empty:
-            max_d  = df_orders['Order Date'].max()
-            df_o30 = df_orders[df_orders['Order Date'] >= max_d - dt.timedelta(days=30)]
-            insights_orders(df_o30 if not df_o30.empty else df_orders)
+            insights_orders(analytics.recent(df_orders, 'Order Date', 30))
         else: st.info("🛒 Дані замовлень відсутні.")
 
     with tabs[4]:
         if not df_returns.empty:
-            max_d  = df_returns['Return Date'].max()
-            df_r30 = df_returns[df_returns['Return Date'] >= max_d - dt.timedelta(days=30)]
-            insights_returns(df_r30 if not df_r30.empty else df_returns, return_rate)
+            insights_returns(analytics.recent(df_returns, 'Return Date', 30), return_rate)
         else: st.info("📦 Дані повернень відсутні.")
 
     with tabs[5]:
-        if not df_reviews.empty: insights_reviews(df_reviews, asin=None)
+        if not df_reviews.empty: insights_reviews(review_cube(df_reviews), asin=None)
         else: st.info("⭐ Дані відгуків відсутні.")
 
 
@@ -612,34 +1748,46 @@ def show_overview_insights(df_inventory):
 
 
 
+@st.cache_resource
+def _review_cube_cache():
+    return {"lock": threading.Lock(), "cubes": OrderedDict()}
+
+
+def review_cube(df):
+    """analytics.rating_cube(df), built once per reviews data version."""
+    version = dataset_version("reviews", df) or (len(df), str(df['review_date'].max()) if 'review_date' in df.columns and len(df) else None)
+    cache = _review_cube_cache()
+    with cache["lock"]:
+        cube = cache["cubes"].get(version)
+    if cube is None:
+        cube = analytics.rating_cube(df)
+        with cache["lock"]:
+            cache["cubes"][version] = cube
+            while len(cache["cubes"]) > 4:
+                cache["cubes"].popitem(last=False)
+    return cube
+
+
 def make_amazon_url(domain, asin):
     """Build Amazon product URL from domain code and ASIN."""
     return f"https://www.amazon.{domain}/dp/{asin}"
 
 
-def show_global_insights(df, has_domain):
+def show_global_insights(cube, has_domain):
     """Big visual insight block: worst/best ASIN and country with mini progress bars."""
     st.markdown("### 🧠 Автоінсайти")
 
-    asin_stats, dom_stats = None, None
+    asin_stats, dom_stats, combo = None, None, None
 
-    if 'asin' in df.columns:
-        asin_stats = df.groupby('asin').agg(
-            Reviews=('rating', 'count'),
-            Rating=('rating', 'mean'),
-            Neg=('rating', lambda x: (x <= 2).sum()),
-        ).reset_index()
-        asin_stats['Neg %'] = (asin_stats['Neg'] / asin_stats['Reviews'] * 100).round(1)
+    if 'asin' in cube.columns:
+        asin_stats = analytics.cube_stats(cube, 'asin')
         asin_stats = asin_stats[asin_stats['Reviews'] >= 5]
 
-    if has_domain and 'domain' in df.columns:
-        dom_stats = df.groupby('domain').agg(
-            Reviews=('rating', 'count'),
-            Rating=('rating', 'mean'),
-            Neg=('rating', lambda x: (x <= 2).sum()),
-        ).reset_index()
-        dom_stats['Neg %'] = (dom_stats['Neg'] / dom_stats['Reviews'] * 100).round(1)
+    if has_domain and 'domain' in cube.columns:
+        dom_stats = analytics.cube_stats(cube, 'domain')
         dom_stats = dom_stats[dom_stats['Reviews'] >= 5]
+        if 'asin' in cube.columns:
+            combo = analytics.cube_stats(cube, ['asin', 'domain'])
 
     col1, col2, col3, col4 = st.columns(4)
 
@@ -650,18 +1798,18 @@ def show_global_insights(df, has_domain):
 
         # Find which country worst ASIN belongs to
         worst_asin_country = ""
-        if has_domain and 'domain' in df.columns:
-            asin_dom = df[df['asin'] == worst_a['asin']].groupby('domain')['rating'].count()
+        if combo is not None:
+            asin_dom = combo[combo['asin'] == worst_a['asin']]
             if not asin_dom.empty:
-                top_dom = asin_dom.idxmax()
+                top_dom = asin_dom.loc[asin_dom['Reviews'].idxmax(), 'domain']
                 worst_asin_country = DOMAIN_LABELS.get(top_dom, top_dom)
 
         # Find which country best ASIN belongs to
         best_asin_country = ""
-        if has_domain and 'domain' in df.columns:
-            asin_dom2 = df[df['asin'] == best_a['asin']].groupby('domain')['rating'].count()
+        if combo is not None:
+            asin_dom2 = combo[combo['asin'] == best_a['asin']]
             if not asin_dom2.empty:
-                top_dom2 = asin_dom2.idxmax()
+                top_dom2 = asin_dom2.loc[asin_dom2['Reviews'].idxmax(), 'domain']
                 best_asin_country = DOMAIN_LABELS.get(top_dom2, top_dom2)
 
         neg_pct = worst_a['Neg %']
@@ -711,29 +1859,17 @@ def show_global_insights(df, has_domain):
 
         # Find which ASIN pulls worst country down
         worst_country_asin = ""
-        if 'asin' in df.columns:
-            df_wdom = df[df['domain'] == worst_d['domain']]
-            if not df_wdom.empty:
-                per_asin = df_wdom.groupby('asin').agg(
-                    Neg=('rating', lambda x: (x<=2).sum()),
-                    Reviews=('rating','count')
-                ).reset_index()
-                per_asin['Neg %'] = per_asin['Neg'] / per_asin['Reviews'] * 100
-                per_asin = per_asin[per_asin['Reviews'] >= 3]
-                if not per_asin.empty:
-                    worst_country_asin = per_asin.loc[per_asin['Neg %'].idxmax(), 'asin']
+        if combo is not None:
+            per_asin = combo[(combo['domain'] == worst_d['domain']) & (combo['Reviews'] >= 3)]
+            if not per_asin.empty:
+                worst_country_asin = per_asin.loc[(per_asin['Neg'] / per_asin['Reviews']).idxmax(), 'asin']
 
         # Find which ASIN lifts best country up
         best_country_asin = ""
-        if 'asin' in df.columns:
-            df_bdom = df[df['domain'] == best_d['domain']]
-            if not df_bdom.empty:
-                per_asin2 = df_bdom.groupby('asin').agg(
-                    Rating=('rating','mean'), Reviews=('rating','count')
-                ).reset_index()
-                per_asin2 = per_asin2[per_asin2['Reviews'] >= 3]
-                if not per_asin2.empty:
-                    best_country_asin = per_asin2.loc[per_asin2['Rating'].idxmax(), 'asin']
+        if combo is not None:
+            per_asin2 = combo[(combo['domain'] == best_d['domain']) & (combo['Reviews'] >= 3)]
+            if not per_asin2.empty:
+                best_country_asin = per_asin2.loc[per_asin2['Rating'].idxmax(), 'asin']
 
         neg_pct = worst_d['Neg %']
         bar_color = "#F44336" if neg_pct > 20 else "#FFC107"
@@ -774,16 +1910,20 @@ def show_global_insights(df, has_domain):
             </div>""", unsafe_allow_html=True)
 
 
-def show_single_asin_detail(df_asin, asin, has_domain):
-    """Detailed block for ONE selected ASIN: rating by country, star dist, top neg reviews."""
-    total = len(df_asin)
+def show_single_asin_detail(df_asin, cube, asin, has_domain):
+    """Detailed block for ONE selected ASIN: rating by country, star dist, top neg reviews.
+
+    Aggregates come from the ASIN's rating cube rows; df_asin is only read for review texts.
+    """
+    tot   = analytics.cube_totals(cube)
+    total = tot["reviews"]
     if total == 0:
         st.info("Немає відгуків по цьому ASIN.")
         return
 
-    avg_r   = df_asin['rating'].mean()
-    neg_cnt = int((df_asin['rating'] <= 2).sum())
-    pos_cnt = int((df_asin['rating'] >= 4).sum())
+    avg_r   = tot["avg_rating"]
+    neg_cnt = tot["neg"]
+    pos_cnt = tot["pos"]
     neg_pct = neg_cnt / total * 100
 
     # ---- Mini KPI row ----
@@ -819,8 +1959,7 @@ def show_single_asin_detail(df_asin, asin, has_domain):
     # ---- Star distribution ----
     with col1:
         st.markdown("#### ⭐ Розподіл зірок")
-        star_counts = df_asin['rating'].value_counts().reindex([5,4,3,2,1]).fillna(0).reset_index()
-        star_counts.columns = ['Stars', 'Count']
+        star_counts = pd.DataFrame({'Stars': [5,4,3,2,1], 'Count': [tot["stars"][s] for s in [5,4,3,2,1]]})
         star_counts['Pct'] = (star_counts['Count'] / total * 100).round(1)
         star_counts['label'] = star_counts['Stars'].astype(str) + '★'
         color_map = {5:'#4CAF50',4:'#8BC34A',3:'#FFC107',2:'#FF9800',1:'#F44336'}
@@ -834,17 +1973,13 @@ def show_single_asin_detail(df_asin, asin, has_domain):
             yaxis=dict(categoryorder='array', categoryarray=['1★','2★','3★','4★','5★']),
             height=260, margin=dict(l=5,r=60,t=10,b=10)
         )
-        st.plotly_chart(fig, use_container_width=True)
+        plotly_chart(fig, use_container_width=True)
 
     # ---- Rating by country (if domain available) ----
     with col2:
-        if has_domain and 'domain' in df_asin.columns and df_asin['domain'].nunique() > 1:
+        if has_domain and 'domain' in cube.columns and cube['domain'].nunique() > 1:
             st.markdown("#### 🌍 Рейтинг по країнах для цього ASIN")
-            dom_s = df_asin.groupby('domain').agg(
-                Reviews=('rating','count'), Rating=('rating','mean'),
-                Neg=('rating', lambda x: (x<=2).sum())
-            ).reset_index()
-            dom_s['Neg %'] = (dom_s['Neg']/dom_s['Reviews']*100).round(1)
+            dom_s = analytics.cube_stats(cube, 'domain')
             dom_s['Country'] = dom_s['domain'].map(lambda x: DOMAIN_LABELS.get(x, x))
             dom_s = dom_s.sort_values('Rating', ascending=True)
             colors = ['#F44336' if r<4.0 else '#FFC107' if r<4.4 else '#4CAF50' for r in dom_s['Rating']]
@@ -856,17 +1991,16 @@ def show_single_asin_detail(df_asin, asin, has_domain):
             ))
             fig2.add_vline(x=4.0, line_dash="dash", line_color="orange")
             fig2.update_layout(height=260, xaxis_range=[1,5.8], margin=dict(l=5,r=80,t=10,b=10))
-            st.plotly_chart(fig2, use_container_width=True)
+            plotly_chart(fig2, use_container_width=True)
         else:
             st.markdown("#### 📊 Рейтинг по часу")
-            if 'review_date' in df_asin.columns:
-                df_time = df_asin.dropna(subset=['review_date']).copy()
-                df_time['month'] = df_time['review_date'].dt.to_period('M').astype(str)
-                monthly = df_time.groupby('month')['rating'].mean().reset_index()
+            if 'month' in cube.columns:
+                monthly = analytics.cube_stats(cube, 'month')
+                monthly = pd.DataFrame({'month': monthly['month'].dt.strftime('%Y-%m'), 'rating': monthly['Rating']})
                 fig_t = px.line(monthly, x='month', y='rating', markers=True)
                 fig_t.add_hline(y=4.0, line_dash='dash', line_color='orange')
                 fig_t.update_layout(height=260, yaxis_range=[1,5])
-                st.plotly_chart(fig_t, use_container_width=True)
+                plotly_chart(fig_t, use_container_width=True)
 
     # ---- Top negative reviews ----
     st.markdown("#### 🔴 Останні негативні відгуки (1-2★)")
@@ -891,22 +2025,17 @@ def show_single_asin_detail(df_asin, asin, has_domain):
         st.success("🎉 Негативних відгуків немає!")
 
 
-def show_asin_links_table(df, has_domain):
+def show_asin_links_table(cube, has_domain):
     """Show dataframe of all ASINs with clickable Amazon links + row selection → triggers ASIN detail view."""
     st.markdown("### 🔗 Всі ASINи — огляд по країнах")
     st.caption("👆 Клікни на рядок — побачиш детальний аналіз цього ASIN · Посилання відкриють Amazon у новій вкладці")
 
-    if 'asin' not in df.columns:
+    if 'asin' not in cube.columns:
         st.info("Немає даних про ASINи.")
         return None, None
 
-    if has_domain and 'domain' in df.columns:
-        combos = df.groupby(['asin', 'domain']).agg(
-            Reviews=('rating', 'count'),
-            Rating=('rating', 'mean'),
-            Neg=('rating', lambda x: (x <= 2).sum()),
-        ).reset_index()
-        combos['Neg %'] = (combos['Neg'] / combos['Reviews'] * 100).round(1)
+    if has_domain and 'domain' in cube.columns:
+        combos = analytics.cube_stats(cube, ['asin', 'domain'])
         combos['Country'] = combos['domain'].map(lambda x: DOMAIN_LABELS.get(x, f'🌍 {x}'))
         combos['🔗 Amazon'] = combos.apply(
             lambda r: f"https://www.amazon.{r['domain']}/dp/{r['asin']}", axis=1
@@ -916,12 +2045,7 @@ def show_asin_links_table(df, has_domain):
             columns={'asin': 'ASIN', 'domain': '_domain'}
         ).reset_index(drop=True)
     else:
-        asin_stats = df.groupby('asin').agg(
-            Reviews=('rating', 'count'),
-            Rating=('rating', 'mean'),
-            Neg=('rating', lambda x: (x <= 2).sum()),
-        ).reset_index()
-        asin_stats['Neg %'] = (asin_stats['Neg'] / asin_stats['Reviews'] * 100).round(1)
+        asin_stats = analytics.cube_stats(cube, 'asin')
         asin_stats['🔗 Amazon'] = asin_stats['asin'].apply(lambda a: f"https://www.amazon.com/dp/{a}")
         asin_stats['_domain'] = 'com'
         table_df = asin_stats[['asin', 'Reviews', 'Rating', 'Neg %', '_domain', '🔗 Amazon']].rename(
@@ -965,6 +2089,101 @@ def show_asin_links_table(df, has_domain):
     return None, None
 
 
+def show_complaint_topics(domains, asin, stars):
+    """🧩 What 1–3★ reviews complain about, from the complaint_topics.py tables. Returns the summary."""
+    all_topics = load_complaint_topics()
+    if all_topics.empty:
+        return None
+    if stars:
+        stars = [s for s in stars if s <= 3]
+        if not stars:   # only 4-5★ selected — no complaints to show
+            return None
+    topics = analytics.topic_summary(all_topics, domains, asin, stars)
+    st.markdown("---")
+    st.markdown("### 🧩 На що скаржаться (1-3★)")
+    if topics.empty:
+        st.info("Немає скарг за цими фільтрами.")
+        return topics
+    col1, col2 = st.columns(2)
+    with col1:
+        top = topics.head(10).iloc[::-1]
+        fig = go.Figure(go.Bar(x=top['reviews'], y=top['label'], orientation='h', marker_color='#F44336',
+                               text=[f"{s:.0f}%" for s in top['share']], textposition='outside',
+                               hovertext=top['terms'], hoverinfo='text+x'))
+        fig.update_layout(height=max(280, len(top) * 38), margin=dict(l=10, r=50, t=20, b=20))
+        plotly_chart(fig, use_container_width=True)
+    with col2:
+        if asin is None:
+            st.markdown("#### 📦 Головна скарга по ASINах")
+            t = all_topics
+            if domains: t = t[t['domain'].isin(domains)]
+            if stars:   t = t[t['rating'].isin(stars)]
+            per = t.groupby(['asin', 'label'], as_index=False)['reviews'].sum()
+            tot = per.groupby('asin')['reviews'].transform('sum')
+            per['Частка %'] = (per['reviews'] / tot * 100).round(1)
+            per = per.sort_values('reviews', ascending=False).drop_duplicates('asin')
+            per = per.assign(Скарг=tot.loc[per.index]).nlargest(15, 'Скарг')
+            st.dataframe(per[['asin', 'label', 'Частка %', 'Скарг']].rename(columns={'asin': 'ASIN', 'label': 'Тема'}),
+                         use_container_width=True, hide_index=True)
+        else:
+            st.dataframe(topics[['label', 'reviews', 'share', 'terms']].rename(
+                columns={'label': 'Тема', 'reviews': 'Скарг', 'share': 'Частка %', 'terms': 'Ключові слова'}).round(1),
+                use_container_width=True, hide_index=True)
+    return topics
+
+
+def _snippet_html(s):
+    return html.escape(s or "").replace(_MARK_ON, "<mark>").replace(_MARK_OFF, "</mark>")
+
+
+def show_review_search(domains, asin, stars):
+    """🔎 Full-text search box over all reviews, honouring the sidebar country/ASIN/star filters."""
+    st.markdown("---")
+    st.markdown("### 🔎 Пошук у відгуках")
+    query = st.text_input("Слова або фраза", "", key="rev_search",
+                          placeholder='zipper broke · "stopped working" · battery -charger').strip()
+    if not query:
+        st.caption("Пошук по заголовку і тексту всіх відгуків: \"фраза\", or, -виключити.")
+        return
+    sig = (query, tuple(domains), asin, tuple(stars))
+    if st.session_state.get("rev_search_sig") != sig:
+        st.session_state["rev_search_sig"], st.session_state["rev_search_page"] = sig, 1
+    page = st.session_state.get("rev_search_page", 1)
+    try:
+        total, hits = search_reviews(query, tuple(domains), asin, tuple(stars), page)
+    except Exception as e:
+        st.warning(f"⚠️ Пошук недоступний: {e}")
+        return
+    if total == 0:
+        st.info("Нічого не знайдено.")
+        return
+    pages = max(1, -(-total // REVIEW_SEARCH_PAGE))
+    if page > pages:   # fewer matches since the page was chosen (data refresh)
+        st.session_state["rev_search_page"] = page = pages
+        total, hits = search_reviews(query, tuple(domains), asin, tuple(stars), page)
+    c1, c2 = st.columns([3, 1])
+    c1.caption(f"Знайдено {total:,} відгуків · сторінка {page} з {pages}"
+               + ("" if review_search_indexed() else " · ⚠️ без індексу (migrations/review_search.sql)"))
+    if pages > 1:
+        c2.number_input("Сторінка", 1, pages, key="rev_search_page", label_visibility="collapsed")
+    for _, row in hits.iterrows():
+        r = int(row.get('rating', 0) or 0)
+        meta = " · ".join(str(x) for x in [
+            str(row['review_date'])[:10] if pd.notna(row.get('review_date')) else '',
+            row.get('asin', ''), DOMAIN_LABELS.get(row.get('domain', ''), row.get('domain', '')) if 'domain' in hits.columns else '',
+        ] if x)
+        color = "#F44336" if r <= 2 else "#FFC107" if r == 3 else "#4CAF50"
+        st.markdown(f"""
+        <div style="background:#1e1e2e;border-left:4px solid {color};border-radius:8px;padding:12px 16px;margin-bottom:8px">
+          <div style="display:flex;justify-content:space-between;margin-bottom:6px">
+            <span style="color:{color};font-weight:700">{'★' * r + '☆' * (5 - r)}</span>
+            <span style="color:#666;font-size:12px">{html.escape(meta)}</span>
+          </div>
+          <div style="color:#fff;font-weight:600;margin-bottom:4px">{html.escape(row.get('title', '') or '')}</div>
+          <div style="color:#aaa;font-size:13px;line-height:1.5">{_snippet_html(row.get('snippet'))}</div>
+        </div>""", unsafe_allow_html=True)
+
+
 def show_reviews(t):
     df_all = load_reviews()
     if df_all.empty:
@@ -972,6 +2191,7 @@ def show_reviews(t):
         return
 
     has_domain = 'domain' in df_all.columns
+    cube_all   = review_cube(df_all)
 
     # ---- SIDEBAR FILTERS ----
     st.sidebar.markdown("---")
@@ -980,7 +2200,7 @@ def show_reviews(t):
     # 1. Country filter
     selected_domains = []
     if has_domain:
-        all_domains = sorted(df_all['domain'].dropna().unique().tolist())
+        all_domains = sorted(cube_all['domain'].dropna().unique().tolist())
         domain_display_list = [DOMAIN_LABELS.get(d, f'🌍 {d}') for d in all_domains]
         display_to_code = {DOMAIN_LABELS.get(d, f'🌍 {d}'): d for d in all_domains}
         sel_domain_display = st.sidebar.multiselect(
@@ -992,10 +2212,8 @@ def show_reviews(t):
     # Check if user clicked a row in the table (jump override)
     jumped_asin = st.session_state.pop('rev_asin_jump', None)
 
-    df_for_asin = df_all.copy()
-    if selected_domains:
-        df_for_asin = df_for_asin[df_for_asin['domain'].isin(selected_domains)]
-    asins = sorted(df_for_asin['asin'].dropna().unique().tolist()) if 'asin' in df_for_asin.columns else []
+    cube_dom = analytics.cube_filter(cube_all, selected_domains)
+    asins = sorted(cube_dom['asin'].dropna().unique().tolist()) if 'asin' in cube_dom.columns else []
     asin_options = ['🌐 Всі ASINи'] + asins
 
     # If jumped from table click → preselect that ASIN
@@ -1013,7 +2231,7 @@ def show_reviews(t):
     if selected_asin and has_domain:
         st.sidebar.markdown("---")
         st.sidebar.markdown("**🔗 Відкрити на Amazon:**")
-        asin_domains = sorted(df_all[df_all['asin'] == selected_asin]['domain'].dropna().unique().tolist())
+        asin_domains = sorted(cube_all.loc[cube_all['asin'] == selected_asin, 'domain'].dropna().unique().tolist())
         for dom in asin_domains:
             url = make_amazon_url(dom, selected_asin)
             flag = DOMAIN_LABELS.get(dom, '🌍').split(' ')[0]
@@ -1025,7 +2243,14 @@ def show_reviews(t):
             st.rerun()
 
     # ---- APPLY FILTERS ----
-    df = df_all.copy()
+    # Aggregates read the cube; review rows are only sliced for texts, variants and the table.
+    cube = analytics.cube_filter(cube_dom, asins=[selected_asin] if selected_asin else None, stars=star_filter)
+    tot  = analytics.cube_totals(cube)
+    if tot["reviews"] == 0:
+        st.warning("Немає відгуків за цими фільтрами.")
+        return
+
+    df = df_all
     if selected_domains:
         df = df[df['domain'].isin(selected_domains)]
     if selected_asin:
@@ -1033,17 +2258,14 @@ def show_reviews(t):
     if star_filter:
         df = df[df['rating'].isin(star_filter)]
 
-    if df.empty:
-        st.warning("Немає відгуків за цими фільтрами.")
-        return
-
     # ---- HEADER + KPI ----
     asin_label    = selected_asin if selected_asin else "Всі ASINи"
     country_label = ", ".join([DOMAIN_LABELS.get(d, d) for d in selected_domains]) if selected_domains else "Всі країни"
 
     # Title with link if specific ASIN selected
     if selected_asin:
-        first_domain = df['domain'].dropna().iloc[0] if has_domain and not df.empty else 'com'
+        dom_counts   = cube.groupby('domain')['n'].sum() if has_domain else pd.Series(dtype=int)
+        first_domain = dom_counts.idxmax() if not dom_counts.empty else 'com'
         amazon_url = make_amazon_url(first_domain, selected_asin)
         st.markdown(
             f"### {t['reviews_title']} — "
@@ -1054,14 +2276,14 @@ def show_reviews(t):
     else:
         st.markdown(f"### {t['reviews_title']} — {asin_label} | 🌍 {country_label}")
 
-    total_revs   = len(df)
-    avg_rating   = df['rating'].mean()
-    verified_pct = df['is_verified'].mean() * 100 if 'is_verified' in df.columns and total_revs > 0 else 0
-    neg_count    = int((df['rating'] <= 2).sum())
-    pos_count    = int((df['rating'] >= 4).sum())
+    total_revs   = tot["reviews"]
+    avg_rating   = tot["avg_rating"]
+    verified_pct = tot["verified_pct"] or 0
+    neg_count    = tot["neg"]
+    pos_count    = tot["pos"]
 
-    total_asins = df['asin'].nunique() if 'asin' in df.columns else 0
-    total_asins_db = df_all['asin'].nunique() if 'asin' in df_all.columns else 0
+    total_asins    = tot["asins"]
+    total_asins_db = analytics.cube_totals(cube_all)["asins"]
 
     c1, c2, c3, c4, c5, c6 = st.columns(6)
     c1.metric(t["total_reviews"],     f"{total_revs:,}")
@@ -1078,7 +2300,7 @@ def show_reviews(t):
     # ============================================
     # 🧠 AUTO INSIGHTS — big visual cards
     # ============================================
-    show_global_insights(df_all if selected_asin is None else df, has_domain)
+    show_global_insights(cube_all if selected_asin is None else cube, has_domain)
 
     st.markdown("---")
 
@@ -1086,7 +2308,7 @@ def show_reviews(t):
     # 📦 SINGLE ASIN DETAIL (when ASIN selected)
     # ============================================
     if selected_asin is not None:
-        show_single_asin_detail(df, selected_asin, has_domain)
+        show_single_asin_detail(df, cube, selected_asin, has_domain)
         st.markdown("---")
 
     # ============================================
@@ -1095,14 +2317,7 @@ def show_reviews(t):
     if has_domain and selected_asin is None:
         st.markdown("### 🌍 Аналіз по країнах")
 
-        domain_stats = df.groupby('domain').agg(
-            Reviews=('rating', 'count'),
-            Rating=('rating', 'mean'),
-            Neg=('rating', lambda x: (x <= 2).sum()),
-            Pos=('rating', lambda x: (x >= 4).sum()),
-        ).reset_index()
-        domain_stats['Neg %'] = (domain_stats['Neg'] / domain_stats['Reviews'] * 100).round(1)
-        domain_stats['Pos %'] = (domain_stats['Pos'] / domain_stats['Reviews'] * 100).round(1)
+        domain_stats = analytics.cube_stats(cube, 'domain')
         domain_stats['Country'] = domain_stats['domain'].map(lambda x: DOMAIN_LABELS.get(x, f'🌍 {x}'))
 
         col1, col2, col3 = st.columns(3)
@@ -1118,7 +2333,7 @@ def show_reviews(t):
             fig.add_vline(x=4.0, line_dash="dash", line_color="orange", annotation_text="4.0")
             fig.update_layout(height=max(280, len(ds_sort) * 50), xaxis_range=[1, 5.5],
                               margin=dict(l=10, r=60, t=20, b=20))
-            st.plotly_chart(fig, use_container_width=True)
+            plotly_chart(fig, use_container_width=True)
 
         with col2:
             st.markdown("#### 🔴 % Негативних по країнах")
@@ -1130,14 +2345,14 @@ def show_reviews(t):
                 text=[f"{v:.1f}%" for v in ds_neg['Neg %']], textposition='outside'
             ))
             fig2.update_layout(height=max(280, len(ds_neg) * 50), margin=dict(l=10, r=60, t=20, b=20))
-            st.plotly_chart(fig2, use_container_width=True)
+            plotly_chart(fig2, use_container_width=True)
 
         with col3:
             st.markdown("#### 📊 Відгуків по країнах")
             fig3 = px.pie(domain_stats, values='Reviews', names='Country', hole=0.4,
                           color_discrete_sequence=px.colors.qualitative.Set3)
             fig3.update_layout(height=max(280, len(domain_stats) * 50))
-            st.plotly_chart(fig3, use_container_width=True)
+            plotly_chart(fig3, use_container_width=True)
 
         st.markdown("#### 📋 Зведена таблиця по країнах")
         disp = domain_stats[['Country', 'Reviews', 'Rating', 'Neg %', 'Pos %']].sort_values('Rating', ascending=False)
@@ -1150,13 +2365,13 @@ def show_reviews(t):
         )
 
         # 🔥 Heatmap ASIN × Country
-        if 'asin' in df.columns and df['domain'].nunique() > 1:
+        if 'asin' in cube.columns and domain_stats['domain'].nunique() > 1:
             st.markdown("---")
             st.markdown("### 🔥 Теплова карта: ASIN × Країна")
             st.caption("Клікни на ASIN у таблиці нижче — відкриється його сторінка на Amazon")
 
-            pivot = df.groupby(['asin', 'domain'])['rating'].mean().reset_index()
-            pivot_table = pivot.pivot(index='asin', columns='domain', values='rating')
+            pivot = analytics.cube_stats(cube, ['asin', 'domain'])
+            pivot_table = pivot.pivot(index='asin', columns='domain', values='Rating')
             pivot_table.columns = [DOMAIN_LABELS.get(c, f'🌍 {c}') for c in pivot_table.columns]
 
             fig_heat = go.Figure(data=go.Heatmap(
@@ -1174,7 +2389,7 @@ def show_reviews(t):
                 xaxis_title="Країна", yaxis_title="ASIN",
                 margin=dict(l=20, r=20, t=30, b=20)
             )
-            st.plotly_chart(fig_heat, use_container_width=True)
+            plotly_chart(fig_heat, use_container_width=True)
             st.caption("🟢 ≥4.4★ відмінно · 🟡 4.0–4.4★ норма · 🔴 <4.0★ проблема")
 
         st.markdown("---")
@@ -1183,7 +2398,7 @@ def show_reviews(t):
     # 🔗 CLICKABLE AMAZON LINKS TABLE
     # ============================================
     if selected_asin is None:
-        clicked_asin, clicked_domain = show_asin_links_table(df, has_domain)
+        clicked_asin, clicked_domain = show_asin_links_table(cube, has_domain)
         # If user clicked a row → jump to that ASIN's detail view
         if clicked_asin:
             st.session_state['rev_asin_jump'] = clicked_asin
@@ -1193,17 +2408,11 @@ def show_reviews(t):
     # ============================================
     # ASIN COMPARISON
     # ============================================
-    if selected_asin is None and 'asin' in df.columns:
+    if selected_asin is None and 'asin' in cube.columns:
         st.markdown("### 📊 Порівняння ASINів")
 
-        asin_stats = df.groupby('asin').agg(
-            Reviews=('rating', 'count'),
-            Rating=('rating', 'mean'),
-            Neg=('rating', lambda x: (x <= 2).sum()),
-            Pos=('rating', lambda x: (x >= 4).sum()),
-        ).reset_index()
-        asin_stats.columns = ['ASIN', 'Відгуків', 'Рейтинг', 'Негативних', 'Позитивних']
-        asin_stats['Neg %'] = (asin_stats['Негативних'] / asin_stats['Відгуків'] * 100).round(1)
+        asin_stats = analytics.cube_stats(cube, 'asin')[['asin', 'Reviews', 'Rating', 'Neg', 'Pos', 'Neg %']]
+        asin_stats.columns = ['ASIN', 'Відгуків', 'Рейтинг', 'Негативних', 'Позитивних', 'Neg %']
 
         col1, col2 = st.columns(2)
         with col1:
@@ -1217,7 +2426,7 @@ def show_reviews(t):
             ))
             fig.add_vline(x=4.0, line_dash="dash", line_color="orange", annotation_text="Поріг 4.0")
             fig.update_layout(height=max(300, len(asin_sort) * 38), xaxis_range=[1, 5.5])
-            st.plotly_chart(fig, use_container_width=True)
+            plotly_chart(fig, use_container_width=True)
 
         with col2:
             st.markdown("#### 🔴 % Негативних по ASINах")
@@ -1229,7 +2438,7 @@ def show_reviews(t):
                 text=[f"{v:.1f}%" for v in asin_neg['Neg %']], textposition='outside'
             ))
             fig2.update_layout(height=max(300, len(asin_neg) * 38))
-            st.plotly_chart(fig2, use_container_width=True)
+            plotly_chart(fig2, use_container_width=True)
 
         st.markdown("#### 📋 Зведена таблиця по ASINах")
         st.dataframe(
@@ -1240,94 +2449,65 @@ def show_reviews(t):
             use_container_width=True
         )
 
-        # Variant breakdown
-        if 'product_attributes' in df.columns:
+        # Variant breakdown — any "key: value" attribute, not just Size/Color
+        attrs = review_attributes(df) if 'product_attributes' in df.columns else pd.DataFrame()
+        if not attrs.empty:
             st.markdown("---")
-            st.markdown("### 🎨 Які варіанти (Size / Color) збирають негатив?")
-
-            df_attr = df.copy()
-            df_attr['product_attributes'] = df_attr['product_attributes'].fillna('').astype(str)
-
-            def parse_attr(s):
-                size, color = None, None
-                for part in s.split(','):
-                    part = part.strip()
-                    if part.lower().startswith('size:'):
-                        size = part.split(':', 1)[1].strip()
-                    elif part.lower().startswith('color:'):
-                        color = part.split(':', 1)[1].strip()
-                return pd.Series({'Size': size or 'N/A', 'Color': color or 'N/A'})
-
-            parsed = df_attr['product_attributes'].apply(parse_attr)
-            df_attr = pd.concat([df_attr.reset_index(drop=True), parsed], axis=1)
-
-            col1, col2 = st.columns(2)
-            with col1:
-                st.markdown("#### 📏 Рейтинг по Size")
-                size_stats = df_attr[df_attr['Size'] != 'N/A'].groupby('Size').agg(
+            st.markdown("### 🎨 Які варіанти збирають негатив?")
+
+            attr_keys = attrs.notna().sum().sort_values(ascending=False).index.tolist()
+            default   = [k for k in ['Size', 'Color'] if k in attr_keys] or attr_keys[:2]
+            sel_attrs = st.multiselect("🏷️ Атрибути варіанту:", attr_keys, default=default, key="rev_attrs")
+
+            df_attr = pd.concat([df[['asin', 'rating']] if 'asin' in df.columns else df[['rating']],
+                                 attrs[sel_attrs].fillna('N/A')], axis=1)
+
+            cols = st.columns(2)
+            for i, attr in enumerate(sel_attrs):
+                with cols[i % 2]:
+                    st.markdown(f"#### 🏷️ Рейтинг по {attr}")
+                    a_stats = df_attr[df_attr[attr] != 'N/A'].groupby(attr).agg(
+                        Відгуків=('rating', 'count'),
+                        Рейтинг=('rating', 'mean'),
+                        Neg=('rating', lambda x: (x <= 2).sum()),
+                    ).reset_index()
+                    a_stats['Neg %'] = (a_stats['Neg'] / a_stats['Відгуків'] * 100).round(1)
+                    a_stats = a_stats[a_stats['Відгуків'] >= 3].sort_values('Рейтинг', ascending=True)
+                    if not a_stats.empty:
+                        colors_a = ['#F44336' if r < 3.5 else '#FFC107' if r < 4.2 else '#4CAF50' for r in a_stats['Рейтинг']]
+                        fig_a = go.Figure(go.Bar(
+                            x=a_stats['Рейтинг'], y=a_stats[attr], orientation='h',
+                            marker_color=colors_a,
+                            text=[f"{r:.2f}★ ({n:.0f}% neg)" for r, n in zip(a_stats['Рейтинг'], a_stats['Neg %'])],
+                            textposition='outside',
+                        ))
+                        fig_a.add_vline(x=4.0, line_dash="dash", line_color="orange")
+                        fig_a.update_layout(height=max(280, len(a_stats) * 40), xaxis_range=[1, 5.8])
+                        plotly_chart(fig_a, use_container_width=True)
+                    else:
+                        st.info(f"Недостатньо даних по {attr}")
+
+            if sel_attrs:
+                st.markdown("#### ⚠️ Топ проблемних варіантів (рейтинг < 4.0, мін. 3 відгуки)")
+                df_v = df_attr[df_attr[sel_attrs[0]] != 'N/A']
+                group_cols = (['asin'] if 'asin' in df_v.columns else []) + sel_attrs
+                var_group = df_v.groupby(group_cols).agg(
                     Відгуків=('rating', 'count'),
                     Рейтинг=('rating', 'mean'),
                     Neg=('rating', lambda x: (x <= 2).sum()),
                 ).reset_index()
-                size_stats['Neg %'] = (size_stats['Neg'] / size_stats['Відгуків'] * 100).round(1)
-                size_stats = size_stats[size_stats['Відгуків'] >= 3].sort_values('Рейтинг', ascending=True)
-                if not size_stats.empty:
-                    colors_s = ['#F44336' if r < 3.5 else '#FFC107' if r < 4.2 else '#4CAF50' for r in size_stats['Рейтинг']]
-                    fig_s = go.Figure(go.Bar(
-                        x=size_stats['Рейтинг'], y=size_stats['Size'], orientation='h',
-                        marker_color=colors_s,
-                        text=[f"{r:.2f}★ ({n:.0f}% neg)" for r, n in zip(size_stats['Рейтинг'], size_stats['Neg %'])],
-                        textposition='outside',
-                    ))
-                    fig_s.add_vline(x=4.0, line_dash="dash", line_color="orange")
-                    fig_s.update_layout(height=max(280, len(size_stats) * 40), xaxis_range=[1, 5.8])
-                    st.plotly_chart(fig_s, use_container_width=True)
+                var_group['Neg %'] = (var_group['Neg'] / var_group['Відгуків'] * 100).round(1)
+                problem = var_group[(var_group['Рейтинг'] < 4.0) & (var_group['Відгуків'] >= 3)].sort_values('Neg %', ascending=False).head(20)
+                if not problem.empty:
+                    st.dataframe(
+                        problem.style
+                            .format({'Рейтинг': '{:.2f}', 'Neg %': '{:.1f}%'})
+                            .background_gradient(subset=['Рейтинг'], cmap='RdYlGn')
+                            .background_gradient(subset=['Neg %'], cmap='RdYlGn_r'),
+                        use_container_width=True
+                    )
                 else:
-                    st.info("Недостатньо даних по розмірах")
-
-            with col2:
-                st.markdown("#### 🎨 Рейтинг по Color")
-                color_stats = df_attr[df_attr['Color'] != 'N/A'].groupby('Color').agg(
-                    Відгуків=('rating', 'count'),
-                    Рейтинг=('rating', 'mean'),
-                    Neg=('rating', lambda x: (x <= 2).sum()),
-                ).reset_index()
-                color_stats['Neg %'] = (color_stats['Neg'] / color_stats['Відгуків'] * 100).round(1)
-                color_stats = color_stats[color_stats['Відгуків'] >= 3].sort_values('Рейтинг', ascending=True)
-                if not color_stats.empty:
-                    colors_c = ['#F44336' if r < 3.5 else '#FFC107' if r < 4.2 else '#4CAF50' for r in color_stats['Рейтинг']]
-                    fig_c = go.Figure(go.Bar(
-                        x=color_stats['Рейтинг'], y=color_stats['Color'], orientation='h',
-                        marker_color=colors_c,
-                        text=[f"{r:.2f}★ ({n:.0f}% neg)" for r, n in zip(color_stats['Рейтинг'], color_stats['Neg %'])],
-                        textposition='outside',
-                    ))
-                    fig_c.add_vline(x=4.0, line_dash="dash", line_color="orange")
-                    fig_c.update_layout(height=max(280, len(color_stats) * 40), xaxis_range=[1, 5.8])
-                    st.plotly_chart(fig_c, use_container_width=True)
-                else:
-                    st.info("Недостатньо даних по кольорах")
-
-            st.markdown("#### ⚠️ Топ проблемних варіантів (рейтинг < 4.0, мін. 3 відгуки)")
-            df_v = df_attr[df_attr['Size'] != 'N/A'].copy()
-            group_cols = ['asin', 'Size', 'Color'] if 'asin' in df_v.columns else ['Size', 'Color']
-            var_group = df_v.groupby(group_cols).agg(
-                Відгуків=('rating', 'count'),
-                Рейтинг=('rating', 'mean'),
-                Neg=('rating', lambda x: (x <= 2).sum()),
-            ).reset_index()
-            var_group['Neg %'] = (var_group['Neg'] / var_group['Відгуків'] * 100).round(1)
-            problem = var_group[(var_group['Рейтинг'] < 4.0) & (var_group['Відгуків'] >= 3)].sort_values('Neg %', ascending=False).head(20)
-            if not problem.empty:
-                st.dataframe(
-                    problem.style
-                        .format({'Рейтинг': '{:.2f}', 'Neg %': '{:.1f}%'})
-                        .background_gradient(subset=['Рейтинг'], cmap='RdYlGn')
-                        .background_gradient(subset=['Neg %'], cmap='RdYlGn_r'),
-                    use_container_width=True
-                )
-            else:
-                st.success("🎉 Всі варіанти мають рейтинг ≥ 4.0")
+                    st.success("🎉 Всі варіанти мають рейтинг ≥ 4.0")
 
         st.markdown("---")
         st.markdown("### 📊 Загальний розподіл зірок")
@@ -1336,8 +2516,7 @@ def show_reviews(t):
     col1, col2 = st.columns(2)
     with col1:
         st.markdown(f"#### {t['star_dist']}")
-        star_counts = df['rating'].value_counts().reindex([5, 4, 3, 2, 1]).fillna(0).reset_index()
-        star_counts.columns = ['Зірки', 'Кількість']
+        star_counts = pd.DataFrame({'Зірки': [5, 4, 3, 2, 1], 'Кількість': [tot["stars"][s] for s in [5, 4, 3, 2, 1]]})
         star_counts['label'] = star_counts['Зірки'].astype(str) + '★'
         color_map = {5: '#4CAF50', 4: '#8BC34A', 3: '#FFC107', 2: '#FF9800', 1: '#F44336'}
         fig_stars = go.Figure(go.Bar(
@@ -1349,49 +2528,77 @@ def show_reviews(t):
             yaxis=dict(categoryorder='array', categoryarray=['1★', '2★', '3★', '4★', '5★']),
             height=300, margin=dict(l=10, r=40, t=20, b=20)
         )
-        st.plotly_chart(fig_stars, use_container_width=True)
+        plotly_chart(fig_stars, use_container_width=True)
 
     with col2:
         st.markdown(f"#### {t['worst_asin']}")
-        bad = df_all[df_all['rating'] <= 2]
-        if selected_domains and has_domain:
-            bad = bad[bad['domain'].isin(selected_domains)]
-        if 'asin' in bad.columns and not bad.empty:
-            bad_asins = bad['asin'].value_counts().head(8).reset_index()
+        bad = analytics.cube_stats(cube_dom, 'asin') if 'asin' in cube_dom.columns else pd.DataFrame()
+        bad = bad[bad['Neg'] > 0] if not bad.empty else bad
+        if not bad.empty:
+            bad_asins = bad.nlargest(8, 'Neg')[['asin', 'Neg']]
             bad_asins.columns = ['ASIN', 'Негативних']
             fig_bad = px.bar(bad_asins, x='ASIN', y='Негативних', text='Негативних',
                              color='Негативних', color_continuous_scale='Reds')
             fig_bad.update_layout(height=300, showlegend=False)
-            st.plotly_chart(fig_bad, use_container_width=True)
+            plotly_chart(fig_bad, use_container_width=True)
         else:
             st.success("🎉 Негативних відгуків не знайдено!")
 
-    insights_reviews(df, asin=selected_asin)
+    topics = show_complaint_topics(selected_domains, selected_asin, star_filter)
+    insights_reviews(cube, asin=selected_asin, topics=topics)
+
+    show_review_search(selected_domains, selected_asin, star_filter)
 
     # ---- Review table ----
     st.markdown("---")
-    st.markdown("### 📋 Тексти відгуків (до 100 на кожну зірку, max 500)")
+    st.markdown("### 📋 Тексти відгуків")
     st.caption("Сортування: спочатку 1★ — щоб проблеми були першими")
 
-    df_table = balanced_reviews(df, max_per_star=100).sort_values('rating', ascending=True)
+    df_table = load_balanced_reviews(tuple(selected_domains), selected_asin, tuple(star_filter), 100)
+    if df_table is None:
+        df_table = balanced_reviews(df, max_per_star=100)
+    df_table = df_table.sort_values('rating', ascending=True, kind='stable')
     display_cols   = ['review_date', 'asin', 'domain', 'rating', 'title', 'content', 'product_attributes', 'author', 'is_verified']
     available_cols = [c for c in display_cols if c in df_table.columns]
 
-    st.dataframe(df_table[available_cols], use_container_width=True, height=450)
+    view_mode = st.radio("Показати:", ["⚖️ Вибірка (до 100 на кожну зірку)", "📜 Всі відфільтровані"],
+                         horizontal=True, key="rev_view")
+    if view_mode.startswith("⚖️"):
+        rev_version = ("balanced", tuple(selected_domains), selected_asin, tuple(star_filter), len(df), str(df['review_date'].max()) if 'review_date' in df.columns else None)
+        paged_table(df_table, "rev_table", columns=available_cols, sort_by='rating', version=rev_version, height=450)
+    else:
+        rev_version = ("all", tuple(selected_domains), selected_asin, tuple(star_filter), len(df), str(df['review_date'].max()) if 'review_date' in df.columns else None)
+        paged_table(df, "rev_table_all", columns=available_cols, sort_by='rating', version=rev_version, height=450)
 
     star_summary = df_table['rating'].value_counts().sort_index(ascending=False)
     summary_str  = " | ".join([f"{s}★: {c}" for s, c in star_summary.items()])
-    st.caption(f"Показано {len(df_table)} з {len(df)} відгуків · {summary_str}")
+    st.caption(f"Вибірка {len(df_table)} з {tot['reviews']} відгуків · {summary_str}")
+
+    rev_filters = (dataset_version("reviews", df_all), tuple(selected_domains), selected_asin, tuple(star_filter))
+    st.markdown("**📥 Вибірка balanced:**")
+    export_buttons({"Balanced": df_table[available_cols]}, "reviews_balanced",
+                   f"reviews_balanced_{asin_label}", version=rev_filters, t=t)
+    st.markdown("**📥 Всі відфільтровані** (Excel: + аркуш з вибіркою):")
+    export_buttons({"Reviews": lambda: df[available_cols], "Balanced": lambda: df_table[available_cols]},
+                   "reviews_full", f"reviews_full_{asin_label}", version=rev_filters, t=t)
+
+
+def show_pool_stats():
+    if not DATABASE_URL:
+        return
+    with st.sidebar.expander("🔌 DB Pool", expanded=False):
+        try:
+            ps = pool_status()
+        except Exception as e:
+            st.caption(f"Pool unavailable: {e}")
+            return
+        c1, c2 = st.columns(2)
+        c1.metric("In use", f"{ps['checked_out']}/{ps['size'] + DB_MAX_OVERFLOW}")
+        c2.metric("Idle", ps['idle'])
+        c1.metric("Avg wait", f"{ps['wait_avg']*1000:.1f} ms")
+        c2.metric("Max wait", f"{ps['wait_max']*1000:.0f} ms")
+        st.caption(f"Checkouts: {ps['checkouts']:,} · New connections: {ps['connects']:,} · Timeouts: {ps['timeouts']}")
 
-    col1, col2 = st.columns(2)
-    with col1:
-        st.download_button("📥 Вибірка balanced (CSV)",
-            df_table[available_cols].to_csv(index=False).encode('utf-8'),
-            f"reviews_balanced_{asin_label}.csv", "text/csv")
-    with col2:
-        st.download_button("📥 Всі відфільтровані (CSV)",
-            df[available_cols].to_csv(index=False).encode('utf-8'),
-            f"reviews_full_{asin_label}.csv", "text/csv")
 
 def show_overview(df_filtered, t, selected_date):
     st.markdown("### 📊 Business Dashboard Overview")
@@ -1436,7 +2643,7 @@ def show_overview(df_filtered, t, selected_date):
         fig = px.bar(df_top, x='Available', y='SKU', orientation='h',
                      text='Available', color='Available', color_continuous_scale='Blues')
         fig.update_layout(yaxis={'categoryorder':'total ascending'}, height=400)
-        st.plotly_chart(fig, use_container_width=True)
+        plotly_chart(fig, use_container_width=True)
     show_overview_insights(df_filtered)
 
 
@@ -1445,16 +2652,12 @@ def show_sales_traffic(t):
     if df_st.empty:
         st.warning("⚠️ No Sales & Traffic data found."); return
     st.sidebar.markdown("---"); st.sidebar.subheader("📈 Sales & Traffic Filters")
-    min_date = df_st['report_date'].min().date()
-    max_date = df_st['report_date'].max().date()
+    ix = time_index("sales_traffic", df_st, 'report_date')
+    min_date, max_date = ix['min'], ix['max']
     date_range = st.sidebar.date_input("📅 Date Range:",
         value=(max(min_date, max_date-dt.timedelta(days=14)), max_date),
         min_value=min_date, max_value=max_date, key="st_date_range")
-    if len(date_range)==2:
-        mask = (df_st['report_date'].dt.date>=date_range[0])&(df_st['report_date'].dt.date<=date_range[1])
-        df_filtered = df_st[mask]
-    else:
-        df_filtered = df_st
+    df_filtered, day = time_range(ix, date_range)
     if df_filtered.empty:
         st.warning("No data for selected period"); return
     st.markdown(f"### {t['sales_traffic_title']}")
@@ -1466,7 +2669,7 @@ def show_sales_traffic(t):
     c3.metric(t["st_units"],f"{tu:,}"); c4.metric(t["st_revenue"],f"${tr:,.2f}")
     c5.metric(t["st_conversion"],f"{ac:.2f}%"); c6.metric(t["st_buy_box"],f"{ab:.1f}%")
     st.markdown("---"); st.markdown("### 📈 Daily Trends")
-    daily = df_filtered.groupby(df_filtered['report_date'].dt.date).agg(
+    daily = df_filtered.groupby(day).agg(
         {'sessions':'sum','page_views':'sum','units_ordered':'sum','ordered_product_sales':'sum'}).reset_index()
     daily.columns = ['Date','Sessions','Page Views','Units','Revenue']
     daily['Conversion %'] = (daily['Units']/daily['Sessions']*100).fillna(0)
@@ -1477,38 +2680,35 @@ def show_sales_traffic(t):
         fig.add_trace(go.Bar(x=daily['Date'],y=daily['Sessions'],name='Sessions',marker_color='#4472C4'))
         fig.add_trace(go.Scatter(x=daily['Date'],y=daily['Page Views'],name='Page Views',mode='lines+markers',line=dict(color='#ED7D31',width=2),yaxis='y2'))
         fig.update_layout(yaxis=dict(title='Sessions'),yaxis2=dict(title='Page Views',overlaying='y',side='right'),height=380,legend=dict(orientation='h',y=1.12))
-        st.plotly_chart(fig, use_container_width=True)
+        plotly_chart(fig, use_container_width=True)
     with col2:
         st.markdown("#### 💰 Revenue & Units")
         fig = go.Figure()
         fig.add_trace(go.Bar(x=daily['Date'],y=daily['Revenue'],name='Revenue $',marker_color='#70AD47'))
         fig.add_trace(go.Scatter(x=daily['Date'],y=daily['Units'],name='Units',mode='lines+markers',line=dict(color='#FFC000',width=2),yaxis='y2'))
         fig.update_layout(yaxis=dict(title='Revenue $'),yaxis2=dict(title='Units',overlaying='y',side='right'),height=380,legend=dict(orientation='h',y=1.12))
-        st.plotly_chart(fig, use_container_width=True)
+        plotly_chart(fig, use_container_width=True)
     fig_conv = go.Figure(go.Scatter(x=daily['Date'],y=daily['Conversion %'],mode='lines+markers+text',
         text=[f"{v:.1f}%" for v in daily['Conversion %']],textposition='top center',line=dict(color='#5B9BD5',width=3),marker=dict(size=8)))
     fig_conv.update_layout(height=300,yaxis_title='Conversion %')
-    st.plotly_chart(fig_conv, use_container_width=True)
+    plotly_chart(fig_conv, use_container_width=True)
     st.markdown("---"); st.markdown("### 🏆 Top ASINs Performance")
-    asin_col = 'child_asin' if 'child_asin' in df_filtered.columns else df_filtered.columns[0]
-    as_ = df_filtered.groupby(asin_col).agg({'sessions':'sum','page_views':'sum','units_ordered':'sum','ordered_product_sales':'sum','buy_box_percentage':'mean'}).reset_index()
-    as_.columns=['ASIN','Sessions','Page Views','Units','Revenue','Buy Box %']
-    as_['Conv %'] = (as_['Units']/as_['Sessions']*100).fillna(0)
+    as_ = analytics.asin_stats(df_filtered)
     col1,col2 = st.columns(2)
     with col1:
         st.markdown("#### 💰 Top 15 by Revenue")
         fig = px.bar(as_.nlargest(15,'Revenue'),x='Revenue',y='ASIN',orientation='h',text='Revenue',color='Revenue',color_continuous_scale='Greens')
         fig.update_layout(yaxis={'categoryorder':'total ascending'},height=450); fig.update_traces(texttemplate='$%{text:,.0f}',textposition='outside')
-        st.plotly_chart(fig, use_container_width=True)
+        plotly_chart(fig, use_container_width=True)
     with col2:
         st.markdown("#### 👁 Top 15 by Sessions")
         fig = px.bar(as_.nlargest(15,'Sessions'),x='Sessions',y='ASIN',orientation='h',text='Sessions',color='Sessions',color_continuous_scale='Blues')
         fig.update_layout(yaxis={'categoryorder':'total ascending'},height=450)
-        st.plotly_chart(fig, use_container_width=True)
+        plotly_chart(fig, use_container_width=True)
     st.markdown("---"); st.markdown("### 📋 Full ASIN Data")
     st.dataframe(as_.sort_values('Revenue',ascending=False).style.format({'Revenue':'${:,.2f}','Conv %':'{:.2f}%','Buy Box %':'{:.1f}%'}),use_container_width=True,height=500)
-    csv = as_.to_csv(index=False).encode('utf-8')
-    st.download_button("📥 Download CSV", csv, "sales_traffic.csv","text/csv")
+    export_buttons({"ASIN": lambda: as_.sort_values('Revenue',ascending=False), "Daily": lambda: df_filtered},
+                   "sales_traffic", "sales_traffic", version=(dataset_version("sales_traffic", df_st), tuple(date_range)), t=t)
     insights_sales_traffic(df_filtered, as_)
 
 
@@ -1519,13 +2719,11 @@ def show_settlements(t):
     st.sidebar.markdown("---"); st.sidebar.subheader("💰 Settlement Filters")
     currencies = ['All'] + sorted(df_settlements['Currency'].dropna().unique().tolist())
     sel_cur = st.sidebar.selectbox(t["currency_select"], currencies, index=1 if "USD" in currencies else 0)
-    min_date = df_settlements['Posted Date'].min().date()
-    max_date = df_settlements['Posted Date'].max().date()
+    ix = time_index("settlements", df_settlements, 'Posted Date')
+    min_date, max_date = ix['min'], ix['max']
     date_range = st.sidebar.date_input("📅 Transaction Date:",value=(max_date-dt.timedelta(days=30),max_date),min_value=min_date,max_value=max_date)
-    df_f = df_settlements.copy()
+    df_f, day = time_range(ix, date_range)
     if sel_cur != 'All': df_f = df_f[df_f['Currency']==sel_cur]
-    if len(date_range)==2:
-        df_f = df_f[(df_f['Posted Date'].dt.date>=date_range[0])&(df_f['Posted Date'].dt.date<=date_range[1])]
     if df_f.empty:
         st.warning("No data for selected filters"); return
     st.markdown(f"### {t['settlements_title']}")
@@ -1541,19 +2739,19 @@ def show_settlements(t):
     col1,col2 = st.columns([2,1])
     with col1:
         st.subheader(t['chart_payout_trend'])
-        dt_ = df_f.groupby(df_f['Posted Date'].dt.date)['Amount'].sum().reset_index()
+        dt_ = df_f.groupby(day)['Amount'].sum().reset_index()
         dt_.columns=['Date','Net Amount']
         fig = go.Figure(go.Bar(x=dt_['Date'],y=dt_['Net Amount'],marker_color=dt_['Net Amount'].apply(lambda x:'green' if x>=0 else 'red')))
         fig.update_layout(height=400,yaxis_title=f"Net Amount ({sel_cur})")
-        st.plotly_chart(fig, use_container_width=True)
+        plotly_chart(fig, use_container_width=True)
     with col2:
         st.subheader(t['chart_fee_breakdown'])
         df_costs = df_f[df_f['Amount']<0]
         if not df_costs.empty:
-            cb = df_costs.groupby('Transaction Type')['Amount'].sum().abs().reset_index()
+            cb = df_costs.groupby('Transaction Type', observed=True)['Amount'].sum().abs().reset_index()
             fig = px.pie(cb,values='Amount',names='Transaction Type',hole=0.4)
             fig.update_layout(height=400)
-            st.plotly_chart(fig, use_container_width=True)
+            plotly_chart(fig, use_container_width=True)
         else: st.info("No costs in selected period")
     disp = ['Posted Date','Transaction Type','Order ID','Amount','Currency','Description']
     st.dataframe(df_f[[c for c in disp if c in df_f.columns]].sort_values('Posted Date',ascending=False).head(100),use_container_width=True)
@@ -1561,40 +2759,23 @@ def show_settlements(t):
 
 
 def show_returns():
-    df_ret_raw, df_orders = load_returns()
+    df_ret_raw = load_returns()
     if df_ret_raw.empty:
         st.warning("⚠️ No returns data."); return
-    df_r = df_ret_raw.copy()
-    df_r['Return Date'] = pd.to_datetime(df_r['Return Date'], errors='coerce')
-    if 'Price' not in df_r.columns and not df_orders.empty:
-        try:
-            for col in ['Item Price','item-price','item_price','price','Price']:
-                if col in df_orders.columns:
-                    df_orders[col] = pd.to_numeric(df_orders[col],errors='coerce')
-                    df_r['Price'] = df_r['SKU'].map(df_orders.groupby('SKU')[col].mean()).fillna(0)
-                    break
-        except: df_r['Price'] = 0
-    elif 'Price' not in df_r.columns: df_r['Price'] = 0
-    df_r['Price']        = pd.to_numeric(df_r['Price'],errors='coerce').fillna(0)
-    df_r['Quantity']     = pd.to_numeric(df_r['Quantity'],errors='coerce').fillna(1)
-    df_r['Return Value'] = df_r['Price'] * df_r['Quantity']
+    ix = time_index("returns", df_ret_raw, 'Return Date')
     st.sidebar.markdown("---"); st.sidebar.subheader("📦 Returns Filters")
-    min_date = df_r['Return Date'].min().date(); max_date = df_r['Return Date'].max().date()
+    min_date, max_date = ix['min'], ix['max']
     date_range = st.sidebar.date_input("📅 Return Date:",value=(max_date-dt.timedelta(days=30),max_date),min_value=min_date,max_value=max_date)
     sel_store = 'All'
-    if 'Store Name' in df_r.columns:
-        stores = ['All'] + sorted(df_r['Store Name'].dropna().unique().tolist())
+    if 'Store Name' in df_ret_raw.columns:
+        stores = ['All'] + sorted(df_ret_raw['Store Name'].dropna().unique().tolist())
         sel_store = st.sidebar.selectbox("🏪 Store:", stores)
-    df_f = df_r[(df_r['Return Date'].dt.date>=date_range[0])&(df_r['Return Date'].dt.date<=date_range[1])] if len(date_range)==2 else df_r
+    df_f, day = time_range(ix, date_range)
+    df_f = analytics.return_values(df_f, load_order_sku_prices() if 'Price' not in df_f.columns else None)
     if sel_store != 'All': df_f = df_f[df_f['Store Name']==sel_store]
     st.markdown("### 📦 Returns Overview")
     rr = 0
-    try:
-        if not df_orders.empty:
-            for col in ['Order ID','order-id','order_id','OrderID']:
-                if col in df_orders.columns:
-                    rr = df_f['Order ID'].nunique()/df_orders[col].nunique()*100 if df_orders[col].nunique()>0 else 0
-                    break
+    try: rr = analytics.return_rate(df_f, load_order_count())
     except: pass
     c1,c2,c3,c4,c5 = st.columns(5)
     c1.metric("📦 Total Returns",f"{len(df_f):,}"); c2.metric("📦 Unique SKUs",df_f['SKU'].nunique())
@@ -1607,38 +2788,107 @@ def show_returns():
         tv = df_f.groupby('SKU')['Return Value'].sum().nlargest(10).reset_index()
         fig = px.bar(tv,x='Return Value',y='SKU',orientation='h',text='Return Value',color='Return Value',color_continuous_scale='Reds')
         fig.update_layout(yaxis={'categoryorder':'total ascending'},height=350); fig.update_traces(texttemplate='$%{text:,.0f}',textposition='outside')
-        st.plotly_chart(fig, use_container_width=True)
+        plotly_chart(fig, use_container_width=True)
     with col2:
         st.markdown("#### 📊 Daily Return Value")
-        dv = df_f.groupby(df_f['Return Date'].dt.date)['Return Value'].sum().reset_index(); dv.columns=['Date','Value']
+        dv = df_f.groupby(day)['Return Value'].sum().reset_index(); dv.columns=['Date','Value']
         fig = px.area(dv,x='Date',y='Value',line_shape='spline',color_discrete_sequence=['#FF6B6B'])
-        fig.update_layout(height=350); st.plotly_chart(fig, use_container_width=True)
+        fig.update_layout(height=350); plotly_chart(fig, use_container_width=True)
     with col3:
         if 'Reason' in df_f.columns:
             st.markdown("#### 💸 Return Value by Reason")
             rv = df_f.groupby('Reason')['Return Value'].sum().nlargest(8).reset_index()
             fig = px.pie(rv,values='Return Value',names='Reason',hole=0.4,color_discrete_sequence=px.colors.sequential.RdBu)
-            fig.update_layout(height=350); st.plotly_chart(fig, use_container_width=True)
+            fig.update_layout(height=350); plotly_chart(fig, use_container_width=True)
     st.markdown("---")
     col1,col2 = st.columns(2)
     with col1:
         st.markdown("#### 🏆 Top 15 Returned SKUs")
         ts = df_f['SKU'].value_counts().head(15).reset_index(); ts.columns=['SKU','Returns']
         fig = px.bar(ts,x='Returns',y='SKU',orientation='h',color='Returns',color_continuous_scale='Oranges',text='Returns')
-        fig.update_layout(yaxis={'categoryorder':'total ascending'},height=450); st.plotly_chart(fig, use_container_width=True)
+        fig.update_layout(yaxis={'categoryorder':'total ascending'},height=450); plotly_chart(fig, use_container_width=True)
     with col2:
         if 'Reason' in df_f.columns:
             st.markdown("#### 📊 Return Reasons")
             rs = df_f['Reason'].value_counts().head(10).reset_index(); rs.columns=['Reason','Count']
             fig = px.pie(rs,values='Count',names='Reason',hole=0.4,color_discrete_sequence=px.colors.sequential.RdBu)
-            fig.update_layout(height=450); st.plotly_chart(fig, use_container_width=True)
+            fig.update_layout(height=450); plotly_chart(fig, use_container_width=True)
     st.markdown("---")
     dc = ['Return Date','SKU','Product Name','Quantity','Price','Return Value','Reason','Status']
     st.dataframe(df_f[[c for c in dc if c in df_f.columns]].sort_values('Return Date',ascending=False).head(100).style.format({'Price':'${:.2f}','Return Value':'${:.2f}'}),use_container_width=True)
-    st.download_button("📥 Download Returns CSV",df_f.to_csv(index=False).encode('utf-8'),"returns.csv","text/csv")
+    export_buttons({"Returns": df_f}, "returns", "returns",
+                   version=(dataset_version("returns", df_ret_raw), tuple(date_range), sel_store))
     insights_returns(df_f, rr)
 
 
+# ---- Treemap reduction ----
+# One treemap node per SKU made the figure JSON megabytes on large catalogs. Each store keeps
+# its most valuable SKUs; the tail becomes a single "Other" node that can be drilled into.
+TREEMAP_TOP_N    = int(os.getenv("TREEMAP_TOP_N", "40"))
+TREEMAP_COVERAGE = float(os.getenv("TREEMAP_COVERAGE", "1.0"))   # < 1.0: stop once a store's value share is reached
+
+
+def treemap_frame(df, top_n=None, coverage=None, skip=0, group='Store Name', label='SKU', value='Stock Value'):
+    """Rows for px.treemap(path=[group, label]): top_n SKUs per store plus one 'Other' row each.
+
+    SKUs ranked below `skip` are dropped (drill-down pages). With coverage < 1 a store stops
+    adding SKUs once they hold that share of its shown value; top_n still caps the count.
+    Columns: group, label, value, 'SKUs' (1, or how many SKUs an Other row rolls up), 'Other'.
+    """
+    top_n    = top_n or TREEMAP_TOP_N
+    coverage = TREEMAP_COVERAGE if coverage is None else coverage
+    cols     = [group, label, value, 'SKUs', 'Other']
+    d = df.loc[df[value] > 0, [c for c in (group, label, value) if c in df.columns]]
+    if group not in d.columns:
+        d = d.assign(**{group: "All"})
+    if d.empty:
+        return pd.DataFrame(columns=cols)
+    d = pd.DataFrame({group: d[group].astype(str).to_numpy(), label: d[label].astype(str).to_numpy(),
+                      value: d[value].astype(float).to_numpy()})
+    d = d.sort_values([group, value], ascending=[True, False], kind='stable', ignore_index=True)
+    g = d.groupby(group, sort=False)[value]
+    rank = g.cumcount().to_numpy()
+    d, rank = d[rank >= skip].reset_index(drop=True), rank[rank >= skip] - skip
+    g = d.groupby(group, sort=False)[value]
+    prev_share = ((g.cumsum() - d[value]) / g.transform('sum')).to_numpy()
+    keep = (rank < top_n) & (prev_share < coverage)
+    shown = d[keep].assign(SKUs=1, Other=False)
+    rest  = d[~keep].groupby(group, sort=False).agg(**{value: (value, 'sum'), 'SKUs': (label, 'size')}).reset_index()
+    rest[label] = [f"Other ({n:,} SKU)" for n in rest['SKUs']]
+    rest['Other'] = True
+    return pd.concat([shown, rest[cols]], ignore_index=True)[cols]
+
+
+def show_value_treemap(df, key="inv_treemap"):
+    """Reduced inventory-value treemap with an on-demand drill into each store's 'Other' node."""
+    c1, c2 = st.columns(2)
+    top_n    = c1.number_input("Top SKU per store", 5, 500, TREEMAP_TOP_N, 5, key=f"{key}_n")
+    coverage = c2.slider("Value coverage %", 50, 100, int(TREEMAP_COVERAGE * 100), 5, key=f"{key}_cov") / 100
+    tm = treemap_frame(df, top_n, coverage)
+    if tm.empty:
+        return
+    fig = px.treemap(tm, path=['Store Name', 'SKU'], values='Stock Value', color='Stock Value',
+                     color_continuous_scale='RdYlGn_r')
+    plotly_chart(fig, use_container_width=True)
+    other = tm[tm['Other']]
+    if other.empty:
+        return
+    st.caption(f"{int(other['SKUs'].sum()):,} SKUs (${other['Stock Value'].sum():,.0f}) grouped into Other")
+    stores = ["—"] + other['Store Name'].tolist()
+    store  = st.selectbox("🔎 Drill into Other:", stores, key=f"{key}_drill")
+    if store == "—":
+        return
+    n_rest = int(other.loc[other['Store Name'] == store, 'SKUs'].iloc[0])
+    skip   = int(tm[(tm['Store Name'] == store) & ~tm['Other']].shape[0])
+    pages  = max(1, -(-n_rest // top_n))
+    page   = st.number_input(f"Page (1–{pages})", 1, pages, 1, key=f"{key}_drill_page_{store}") if pages > 1 else 1
+    sub = treemap_frame(df[df['Store Name'].astype(str) == store] if 'Store Name' in df.columns else df,
+                        top_n, 1.0, skip=skip + (page - 1) * top_n)
+    fig = px.treemap(sub, path=['Store Name', 'SKU'], values='Stock Value', color='Stock Value',
+                     color_continuous_scale='RdYlGn_r')
+    plotly_chart(fig, use_container_width=True)
+
+
 def show_inventory_finance(df_filtered, t):
     tv = df_filtered['Stock Value'].sum(); tu = df_filtered['Available'].sum()
     ap = df_filtered[df_filtered['Price']>0]['Price'].mean()
@@ -1647,16 +2897,68 @@ def show_inventory_finance(df_filtered, t):
     c2.metric(t["avg_price"],f"${ap:,.2f}" if not pd.isna(ap) else "$0")
     c3.metric("💵 Avg Value per Unit",f"${tv/tu:.2f}" if tu>0 else "$0")
     st.markdown("---"); st.subheader(t["chart_value_treemap"])
-    dm = df_filtered[df_filtered['Stock Value']>0]
-    if not dm.empty:
-        fig = px.treemap(dm,path=['Store Name','SKU'],values='Stock Value',color='Stock Value',color_continuous_scale='RdYlGn_r')
-        st.plotly_chart(fig, use_container_width=True)
+    show_value_treemap(df_filtered)
     st.subheader(t["top_money_sku"])
     dt_ = df_filtered[['SKU','Product Name','Available','Price','Stock Value']].sort_values('Stock Value',ascending=False).head(10)
     st.dataframe(dt_.style.format({'Price':"${:.2f}",'Stock Value':"${:,.2f}"}),use_container_width=True)
     insights_inventory(df_filtered)
 
 
+# ---- Velocity vs stock scatter ----
+# One SVG marker per SKU froze the browser on big catalogs. Above SCATTER_GL_ROWS points go to
+# WebGL; above SCATTER_BIN_ROWS the cloud becomes a NumPy 2D histogram and only outliers
+# (sparse bins and the largest stock values) stay as individual hoverable points.
+SCATTER_GL_ROWS  = int(os.getenv("SCATTER_GL_ROWS", "1000"))
+SCATTER_BIN_ROWS = int(os.getenv("SCATTER_BIN_ROWS", "20000"))
+SCATTER_BINS     = int(os.getenv("SCATTER_BINS", "60"))
+SCATTER_OUTLIERS = int(os.getenv("SCATTER_OUTLIERS", "500"))
+SCATTER_SPARSE   = 2   # bins with at most this many points are drawn point by point
+
+
+def bin_points(x, y, bins=None, log_x=False):
+    """2D histogram of (x, y) → (counts[y, x], x edges, y edges, per-point bin count).
+
+    With log_x the x edges are spaced in log10 but returned in data units.
+    """
+    bins = bins or SCATTER_BINS
+    x = np.asarray(x, dtype=float); y = np.asarray(y, dtype=float)
+    xs = np.log10(x) if log_x else x
+    counts, xe, ye = np.histogram2d(xs, y, bins=bins)
+    ix = np.clip(np.searchsorted(xe, xs, side='right') - 1, 0, len(xe) - 2)
+    iy = np.clip(np.searchsorted(ye, y,  side='right') - 1, 0, len(ye) - 2)
+    return counts.T, (10 ** xe if log_x else xe), ye, counts[ix, iy]
+
+
+def velocity_scatter(ds, mode="auto"):
+    """Available × Velocity figure sized by Stock Value: SVG, WebGL or density + outliers.
+
+    mode: 'auto' picks by row count, 'points' always draws every SKU (WebGL when large),
+    'density' always bins.
+    """
+    color = 'Store Name' if 'Store Name' in ds.columns else None
+    n = len(ds)
+    if mode == "points" or (mode == "auto" and n <= SCATTER_BIN_ROWS):
+        return px.scatter(ds, x='Available', y='Velocity', size='Stock Value', color=color, hover_name='SKU',
+                          log_x=True, render_mode='webgl' if n > SCATTER_GL_ROWS else 'svg')
+    counts, xe, ye, per_point = bin_points(ds['Available'], ds['Velocity'], log_x=True)
+    value = ds['Stock Value'].to_numpy(dtype=float)
+    pick  = per_point <= SCATTER_SPARSE
+    if SCATTER_OUTLIERS and n > SCATTER_OUTLIERS:
+        pick |= value >= np.partition(value, n - SCATTER_OUTLIERS)[n - SCATTER_OUTLIERS]
+    out = ds[pick]
+    if len(out) > SCATTER_OUTLIERS:
+        out = out.nlargest(SCATTER_OUTLIERS, 'Stock Value')
+    fig = px.scatter(out, x='Available', y='Velocity', size='Stock Value', color=color, hover_name='SKU',
+                     log_x=True, render_mode='webgl')
+    heat = go.Heatmap(x=xe, y=ye, z=np.where(counts > 0, np.log10(np.maximum(counts, 1)) + 1, np.nan),
+                      customdata=counts, colorscale='Blues', showscale=False, name='SKUs',
+                      hovertemplate='Available %{x:,.0f}<br>Velocity %{y:,.1f}<br>%{customdata:,.0f} SKUs<extra></extra>')
+    fig.add_trace(heat)
+    fig.data = (fig.data[-1],) + fig.data[:-1]
+    fig.update_layout(title=dict(text=f"{n:,} SKUs binned · {len(out):,} outliers shown", font=dict(size=12)))
+    return fig
+
+
 def show_aging(df_filtered, t):
     if df_filtered.empty: st.warning("No data"); return
     age_cols = ['Upto 90 Days','91 to 180 Days','181 to 270 Days','271 to 365 Days','More than 365 Days']
@@ -1670,72 +2972,199 @@ def show_aging(df_filtered, t):
     with col1:
         st.subheader(t["chart_age"])
         fig = px.pie(as_,values='Units',names='Age Group',hole=0.4); fig.update_layout(height=400)
-        st.plotly_chart(fig, use_container_width=True)
+        plotly_chart(fig, use_container_width=True)
     with col2:
         st.subheader(t["chart_velocity"])
         if all(c in df_filtered.columns for c in ['Available','Velocity','Stock Value']):
-            ds = df_filtered[(df_filtered['Available']>0)&(df_filtered['Velocity']>=0)&(df_filtered['Stock Value']>0)].copy()
+            ds = df_filtered[(df_filtered['Available']>0)&(df_filtered['Velocity']>=0)&(df_filtered['Stock Value']>0)]
             if not ds.empty:
-                fig = px.scatter(ds,x='Available',y='Velocity',size='Stock Value',color='Store Name' if 'Store Name' in ds.columns else None,hover_name='SKU',log_x=True)
-                fig.update_layout(height=400); st.plotly_chart(fig, use_container_width=True)
+                mode = st.radio("Mode", ["Auto", "Points", "Density"], horizontal=True, key="aging_scatter_mode",
+                                label_visibility="collapsed")
+                fig = velocity_scatter(ds, mode.lower())
+                fig.update_layout(height=400); plotly_chart(fig, use_container_width=True)
+
+
+# ---- Per-SKU forecast models ----
+# Fits only change when the inventory history does, so models are memoized per (SKU, data version)
+# and the horizon slider just re-evaluates the line. Oldest entries are evicted past FORECAST_CACHE_SIZE.
+FORECAST_CACHE_SIZE = int(os.getenv("FORECAST_CACHE_SIZE", "512"))
+_ORDINAL_EPOCH      = dt.date(1970, 1, 1).toordinal()
+
+
+@st.cache_resource
+def _forecast_model_cache():
+    return {"lock": threading.Lock(), "models": OrderedDict(), "hits": 0, "misses": 0}
+
+
+def inventory_version(df):
+    """Cheap data version of an inventory history frame: row count + newest snapshot."""
+    if df.empty or 'created_at' not in df.columns:
+        return (0, None)
+    return (len(df), df['created_at'].max())
+
+
+def forecast_model(df, sku, version=None, min_points=3):
+    """Fitted Available-vs-date line for one SKU, memoized (LRU) on (sku, data version).
+
+    Returns {'coef', 'intercept', 'last', 'x', 'y'} (x/y = history for plotting) or None when the
+    SKU has fewer than min_points snapshots.
+    """
+    key   = (sku, inventory_version(df) if version is None else version)
+    cache = _forecast_model_cache()
+    with cache["lock"]:
+        if key in cache["models"]:
+            cache["models"].move_to_end(key)
+            cache["hits"] += 1
+            return cache["models"][key]
+    sd = df.loc[df['SKU']==sku, ['created_at','Available']].sort_values('created_at')
+    fm = None
+    if len(sd) >= min_points:
+        ordinal = sd['created_at'].to_numpy().astype('datetime64[D]').astype(np.int64) + _ORDINAL_EPOCH
+        model   = LinearRegression().fit(ordinal.reshape(-1,1), sd['Available'].to_numpy(dtype=np.float64))
+        fm = {'coef': float(model.coef_[0]), 'intercept': float(model.intercept_),
+              'last': sd['created_at'].iloc[-1], 'x': sd['created_at'].to_numpy(), 'y': sd['Available'].to_numpy()}
+    with cache["lock"]:
+        cache["misses"] += 1
+        cache["models"][key] = fm
+        cache["models"].move_to_end(key)
+        while len(cache["models"]) > FORECAST_CACHE_SIZE:
+            cache["models"].popitem(last=False)
+    return fm
+
+
+def forecast_stockouts(history, min_points=3):
+    """Linear Available-vs-date trend for every SKU at once (closed-form least squares).
+
+    Per-SKU sums (n, Σx, Σy, Σx², Σxy, Σy²) come from one groupby, so there is no model fit
+    per SKU. Sold-out uses the single-SKU rule: first day after the last snapshot where the
+    trend drops below 1 unit. Returns one row per SKU with ≥ min_points snapshots.
+    """
+    h = history[['SKU', 'created_at', 'Available']].dropna(subset=['SKU', 'created_at'])
+    if h.empty:
+        return pd.DataFrame()
+    day = h['created_at'].dt.normalize()
+    ref = day.min()
+    x = ((day - ref) / pd.Timedelta(days=1)).to_numpy(dtype=np.float64)
+    y = pd.to_numeric(h['Available'], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+    g = pd.DataFrame({'SKU': h['SKU'].to_numpy(), 'x': x, 'y': y, 'xx': x * x, 'xy': x * y, 'yy': y * y})
+    agg = g.groupby('SKU', observed=True, sort=False).agg(
+        n=('x', 'size'), sx=('x', 'sum'), sy=('y', 'sum'),
+        sxx=('xx', 'sum'), sxy=('xy', 'sum'), syy=('yy', 'sum'), x_last=('x', 'max'))
+    last = h.loc[h.groupby('SKU', observed=True, sort=False)['created_at'].idxmax(), ['SKU', 'Available']]
+    agg = agg[agg['n'] >= min_points].join(last.set_index('SKU'))
+    if agg.empty:
+        return pd.DataFrame()
+
+    n, sx, sy, sxx, sxy, syy = (agg[c].to_numpy(dtype=np.float64) for c in ['n', 'sx', 'sy', 'sxx', 'sxy', 'syy'])
+    denom_x = n * sxx - sx * sx
+    cov     = n * sxy - sx * sy
+    denom_y = n * syy - sy * sy
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope     = np.where(denom_x > 0, cov / denom_x, 0.0)
+        intercept = (sy - slope * sx) / n
+        r2        = np.where((denom_x > 0) & (denom_y > 0), cov * cov / (denom_x * denom_y), np.nan)
+        # first whole day d ≥ 1 after x_last with intercept + slope·(x_last + d) < 1
+        cross = (1 - intercept) / slope - agg['x_last'].to_numpy()
+        days  = np.where(slope < 0, np.maximum(1, np.floor(cross) + 1), np.nan)
+
+    out = pd.DataFrame({
+        'SKU':           agg.index,
+        'Available':     agg['Available'].to_numpy(),
+        'Trend / day':   slope.round(2),
+        'Intercept':     intercept.round(1),
+        'Days of cover': days,
+        'Sold-out date': (ref + pd.to_timedelta(agg['x_last'].to_numpy() + days, unit='D')).date,
+        'Snapshots':     agg['n'].to_numpy(),
+        'R²':            np.round(r2, 2),
+    })
+    return out.sort_values(['Days of cover', 'Trend / day'], na_position='last', ignore_index=True)
+
+
+def show_ai_forecast_portfolio(df, t, forecast_days):
+    st.markdown(f"### {t['ai_risk_title']}")
+    st.caption(t['ai_risk_caption'])
+    fc = forecast_stockouts(df)
+    if fc.empty:
+        st.warning(t["ai_error"]); return
+    at_risk = fc[fc['Days of cover'] <= forecast_days]
+    c1, c2, c3 = st.columns(3)
+    c1.metric("SKU", f"{len(fc):,}")
+    c2.metric(f"⚠️ ≤ {forecast_days} d", f"{len(at_risk):,}")
+    c3.metric("📉 Trend < 0", f"{int((fc['Trend / day'] < 0).sum()):,}")
+    only_risk = st.checkbox(f"⚠️ ≤ {forecast_days} d", value=True, key="ai_only_risk")
+    st.dataframe(
+        at_risk if only_risk else fc,
+        column_config={
+            "Days of cover": st.column_config.NumberColumn(t["ai_result_days"], format="%d"),
+            "Sold-out date": st.column_config.DateColumn(t["ai_result_date"]),
+        },
+        use_container_width=True, hide_index=True, height=500,
+    )
 
 
 def show_ai_forecast(df, t):
+    if df.empty or 'SKU' not in df.columns: st.info("No SKU available"); return
+    mode = st.radio(t["ai_mode"], [t["ai_mode_single"], t["ai_mode_portfolio"]], horizontal=True, key="ai_mode")
+    if mode == t["ai_mode_portfolio"]:
+        forecast_days = st.slider(t["ai_days"],7,90,30, key="ai_days_portfolio")
+        show_ai_forecast_portfolio(df, t, forecast_days); return
     st.markdown("### Select SKU for Forecast")
     skus = sorted(df['SKU'].unique())
     if not skus: st.info("No SKU available"); return
     col1,col2 = st.columns([2,1])
     target_sku    = col1.selectbox(t["ai_select"],skus)
     forecast_days = col2.slider(t["ai_days"],7,90,30)
-    sd = df[df['SKU']==target_sku].copy().sort_values('created_at')
-    sd['date_ordinal'] = sd['created_at'].map(dt.datetime.toordinal)
-    if len(sd)>=3:
-        model = LinearRegression().fit(sd[['date_ordinal']], sd['Available'])
-        last  = sd['created_at'].max()
+    fm = forecast_model(df, target_sku)
+    if fm is not None:
+        last  = fm['last']
         fd    = [last+dt.timedelta(days=x) for x in range(1,forecast_days+1)]
-        fo    = np.array([d.toordinal() for d in fd]).reshape(-1,1)
-        preds = [max(0,int(p)) for p in model.predict(fo)]
+        fo    = last.toordinal() + np.arange(1, forecast_days+1)
+        preds = np.maximum(0, (fm['intercept'] + fm['coef'] * fo).astype(int))
         df_fc = pd.DataFrame({'date':fd,'Predicted':preds})
         so    = df_fc[df_fc['Predicted']==0]
         if not so.empty: st.error(f"{t['ai_result_date']} **{so.iloc[0]['date'].date()}**")
         else:             st.success(t['ai_ok'])
         fig = go.Figure()
-        fig.add_trace(go.Scatter(x=sd['created_at'],y=sd['Available'],name='Historical'))
+        fig.add_trace(go.Scatter(x=fm['x'],y=fm['y'],name='Historical'))
         fig.add_trace(go.Scatter(x=df_fc['date'],y=df_fc['Predicted'],name='Forecast',line=dict(dash='dash',color='red')))
-        st.plotly_chart(fig, use_container_width=True)
+        plotly_chart(fig, use_container_width=True)
     else: st.warning(t["ai_error"])
 
 
 def show_data_table(df_filtered, t, selected_date):
     st.markdown("### 📊 FBA Inventory Dataset")
-    st.download_button("📥 Download CSV",df_filtered.to_csv(index=False).encode('utf-8'),"fba_inventory.csv","text/csv")
-    st.dataframe(df_filtered, use_container_width=True, height=600)
+    if df_filtered.empty: st.info("No data."); return
+    stores  = tuple(sorted(df_filtered['Store Name'].astype(str).unique())) if 'Store Name' in df_filtered.columns else ()
+    version = (dataset_version("inventory", df_filtered), str(selected_date), stores)
+    export_buttons({"FBA Inventory": df_filtered}, "fba_inventory", "fba_inventory", version=version, t=t)
+    paged_table(df_filtered, "inv_table", sort_by='Available', ascending=True, version=version)
 
 
 def show_orders():
     df_orders = load_orders()
     if df_orders.empty: st.warning("⚠️ No orders data."); return
     st.sidebar.markdown("---"); st.sidebar.subheader("🛒 Orders Filters")
-    min_date = df_orders['Order Date'].min().date(); max_date = df_orders['Order Date'].max().date()
+    ix = time_index("orders", df_orders, 'Order Date')
+    min_date, max_date = ix['min'], ix['max']
     date_range = st.sidebar.date_input("📅 Date Range:",value=(max_date-dt.timedelta(days=7),max_date),min_value=min_date,max_value=max_date)
-    df_f = df_orders[(df_orders['Order Date'].dt.date>=date_range[0])&(df_orders['Order Date'].dt.date<=date_range[1])] if len(date_range)==2 else df_orders
+    df_f, day = time_range(ix, date_range)
     c1,c2,c3 = st.columns(3)
     c1.metric("📦 Orders",df_f['Order ID'].nunique()); c2.metric("💰 Revenue",f"${df_f['Total Price'].sum():,.2f}"); c3.metric("📦 Items",int(df_f['Quantity'].sum()))
     st.markdown("#### 📈 Daily Revenue")
-    daily = df_f.groupby(df_f['Order Date'].dt.date)['Total Price'].sum().reset_index()
+    daily = df_f.groupby(day)['Total Price'].sum().reset_index()
     fig = px.bar(daily,x='Order Date',y='Total Price',title="Daily Revenue")
-    st.plotly_chart(fig, use_container_width=True)
+    plotly_chart(fig, use_container_width=True)
     col1,col2 = st.columns(2)
     with col1:
         st.markdown("#### 🏆 Top 10 SKU by Revenue")
         ts = df_f.groupby('SKU')['Total Price'].sum().nlargest(10).reset_index()
         fig2 = px.bar(ts,x='Total Price',y='SKU',orientation='h'); fig2.update_layout(yaxis={'categoryorder':'total ascending'})
-        st.plotly_chart(fig2, use_container_width=True)
+        plotly_chart(fig2, use_container_width=True)
     with col2:
         if 'Order Status' in df_f.columns:
             st.markdown("#### 📊 Order Status")
-            sc = df_f['Order Status'].value_counts().reset_index(); sc.columns=['Status','Count']
-            fig3 = px.pie(sc,values='Count',names='Status',hole=0.4); st.plotly_chart(fig3, use_container_width=True)
+            sc = df_f['Order Status'].value_counts().reset_index(); sc.columns=['Status','Count']; sc = sc[sc['Count']>0]
+            fig3 = px.pie(sc,values='Count',names='Status',hole=0.4); plotly_chart(fig3, use_container_width=True)
     insights_orders(df_f)
 
 
@@ -1743,57 +3172,68 @@ def show_orders():
 # MAIN
 # ============================================
 
-if 'report_choice' not in st.session_state:
-    st.session_state.report_choice = "🏠 Overview"
-
-lang_option = st.sidebar.selectbox("🌍 Language", ["UA 🇺🇦","EN 🇺🇸","RU 🌍"], index=0)
-lang = "UA" if "UA" in lang_option else "EN" if "EN" in lang_option else "RU"
-t    = translations[lang]
-
-if st.sidebar.button(t["update_btn"], use_container_width=True):
-    st.cache_data.clear(); st.rerun()
-
-df = load_data()
-
-if not df.empty:
-    for col in ['Available','Price','Velocity','Stock Value']:
-        if col not in df.columns: df[col] = 0
-        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-    df['Stock Value'] = df['Available'] * df['Price']
-    df['created_at']  = pd.to_datetime(df['created_at'])
-    df['date']        = df['created_at'].dt.date
-    st.sidebar.header(t["sidebar_title"])
-    dates         = sorted(df['date'].unique(), reverse=True)
-    selected_date = st.sidebar.selectbox(t["date_label"], dates) if dates else None
-    stores        = [t["all_stores"]] + list(df['Store Name'].unique()) if 'Store Name' in df.columns else [t["all_stores"]]
-    selected_store = st.sidebar.selectbox(t["store_label"], stores)
-    df_filtered    = df[df['date']==selected_date] if selected_date else df
-    if selected_store != t["all_stores"]:
-        df_filtered = df_filtered[df_filtered['Store Name']==selected_store]
-else:
-    df_filtered = pd.DataFrame(); selected_date = None
-
-st.sidebar.markdown("---")
-st.sidebar.header("📊 Reports")
-report_options = [
-    "🏠 Overview","📈 Sales & Traffic","🏦 Settlements (Payouts)",
-    "💰 Inventory Value (CFO)","🛒 Orders Analytics","📦 Returns Analytics",
-    "⭐ Amazon Reviews","🐢 Inventory Health (Aging)","🧠 AI Forecast","📋 FBA Inventory Table"
-]
-current_index = report_options.index(st.session_state.report_choice) if st.session_state.report_choice in report_options else 0
-report_choice = st.sidebar.radio("Select Report:", report_options, index=current_index)
-st.session_state.report_choice = report_choice
-
-if   report_choice == "🏠 Overview":                show_overview(df_filtered, t, selected_date)
-elif report_choice == "📈 Sales & Traffic":          show_sales_traffic(t)
-elif report_choice == "🏦 Settlements (Payouts)":   show_settlements(t)
-elif report_choice == "💰 Inventory Value (CFO)":   show_inventory_finance(df_filtered, t)
-elif report_choice == "🛒 Orders Analytics":         show_orders()
-elif report_choice == "📦 Returns Analytics":        show_returns()
-elif report_choice == "⭐ Amazon Reviews":           show_reviews(t)
-elif report_choice == "🐢 Inventory Health (Aging)":show_aging(df_filtered, t)
-elif report_choice == "🧠 AI Forecast":              show_ai_forecast(df, t)
-elif report_choice == "📋 FBA Inventory Table":      show_data_table(df_filtered, t, selected_date)
-
-st.sidebar.markdown("---")
-st.sidebar.caption("📦 Amazon FBA BI System v4.0 🌍")
+def main():
+    # finally: st.rerun() and page exceptions still close the perf record
+    perf_run_start()
+    try:
+        show_app()
+    finally:
+        perf_run_end()
+
+
+def show_app():
+    if 'report_choice' not in st.session_state:
+        st.session_state.report_choice = "🏠 Overview"
+
+    lang_option = st.sidebar.selectbox("🌍 Language", ["UA 🇺🇦","EN 🇺🇸","RU 🌍"], index=0)
+    lang = "UA" if "UA" in lang_option else "EN" if "EN" in lang_option else "RU"
+    t    = translations[lang]
+
+    get_change_listener()
+    show_dataset_controls(t)
+
+    dates = load_inventory_dates()
+
+    if dates:
+        st.sidebar.header(t["sidebar_title"])
+        selected_date  = st.sidebar.selectbox(t["date_label"], dates)
+        stores         = [t["all_stores"]] + load_inventory_stores()
+        selected_store = st.sidebar.selectbox(t["store_label"], stores)
+        df_filtered    = load_data(selected_date, None if selected_store == t["all_stores"] else selected_store)
+    else:
+        df_filtered = pd.DataFrame(); selected_date = None
+
+    st.sidebar.markdown("---")
+    st.sidebar.header("📊 Reports")
+    report_options = [
+        "🏠 Overview","📈 Sales & Traffic","🏦 Settlements (Payouts)",
+        "💰 Inventory Value (CFO)","🛒 Orders Analytics","📦 Returns Analytics",
+        "⭐ Amazon Reviews","🐢 Inventory Health (Aging)","🧠 AI Forecast","📋 FBA Inventory Table"
+    ]
+    current_index = report_options.index(st.session_state.report_choice) if st.session_state.report_choice in report_options else 0
+    report_choice = st.sidebar.radio("Select Report:", report_options, index=current_index)
+    st.session_state.report_choice = report_choice
+
+    perf = _perf_run()
+    if perf is not None: perf["page"] = report_choice
+    with perf_section("page"):
+        if   report_choice == "🏠 Overview":                show_overview(df_filtered, t, selected_date)
+        elif report_choice == "📈 Sales & Traffic":          show_sales_traffic(t)
+        elif report_choice == "🏦 Settlements (Payouts)":   show_settlements(t)
+        elif report_choice == "💰 Inventory Value (CFO)":   show_inventory_finance(df_filtered, t)
+        elif report_choice == "🛒 Orders Analytics":         show_orders()
+        elif report_choice == "📦 Returns Analytics":        show_returns()
+        elif report_choice == "⭐ Amazon Reviews":           show_reviews(t)
+        elif report_choice == "🐢 Inventory Health (Aging)":show_aging(df_filtered, t)
+        elif report_choice == "🧠 AI Forecast":              show_ai_forecast(load_inventory_history(), t)
+        elif report_choice == "📋 FBA Inventory Table":      show_data_table(df_filtered, t, selected_date)
+
+    show_pool_stats()
+    show_perf_panel()
+
+    st.sidebar.markdown("---")
+    st.sidebar.caption("📦 Amazon FBA BI System v4.0 🌍")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+-- Push-based refresh for the dashboard (DB_LISTEN=1).
+--
+-- Every INSERT/UPDATE/DELETE/TRUNCATE statement on the tables the dashboard reads sends
+-- pg_notify('fba_data_changed', '<schema>.<table>') when its transaction commits. The dashboard
+-- listener invalidates the matching dataset; identical notifications inside one transaction
+-- are collapsed by Postgres, so a bulk ETL load costs one notification per table.
+--
+-- Idempotent — safe to re-run. Tables that don't exist are skipped.
+--   psql "$DATABASE_URL" -f migrations/notify_data_changed.sql
+-- If you change DB_NOTIFY_CHANNEL, change the channel name below too.
+
+CREATE SCHEMA IF NOT EXISTS spapi;
+
+CREATE OR REPLACE FUNCTION spapi.notify_data_changed() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('fba_data_changed', TG_TABLE_SCHEMA || '.' || TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$;
+
+DO $$
+DECLARE
+    tbl  text;
+    rel  regclass;
+BEGIN
+    SET LOCAL search_path = spapi, public;
+    FOREACH tbl IN ARRAY ARRAY['fba_inventory', 'orders', 'settlements', 'sales_traffic',
+                               'returns', 'amazon_reviews']
+    LOOP
+        rel := to_regclass(tbl);
+        IF rel IS NULL THEN
+            RAISE NOTICE 'notify_data_changed: table % not found, skipped', tbl;
+            CONTINUE;
+        END IF;
+        EXECUTE format('DROP TRIGGER IF EXISTS fba_notify_changed ON %s', rel);
+        EXECUTE format('CREATE TRIGGER fba_notify_changed
+                            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %s
+                            FOR EACH STATEMENT EXECUTE FUNCTION spapi.notify_data_changed()', rel);
+    END LOOP;
+END;
+$$;
+
+-- To remove:
+--   DROP TRIGGER IF EXISTS fba_notify_changed ON spapi.<table>;  -- for each table above
+--   DROP FUNCTION IF EXISTS spapi.notify_data_changed();
@@ -0,0 +1,31 @@
+-- Full-text search over review title + content (reviews page → 🔎 search box).
+--
+-- A GIN expression index on the same tsvector expression the dashboard queries with
+-- (REVIEW_SEARCH_TSV in dashboard.py): title weighted A, content B, 'simple' configuration so
+-- reviews from every marketplace language tokenize the same way. Postgres maintains the index on
+-- every INSERT/UPDATE, so newly loaded reviews are searchable as soon as the ETL commits.
+-- Without this index search still works, but scans the whole table.
+--
+-- Idempotent — safe to re-run.
+--   psql "$DATABASE_URL" -f migrations/review_search.sql
+-- If you change the expression here, change REVIEW_SEARCH_TSV too, or the index won't be used.
+
+DO $$
+DECLARE
+    rel regclass;
+BEGIN
+    SET LOCAL search_path = spapi, public;
+    rel := to_regclass('amazon_reviews');
+    IF rel IS NULL THEN
+        RAISE NOTICE 'review_search: table amazon_reviews not found, skipped';
+        RETURN;
+    END IF;
+    EXECUTE format($i$CREATE INDEX IF NOT EXISTS amazon_reviews_search_idx ON %s USING GIN ((
+                          setweight(to_tsvector('simple'::regconfig, coalesce(title, '')), 'A') ||
+                          setweight(to_tsvector('simple'::regconfig, coalesce(content, '')), 'B')))$i$, rel);
+    EXECUTE format('ANALYZE %s', rel);
+END;
+$$;
+
+-- To remove:
+--   DROP INDEX IF EXISTS spapi.amazon_reviews_search_idx;
@@ -0,0 +1,8 @@
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["SNAPSHOT_DIR"] = ""       # importing dashboard must not touch .snapshots/
+os.environ.setdefault("DATABASE_URL", "")
+logging.getLogger("streamlit").setLevel(logging.ERROR)
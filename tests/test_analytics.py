@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import analytics
+
+
+@pytest.fixture
+def reviews():
+    rng = np.random.default_rng(0)
+    n = 500
+    return pd.DataFrame({
+        "asin":        rng.choice(["A1", "A2", "A3"], n),
+        "domain":      rng.choice(["com", "de"], n),
+        "review_date": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 120, n), unit="D"),
+        "rating":      rng.integers(1, 6, n),
+        "is_verified": rng.random(n) < 0.7,
+    })
+
+
+def test_cube_stats_match_groupby(reviews):
+    stats = analytics.cube_stats(analytics.rating_cube(reviews), "asin").set_index("asin")
+    g = reviews.groupby("asin")
+    assert (stats["Reviews"] == g.size()).all()
+    assert np.allclose(stats["Rating"], g["rating"].mean())
+    assert (stats["Neg"] == g["rating"].apply(lambda r: (r <= 2).sum())).all()
+    assert (stats["Pos"] == g["rating"].apply(lambda r: (r >= 4).sum())).all()
+    assert np.allclose(stats["Verified %"], g["is_verified"].mean() * 100)
+    for k in range(1, 6):
+        assert (stats[f"s{k}"] == g["rating"].apply(lambda r: (r == k).sum())).all()
+
+
+def test_cube_filter_matches_row_filter(reviews):
+    cube = analytics.cube_filter(analytics.rating_cube(reviews), domains=["de"], asins=["A1", "A3"], stars=[1, 5])
+    rows = reviews[reviews["domain"].eq("de") & reviews["asin"].isin(["A1", "A3"]) & reviews["rating"].isin([1, 5])]
+    tot = analytics.cube_totals(cube)
+    assert tot["reviews"] == len(rows)
+    assert tot["avg_rating"] == pytest.approx(rows["rating"].mean())
+    assert tot["stars"] == {k: int((rows["rating"] == k).sum()) for k in range(6)}
+    assert tot["asins"] == rows["asin"].nunique()
+
+
+def test_cube_stats_by_month(reviews):
+    stats = analytics.cube_stats(analytics.rating_cube(reviews), "month")
+    months = reviews["review_date"].dt.to_period("M").dt.to_timestamp()
+    assert stats.set_index("month")["Reviews"].to_dict() == months.value_counts().sort_index().to_dict()
+
+
+def test_reviews_insights_empty_cube(reviews):
+    cube = analytics.cube_filter(analytics.rating_cube(reviews), domains=["fr"])
+    assert analytics.reviews_insights(cube) == []
+
+
+def test_topic_summary_share():
+    topics = pd.DataFrame({
+        "topic_id": [0, 0, 1, 1], "label": ["zip", "zip", "size", "size"], "terms": ["zip"] * 2 + ["size"] * 2,
+        "asin": ["A1", "A2", "A1", "A1"], "domain": ["com"] * 4, "rating": [1, 2, 1, 3], "reviews": [3, 5, 2, 0],
+    })
+    out = analytics.topic_summary(topics, asin="A1")
+    assert out["label"].tolist() == ["zip", "size"]
+    assert out["share"].tolist() == pytest.approx([60.0, 40.0])
+    assert analytics.topic_summary(None).empty
@@ -0,0 +1,37 @@
+import pandas as pd
+import pytest
+
+import dashboard as d
+
+
+def test_parse_product_attributes():
+    s = pd.Series(["Size: M, Color: Red", "color: Blue, Color: Green", None, "no pairs here"], index=[10, 11, 12, 13])
+    out = d.parse_product_attributes(s)
+    assert list(out.index) == [10, 11, 12, 13]
+    assert out.loc[10, "Size"] == "M" and out.loc[10, "Color"] == "Red"
+    assert out.loc[11, "Color"] == "Blue"          # first occurrence of a repeated key wins
+    assert out.loc[[12, 13]].isna().all().all()
+
+
+@pytest.fixture
+def attr_cache(monkeypatch):
+    cache = {"lock": d.threading.Lock(), "versions": d.OrderedDict()}
+    monkeypatch.setattr(d, "_review_attr_cache", lambda: cache)
+    return cache
+
+
+def reviews(version, color):
+    df = pd.DataFrame({"review_id": ["r1", "r2"], "product_attributes": [f"Color: {color}", "Size: L"]})
+    df.attrs["dataset_version"] = version
+    return df
+
+
+def test_review_attributes_keyed_on_data_version(attr_cache):
+    assert d.review_attributes(reviews("v1", "Red")).loc[0, "Color"] == "Red"
+    assert d.review_attributes(reviews("v2", "Blue")).loc[0, "Color"] == "Blue"   # edit after refresh
+    assert d.review_attributes(reviews("v3", "Green")).loc[0, "Color"] == "Green"
+    assert list(attr_cache["versions"]) == ["v2", "v3"]                            # bounded to two versions
+    unversioned = reviews("v3", "Black")
+    unversioned.attrs.clear()
+    assert d.review_attributes(unversioned).loc[0, "Color"] == "Black"
+    assert list(attr_cache["versions"]) == ["v2", "v3"]
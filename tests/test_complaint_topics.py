@@ -0,0 +1,53 @@
+import json
+from collections import Counter
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+import complaint_topics
+
+
+def test_topic_labels_prefer_distinctive_terms():
+    state = complaint_topics.new_state(2)
+    state["terms"] = [Counter({"zipper broke": 8, "zipper": 8, "broke": 8, "great": 5}),
+                      Counter({"runs small": 6, "small": 6, "great": 5, "cheap cheap": 6})]
+    state["docs"] = [10, 10]
+    state["all_terms"] = Counter({"zipper broke": 8, "zipper": 8, "broke": 8, "great": 10,
+                                  "runs small": 6, "small": 6, "cheap cheap": 6})
+    state["reviews"] = 20
+    labels = {i: label for i, label, _ in complaint_topics.topic_labels(state)}
+    assert labels[0] == "zipper broke"                     # phrase beats its own words on a tie
+    assert labels[1] == "runs small"                       # repeated-word bigram skipped
+    assert "great" not in labels[0] + labels[1]            # evenly spread term: no lift
+
+
+def reviews(texts):
+    return pd.DataFrame({"title": [""] * len(texts), "content": texts})
+
+
+def test_batches_split_topics_and_skip_foreign_stop_words():
+    state = complaint_topics.new_state(2)
+    zip_ = ["Der Reißverschluss ist nicht gut, zipper broke"] * 6
+    size = ["La taille est trop petite pour moi, runs small"] * 6
+    topics = complaint_topics.process_batch(state, reviews(zip_ + size))
+    assert len(set(topics[:6])) == 1 and len(set(topics[6:])) == 1 and topics[0] != topics[6]
+    again = complaint_topics.process_batch(state, reviews(["zipper broke again"]))
+    assert again[0] == topics[0] and state["counts"].sum() == 13 and state["reviews"] == 13
+    terms = set(state["all_terms"])
+    assert {"zipper", "runs small"} <= terms and not terms & {"nicht", "ist", "pour", "est"}
+
+
+def test_state_round_trip_without_pickle():
+    state = complaint_topics.new_state(2)
+    complaint_topics.process_batch(state, reviews(["zipper broke"] * 3 + ["runs small"] * 3))
+    saved = {}
+    conn = SimpleNamespace(execute=lambda sql, params: saved.update(params))
+    complaint_topics._save_state(conn, state)
+    row = SimpleNamespace(centers=saved["centers"], counts=saved["counts"], meta=json.loads(saved["meta"]))
+    conn = SimpleNamespace(execute=lambda sql: SimpleNamespace(first=lambda: row))
+    back = complaint_topics._load_state(conn)
+    assert np.array_equal(back["centers"], state["centers"]) and back["centers"].dtype == np.float32
+    assert np.array_equal(back["counts"], state["counts"])
+    assert back["terms"] == state["terms"] and back["all_terms"] == state["all_terms"]
+    assert (back["docs"], back["reviews"], back["features"]) == (state["docs"], 6, complaint_topics.TOPIC_FEATURES)
@@ -0,0 +1,42 @@
+import os
+
+import pandas as pd
+import pytest
+
+import dashboard as d
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    c = {"lock": d.threading.Lock(), "locks": {}, "files": d.OrderedDict()}
+    monkeypatch.setattr(d, "_export_cache", lambda: c)
+    monkeypatch.setattr(d, "EXPORT_DIR", str(tmp_path))
+    return c
+
+
+def frame(n=3):
+    return pd.DataFrame({"SKU": [f"s{i}" for i in range(n)], "Qty": range(n)})
+
+
+def test_same_version_reuses_file(cache):
+    path = d.build_export({"A": frame()}, "csv", "k", version="v1")
+    mtime = os.stat(path).st_mtime_ns
+    assert d.build_export({"A": frame(5)}, "csv", "k", version="v1") == path    # version, not content, decides
+    assert os.stat(path).st_mtime_ns == mtime
+    assert pd.read_csv(path)["SKU"].tolist() == ["s0", "s1", "s2"]
+    assert d.build_export({"A": frame()}, "csv", "k", version="v2") != path
+
+
+def test_eviction_drops_file_and_lock(cache, monkeypatch):
+    monkeypatch.setattr(d, "EXPORT_KEEP", 2)
+    paths = [d.build_export({"A": frame()}, "parquet", "k", version=v) for v in range(3)]
+    assert not os.path.exists(paths[0]) and all(map(os.path.exists, paths[1:]))
+    assert set(cache["locks"]) == set(cache["files"]) and len(cache["locks"]) == 2
+
+
+def test_missing_version_derived_from_content(cache):
+    a = d.build_export({"A": frame()}, "csv", "k")
+    assert d.build_export({"A": frame()}, "csv", "k") == a
+    assert d.build_export({"A": frame(4)}, "csv", "k") != a
+    lists = pd.DataFrame({"tags": [["x"], ["y"]]})                              # unhashable cells
+    assert d.build_export({"A": lists}, "csv", "k") == d.build_export({"A": lists.copy()}, "csv", "k")
@@ -0,0 +1,36 @@
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dashboard as d
+
+
+@pytest.fixture
+def history():
+    days = pd.date_range("2024-01-01", periods=10, freq="D")
+    return pd.DataFrame({
+        "SKU":        ["fall"] * 10 + ["flat"] * 10 + ["short"] * 2,
+        "created_at": list(days) * 2 + list(days[:2]),
+        "Available":  [100 - 10 * i for i in range(10)] + [50] * 10 + [5, 4],
+    })
+
+
+def test_forecast_stockouts(history):
+    out = d.forecast_stockouts(history).set_index("SKU")
+    assert "short" not in out.index                # fewer than min_points snapshots
+    assert out.loc["fall", "Trend / day"] == pytest.approx(-10)
+    assert out.loc["fall", "Days of cover"] == 1   # 10 left, first day below 1 unit
+    assert out.loc["fall", "Sold-out date"] == dt.date(2024, 1, 11)
+    assert np.isnan(out.loc["flat", "Days of cover"])
+
+
+def test_forecast_model_memoized_and_matches_batch(history, monkeypatch):
+    cache = {"lock": d.threading.Lock(), "models": d.OrderedDict(), "hits": 0, "misses": 0}
+    monkeypatch.setattr(d, "_forecast_model_cache", lambda: cache)
+    fm = d.forecast_model(history, "fall", version="v1")
+    assert fm["coef"] == pytest.approx(d.forecast_stockouts(history).set_index("SKU").loc["fall", "Trend / day"])
+    assert d.forecast_model(history, "fall", version="v1") is fm and (cache["hits"], cache["misses"]) == (1, 1)
+    assert d.forecast_model(history, "short", version="v1") is None
+    assert d.forecast_model(history, "fall", version="v2") is not fm
@@ -0,0 +1,54 @@
+import pytest
+
+import dashboard as d
+
+
+class Loader:
+    def __init__(self):
+        self.cleared = 0
+
+    def clear(self):
+        self.cleared += 1
+
+
+@pytest.fixture
+def datasets(monkeypatch):
+    store = {"lock": d.threading.Lock(), "locks": {}, "frames": {"a": {"full_at": 99.0}}, "probes": {}, "warned": set()}
+    monkeypatch.setattr(d, "get_dataset_store", lambda: store)
+    ds = {n: {"table": n, "date_col": "d", "key_cols": (), "loaders": (Loader(), Loader())} for n in "abc"}
+    monkeypatch.setattr(d, "DATASETS", ds)
+    probes = {"a": (1, (1, 1, 0, 0)), "b": (5, (2, 5, 0, 0)), "c": RuntimeError("down")}
+
+    def probe(name):
+        if isinstance(probes[name], Exception):
+            raise probes[name]
+        return probes[name]
+    monkeypatch.setattr(d, "probe_dataset", probe)
+    return store, ds, probes
+
+
+def cleared(ds):
+    return {n: [f.cleared for f in v["loaders"]] for n, v in ds.items()}
+
+
+def test_refresh_invalidates_only_changed(datasets):
+    store, ds, probes = datasets
+    store["probes"].update({"a": (1, (1, 1, 0, 0)), "b": (4, (2, 4, 0, 0))})
+    assert d.refresh_datasets() == {"a": "unchanged", "b": "changed", "c": "probe failed"}
+    assert cleared(ds) == {"a": [0, 0], "b": [1, 1], "c": [1, 1]}
+    assert store["probes"]["b"] == probes["b"] and "c" not in store["probes"]
+    assert store["frames"]["a"]["full_at"] == 99.0
+
+
+def test_forced_refresh_resets_full_read(datasets):
+    store, ds, _ = datasets
+    store["probes"]["a"] = (1, (1, 1, 0, 0))
+    assert d.refresh_datasets(["a"], force=True) == {"a": "changed"}
+    assert cleared(ds)["a"] == [1, 1] and cleared(ds)["b"] == [0, 0]
+    assert store["frames"]["a"]["full_at"] == 0
+
+
+def test_invalidate_dataset_without_entry(datasets):
+    store, ds, _ = datasets
+    d.invalidate_dataset("b", full=True)
+    assert cleared(ds)["b"] == [1, 1] and "b" not in store["frames"]
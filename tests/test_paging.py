@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import dashboard as d
+
+
+@pytest.fixture
+def orders(monkeypatch):
+    cache = {"lock": d.threading.Lock(), "orders": d.OrderedDict()}
+    monkeypatch.setattr(d, "_table_order_cache", lambda: cache)
+    return cache
+
+
+def test_sorted_positions_stable_nan_last(orders):
+    df = pd.DataFrame({"v": [2.0, np.nan, 1.0, 2.0, 0.5]}, index=[10, 11, 12, 13, 14])
+    assert d._sorted_positions(df, "v", True).tolist() == [4, 2, 0, 3, 1]
+    assert d._sorted_positions(df, "v", False).tolist() == [0, 3, 2, 4, 1]
+    mixed = pd.DataFrame({"v": ["b", 3, "a"]})
+    assert d._sorted_positions(mixed, "v", True).tolist() == [1, 2, 0]
+
+
+def test_sorted_positions_memoized_per_version(orders):
+    df = pd.DataFrame({"v": [3, 1, 2]})
+    first = d._sorted_positions(df, "v", True, cache_key=("t", "v1"))
+    assert d._sorted_positions(df.iloc[::-1], "v", True, cache_key=("t", "v1")) is first
+    assert d._sorted_positions(df.iloc[::-1], "v", True, cache_key=("t", "v2")).tolist() == [1, 0, 2]
+
+
+def _app():
+    import pandas as pd
+    import streamlit as st
+    import dashboard as d
+    df = pd.DataFrame({"SKU": [f"sku{i:03d}" for i in range(250)], "Qty": [i % 7 for i in range(250)]})
+    st.session_state["order"] = d.paged_table(df, "t", sort_by="Qty", ascending=False, version="v1", page_size=100)
+
+
+def test_paged_table_sorts_searches_and_pages():
+    at = AppTest.from_function(_app).run()
+    order = at.session_state["order"]
+    qty = [i % 7 for i in range(250)]
+    assert [qty[i] for i in order] == sorted(qty, reverse=True)
+    assert list(order[:3]) == [6, 13, 20]                          # stable within equal keys
+    assert len(at.dataframe[0].value) == 100 and at.number_input[0].max == 3
+    at.text_input[0].set_value("sku24").run()
+    assert sorted(at.session_state["order"]) == list(range(240, 250))
+    assert len(at.dataframe[0].value) == 10 and not at.number_input
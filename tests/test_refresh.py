@@ -0,0 +1,74 @@
+import pandas as pd
+import pytest
+
+import dashboard as d
+
+
+@pytest.fixture
+def store(monkeypatch):
+    s = {"lock": d.threading.Lock(), "locks": {}, "frames": {}, "probes": {}, "warned": set()}
+    monkeypatch.setattr(d, "get_dataset_store", lambda: s)
+    monkeypatch.setattr(d, "REFRESH_MODE", "incremental")
+    monkeypatch.setattr(d, "_typed_date_column", lambda table, column: True)
+    return s
+
+
+def prepare(raw):
+    return raw.assign(review_date=pd.to_datetime(raw["review_date"]))
+
+
+class Source:
+    """fetch(since) over an in-memory table; records every `since` it was asked for."""
+
+    def __init__(self, rows, fail_since=False):
+        self.df, self.calls, self.fail_since = pd.DataFrame(rows), [], fail_since
+
+    def __call__(self, since):
+        self.calls.append(since)
+        if since is None:
+            return self.df.copy()
+        if self.fail_since:
+            raise RuntimeError("operator does not exist: text >= timestamp")
+        return self.df[pd.to_datetime(self.df["review_date"]) >= since].copy()
+
+
+def refresh(src, **kw):
+    return d._refresh_dataset("reviews", src, prepare, "review_date", **kw)
+
+
+def test_incremental_merge_replaces_overlap_and_dedupes_keys(store):
+    src = Source({"review_id": ["a", "b", "c"], "rating": [5, 4, 3],
+                  "review_date": ["2024-01-01", "2024-01-10", "2024-01-20"]})
+    assert len(refresh(src)) == 3 and src.calls == [None]
+    # "c" corrected inside the overlap window, "a" re-dated into it, "d" new
+    src.df = pd.DataFrame({"review_id": ["a", "b", "c", "d"], "rating": [1, 4, 2, 5],
+                           "review_date": ["2024-01-19", "2024-01-10", "2024-01-20", "2024-01-21"]})
+    df = refresh(src).set_index("review_id")
+    assert src.calls[-1] == pd.Timestamp("2024-01-20") - pd.Timedelta(days=d.REFRESH_OVERLAP_DAYS)
+    assert sorted(df.index) == ["a", "b", "c", "d"]                  # key_cols from DATASETS
+    assert df.loc["a", "rating"] == 1 and df.loc["c", "rating"] == 2
+    assert store["frames"]["reviews"]["watermark"] == pd.Timestamp("2024-01-21")
+
+
+def test_failed_incremental_falls_back_then_retries(store, monkeypatch):
+    src = Source({"review_id": ["a"], "review_date": ["2024-01-01"]}, fail_since=True)
+    refresh(src)
+    refresh(src)
+    assert src.calls == [None, src.calls[1], None]                   # failed since → same-call full read
+    retry_at = store["frames"]["reviews"]["incremental_after"]
+    refresh(src)
+    assert src.calls[-1] is None and len(src.calls) == 4             # no incremental attempt before retry_at
+    src.fail_since = False
+    monkeypatch.setattr(d.time, "time", lambda: retry_at + 1)
+    monkeypatch.setattr(d, "REFRESH_FULL_HOURS", 1e9)
+    refresh(src)
+    assert src.calls[-1] is not None                                 # incremental again after the back-off
+
+
+def test_untyped_date_column_reads_full(store, monkeypatch, caplog):
+    monkeypatch.setattr(d, "_typed_date_column", lambda table, column: False)
+    src = Source({"review_id": ["a"], "review_date": ["2024-01-01"]})
+    for _ in range(3):
+        refresh(src)
+    assert src.calls == [None] * 3
+    assert sum("not a date/timestamp" in r.getMessage() for r in caplog.records) == 1
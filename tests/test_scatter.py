@@ -0,0 +1,12 @@
+import numpy as np
+import pytest
+
+import dashboard as d
+
+
+def test_bin_points_counts():
+    x = np.array([1, 1, 10, 100, 100, 100]); y = np.array([0, 0, 5, 9, 9, 9])
+    counts, xe, ye, per_point = d.bin_points(x, y, bins=3, log_x=True)
+    assert counts.sum() == len(x)
+    assert xe[0] == pytest.approx(1) and xe[-1] == pytest.approx(100)
+    assert per_point.tolist() == [2, 2, 1, 3, 3, 3]
@@ -0,0 +1,53 @@
+import os
+
+import pandas as pd
+import pytest
+
+import dashboard as d
+
+
+@pytest.fixture
+def snapdir(tmp_path, monkeypatch):
+    monkeypatch.setattr(d, "SNAPSHOT_DIR", str(tmp_path))
+    return tmp_path
+
+
+def entry():
+    df = pd.DataFrame({"review_id": ["a", "b"], "review_date": pd.to_datetime(["2024-01-01", "2024-01-05"])})
+    return {"df": df, "watermark": df["review_date"].max(), "full_at": 123.0}
+
+
+def test_snapshot_round_trip(snapdir):
+    d._save_snapshot("reviews", entry())
+    assert os.listdir(snapdir) == ["reviews.parquet"]                 # tmp file renamed away
+    got = d._load_snapshot("reviews")
+    pd.testing.assert_frame_equal(got["df"], entry()["df"])
+    assert got["watermark"] == pd.Timestamp("2024-01-05") and got["full_at"] == 123.0
+    assert got["df"].attrs["dataset_version"] == got["version"]
+
+
+def test_stale_snapshot_discarded(snapdir, monkeypatch):
+    d._save_snapshot("reviews", entry())
+    monkeypatch.setattr(d, "SNAPSHOT_VERSION", d.SNAPSHOT_VERSION + 1)
+    assert d._load_snapshot("reviews") is None
+    assert not os.listdir(snapdir)
+
+
+def test_reconcile_invalidates_cached_snapshot_frame(snapdir, monkeypatch):
+    d._save_snapshot("reviews", entry())
+    store = {"lock": d.threading.Lock(), "locks": {}, "frames": {}, "probes": {}, "warned": set()}
+    monkeypatch.setattr(d, "get_dataset_store", lambda: store)
+    monkeypatch.setattr(d, "_typed_date_column", lambda table, column: True)
+    invalidated = []
+    monkeypatch.setattr(d, "invalidate_dataset", lambda name, full=False: invalidated.append(name))
+    threads = []
+    monkeypatch.setattr(d.threading, "Thread", lambda target, args, **kw: threads.append((target, args)) or
+                        type("T", (), {"start": lambda self: None})())
+    fresh = entry()["df"]
+    df = d._refresh_dataset("reviews", lambda since: fresh, lambda raw: raw, "review_date")
+    assert store["frames"]["reviews"].get("snapshot") and len(df) == 2
+    target, args = threads[0]
+    assert target is d._reconcile_snapshot
+    target(*args)
+    assert invalidated == ["reviews"]
+    assert not store["frames"]["reviews"].get("snapshot")
@@ -0,0 +1,16 @@
+import datetime as dt
+
+import pandas as pd
+
+import dashboard as d
+
+
+def test_time_slice_inclusive_and_nat_last():
+    df = pd.DataFrame({"t": pd.to_datetime(["2024-01-03 10:00", None, "2024-01-01 00:00", "2024-01-02 23:59"]),
+                       "v": [3, 0, 1, 2]})
+    ix = d.time_index("test_slice", df, "t", version="v1")
+    rows, day = d.time_slice(ix, dt.date(2024, 1, 2), dt.date(2024, 1, 3))
+    assert rows["v"].tolist() == [2, 3]
+    assert day.tolist() == [pd.Timestamp("2024-01-02"), pd.Timestamp("2024-01-03")]
+    assert d.time_slice(ix)[0]["v"].tolist() == [1, 2, 3]
+    assert len(d.time_range(ix, (dt.date(2024, 1, 1),))[0]) == 3
@@ -0,0 +1,16 @@
+import pandas as pd
+
+import dashboard as d
+
+
+def test_treemap_frame_top_n_and_other():
+    df = pd.DataFrame({"Store Name": ["S1"] * 5 + ["S2"] * 2,
+                       "SKU": list("abcde") + ["x", "y"],
+                       "Stock Value": [50, 40, 30, 20, 0, 7, 3]})
+    out = d.treemap_frame(df, top_n=2, coverage=1.0)
+    s1 = out[out["Store Name"] == "S1"]
+    assert s1.loc[~s1["Other"], "SKU"].tolist() == ["a", "b"]
+    other = s1[s1["Other"]].iloc[0]
+    assert other["Stock Value"] == 50 and other["SKUs"] == 2      # zero-value SKUs are dropped
+    assert out.groupby("Store Name")["Stock Value"].sum().to_dict() == {"S1": 140, "S2": 10}
+    assert d.treemap_frame(df, top_n=2, coverage=1.0, skip=2).query("~Other")["SKU"].tolist() == ["c", "d"]